@@ -0,0 +1,179 @@
+"""Columnar, typed storage for SQL tables.
+
+INT and FLOAT columns are kept in array.array buffers. TEXT and TIMESTAMP
+columns are dictionary-encoded: each distinct value is stored once and the
+column holds integer codes. When NumPy is installed, scans run over
+zero-copy views of the same buffers.
+"""
+import array
+
+import query
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; fall back to plain Python scans
+    np = None
+
+
+TYPECODES = {"INT": "q", "FLOAT": "d"}
+CODE_TYPECODE = "i"
+NUMPY_DTYPES = {"q": "longlong", "d": "double", "i": "intc"}
+
+
+def _mask(view, operator, operands):
+    """Return a NumPy boolean mask for `view operator operands` over a numeric column."""
+    if operator == "between":
+        return (view >= operands[0]) & (view <= operands[1])
+    if operator == "in":
+        return np.isin(view, list(operands))
+    if operator == "is null":
+        return np.zeros(len(view), dtype=bool)  # Numeric columns cannot hold NULL
+    if operator == "like":
+        matches = query.value_predicate(operator, operands)
+        return np.fromiter((matches(x) for x in view.tolist()), dtype=bool, count=len(view))
+    value = operands[0]
+    return {
+        "=": lambda: view == value,
+        "!=": lambda: view != value,
+        "<": lambda: view < value,
+        "<=": lambda: view <= value,
+        ">": lambda: view > value,
+        ">=": lambda: view >= value,
+    }[operator]()
+
+
+class ColumnStore:
+    """Rows of one SQL table stored column by column."""
+
+    def __init__(self, types, rows=()):
+        self.types = list(types)
+        self.columns = [array.array(TYPECODES.get(t, CODE_TYPECODE)) for t in self.types]
+        self.dictionaries = [None if t in TYPECODES else [] for t in self.types]
+        self.codes = [None if t in TYPECODES else {} for t in self.types]
+        self.extend(rows)
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def __getitem__(self, i):
+        return [self.get(i, c) for c in range(len(self.columns))]
+
+    def __iter__(self):
+        decoded = [self._decoded(c) for c in range(len(self.columns))]
+        return (list(row) for row in zip(*decoded))
+
+    def _decoded(self, c):
+        column, dictionary = self.columns[c], self.dictionaries[c]
+        return column if dictionary is None else map(dictionary.__getitem__, column)
+
+    def _encode(self, c, value):
+        code = self.codes[c].get(value)
+        if code is None:
+            code = self.codes[c][value] = len(self.dictionaries[c])
+            self.dictionaries[c].append(value)
+        return code
+
+    def get(self, i, c):
+        """Return the value in row i, column c."""
+        dictionary = self.dictionaries[c]
+        value = self.columns[c][i]
+        return value if dictionary is None else dictionary[value]
+
+    def set_value(self, i, c, value):
+        """Overwrite the value in row i, column c."""
+        self.columns[c][i] = value if self.dictionaries[c] is None else self._encode(c, value)
+
+    def extend(self, rows):
+        """Append rows; raises OverflowError or TypeError without storing anything."""
+        rows = list(rows)
+        if not rows:
+            return
+        chunks = []
+        for c, column in enumerate(self.columns):
+            if self.dictionaries[c] is None:
+                chunks.append(array.array(column.typecode, (row[c] for row in rows)))
+            else:
+                chunks.append([row[c] for row in rows])
+        for c, chunk in enumerate(chunks):
+            if self.dictionaries[c] is None:
+                self.columns[c].extend(chunk)
+            else:
+                self.columns[c].extend(self._encode(c, value) for value in chunk)
+
+    def delete(self, positions):
+        """Remove the rows at the given positions."""
+        positions = set(positions)
+        for c, column in enumerate(self.columns):
+            if np is not None and len(column):
+                keep = np.ones(len(column), dtype=bool)
+                keep[list(positions)] = False
+                kept = self.view(c)[keep]
+                self.columns[c] = array.array(column.typecode)
+                self.columns[c].frombytes(kept.tobytes())
+            else:
+                self.columns[c] = array.array(column.typecode, (v for i, v in enumerate(column) if i not in positions))
+
+    def clear(self):
+        """Remove every row and reset the dictionaries."""
+        self.__init__(self.types)
+
+    def view(self, c):
+        """Return a zero-copy NumPy view of a column buffer (NumPy must be installed)."""
+        column = self.columns[c]
+        return np.frombuffer(column, dtype=NUMPY_DTYPES[column.typecode]) if len(column) else np.empty(0)
+
+    def values(self, c, positions=None):
+        """Return the decoded values of a column, optionally limited to some row positions."""
+        column, dictionary = self.columns[c], self.dictionaries[c]
+        if positions is not None:
+            column = [column[i] for i in positions]
+        return list(column) if dictionary is None else [dictionary[code] for code in column]
+
+    def aggregate(self, c, function, positions=None):
+        """Compute COUNT, SUM, AVG, MIN or MAX over a column, optionally limited to some row positions."""
+        count = len(self) if positions is None else len(positions)
+        if function == "COUNT":
+            return count
+        if not count:
+            return None
+
+        if self.dictionaries[c] is None:
+            if np is not None:
+                view = self.view(c) if positions is None else self.view(c)[positions]
+                return {"SUM": view.sum, "AVG": view.mean, "MIN": view.min, "MAX": view.max}[function]().item()
+            values = self.columns[c] if positions is None else [self.columns[c][i] for i in positions]
+        else:
+            values = self.values(c, positions)
+
+        if function == "SUM":
+            return sum(values)
+        if function == "AVG":
+            return sum(values) / count
+        return min(values) if function == "MIN" else max(values)
+
+    def mask(self, c, operator, operands):
+        """Return a NumPy boolean mask of the rows where column c matches the predicate (NumPy must be installed)."""
+        dictionary = self.dictionaries[c]
+        if dictionary is None:
+            return _mask(self.view(c), operator, operands)
+
+        # Evaluate the predicate once per distinct value, then scan the codes
+        matches = query.value_predicate(operator, operands)
+        wanted = [code for code, value in enumerate(dictionary) if matches(value)]
+        return np.isin(self.view(c), wanted) if wanted else np.zeros(len(self), dtype=bool)
+
+    def positions(self, c, operator, operands):
+        """Return the ascending positions of rows where column c matches the predicate."""
+        if np is not None:
+            return np.flatnonzero(self.mask(c, operator, operands)).tolist()
+
+        matches = query.value_predicate(operator, operands)
+        dictionary = self.dictionaries[c]
+        if dictionary is not None:
+            wanted = {code for code, value in enumerate(dictionary) if matches(value)}
+            return [i for i, code in enumerate(self.columns[c]) if code in wanted]
+        return [i for i, value in enumerate(self.columns[c]) if matches(value)]
+
+    def to_rows(self):
+        """Return the table as a list of row lists."""
+        return list(self)
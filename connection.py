@@ -0,0 +1,309 @@
+"""Connections to the SQL and NoSQL engines and the cache of open databases.
+
+An engine works on one current database at a time. Databases used earlier
+are parked in a DatabaseCache instead of being dropped, so switching back to
+one (with USE, or through a Connection that uses it) only swaps it back in
+rather than reading and parsing its file again.
+
+Connections may be used from several threads. Each engine has a
+readers-writer lock: statements that only read (READ_ACTIONS) run in
+parallel, anything that changes a database or switches the engine to
+another one runs alone. A connection that opens a transaction keeps the
+write lock until it commits or rolls back, so other connections never see
+its uncommitted changes nor get their own writes queued into it.
+"""
+import os
+import threading
+import functools
+from collections import OrderedDict
+
+import wal
+import cursor
+
+
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+MEMORY_FACTOR = 4  # Rough ratio between the memory a loaded database takes and the size of its files
+READ_ACTIONS = ["select", "show", "count", "export"]  # Commands that leave the database unchanged
+
+_engine_locks = {}  # engine module name -> RWLock
+_engine_locks_guard = threading.Lock()
+
+
+def estimate_size(db_path):
+    """Estimate the memory a loaded database takes from the size of its file and its log."""
+    size = 0
+    for path in (db_path, wal.wal_path(db_path)):
+        if os.path.exists(path):
+            size += os.path.getsize(path)
+    return size * MEMORY_FACTOR
+
+
+class DatabaseCache:
+    """An LRU of parked databases (db path -> engine state) bounded by their estimated memory.
+
+    ``close`` is called with the state of every database evicted to keep the
+    total under ``max_bytes``; states for which ``pinned`` returns True (with
+    an open transaction, say) are never evicted.
+    """
+
+    def __init__(self, close, pinned=lambda state: False, max_bytes=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._close = close
+        self._pinned = pinned
+        self._entries = OrderedDict()  # db path -> (state, estimated size), least recently used first
+
+    def __contains__(self, db_path):
+        return db_path in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def park(self, db_path, state):
+        """Keep the state of a database that stops being the current one, evicting older ones if needed."""
+        size = estimate_size(db_path)
+        self._entries[db_path] = (state, size)
+        self.size += size
+        for parked_path in list(self._entries):
+            if self.size <= self.max_bytes:
+                break
+            parked_state, parked_size = self._entries[parked_path]
+            if not self._pinned(parked_state):
+                del self._entries[parked_path]
+                self.size -= parked_size
+                self._close(parked_state)
+
+    def take(self, db_path):
+        """Remove and return the parked state of a database, or None if it is not cached."""
+        entry = self._entries.pop(db_path, None)
+        if entry is None:
+            return None
+        self.size -= entry[1]
+        return entry[0]
+
+    def discard(self, db_path):
+        """Drop a database from the cache, closing it (e.g. before its file is removed)."""
+        state = self.take(db_path)
+        if state is not None:
+            self._close(state)
+
+
+class RWLock:
+    """A readers-writer lock: any number of readers or a single writer.
+
+    Waiting writers go first, so a stream of readers cannot starve them.
+    Read locks are counted per owner (a Connection), not per thread: an
+    owner that already holds one is granted further ones at once, so a
+    cursor left open does not deadlock its connection's next read, and a
+    lock may be released from whichever worker thread closes the cursor.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+        self._holders = {}  # owner -> read locks it holds
+
+    def held_reads(self, owner):
+        """Return the number of read locks held by an owner."""
+        with self._condition:
+            return self._holders.get(owner, 0)
+
+    def acquire_read(self, owner):
+        with self._condition:
+            while not self._holders.get(owner) and (self._writing or self._waiting_writers):
+                self._condition.wait()
+            self._readers += 1
+            self._holders[owner] = self._holders.get(owner, 0) + 1
+
+    def release_read(self, owner):
+        with self._condition:
+            self._readers -= 1
+            held = self._holders.pop(owner, 1) - 1
+            if held:
+                self._holders[owner] = held
+            if not self._readers:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writing = True
+
+    def release_write(self):
+        with self._condition:
+            self._writing = False
+            self._condition.notify_all()
+
+
+def engine_lock(engine):
+    """Return the readers-writer lock guarding an engine module's state."""
+    with _engine_locks_guard:
+        return _engine_locks.setdefault(engine.__name__, RWLock())
+
+
+def is_read_only(command):
+    """Return True if a command only reads the current database."""
+    tokens = command.strip().split(None, 1)
+    return bool(tokens) and tokens[0].lower().rstrip(";") in READ_ACTIONS
+
+
+class Connection:
+    """A session on an engine module (``sql`` or ``nosql``) with its own current database.
+
+    Commands run against the database this connection last selected with
+    USE, whichever databases other connections selected in the meantime.
+    A cursor from execute() holds a read lock on the engine until it is
+    exhausted or closed, which writers wait for; use it as a context
+    manager, or fetch everything, before changing the database.
+
+    Between BEGIN and COMMIT or ROLLBACK the connection holds the engine's
+    write lock: commands of other connections wait until the transaction
+    ends, so keep transactions short.
+    """
+
+    def __init__(self, engine, db_name=None):
+        self.engine = engine
+        self.lock = engine_lock(engine)
+        self.database = None  # File path of the selected database
+        self.transaction = False  # True while a transaction of this connection holds the write lock
+        if db_name is not None:
+            self.process_command(f"USE {db_name}")
+
+    def process_command(self, command):
+        """Run a console command on this connection's database and return its text output."""
+        if is_read_only(command) and not self.transaction:
+            try:
+                self.acquire_read()
+            except ValueError as e:
+                return str(e)
+            try:
+                return self.engine.process_command(command)
+            finally:
+                self.lock.release_read(self)
+
+        try:
+            self.acquire_write()
+        except ValueError as e:
+            return str(e)
+        try:
+            self.activate()
+            return self.engine.process_command(command)
+        finally:
+            self.release_write()
+
+    def execute(self, statement, params=()):
+        """Run a statement on this connection's database and return a cursor.Cursor. Raises ValueError.
+
+        The cursor of a read-only statement keeps a read lock until it is
+        closed, unless it runs inside this connection's transaction.
+        """
+        if is_read_only(statement) and not self.transaction:
+            self.acquire_read()
+            try:
+                result = self.engine.execute(statement, params)
+            except BaseException:
+                self.lock.release_read(self)
+                raise
+            release = functools.partial(self.lock.release_read, self)
+            return cursor.Cursor(result.columns, result, result.message, on_close=release)
+
+        self.acquire_write()
+        try:
+            self.activate()
+            return self.engine.execute(statement, params)
+        finally:
+            self.release_write()
+
+    def execute_batch(self, statements, transaction=False):
+        """Run (statement, params) pairs under one write lock and return a result dict per statement.
+
+        A result holds "columns" and "rows" for a result set, "message" for
+        other statements, or "error" for a statement the engine rejected.
+        With ``transaction`` the batch runs as one transaction whose changes
+        are written with a single log append; a statement that fails rolls the
+        whole batch back and the rest are skipped.
+        """
+        self.acquire_write()
+        try:
+            self.activate()
+            if transaction:
+                if self.engine.current_db is None:
+                    raise ValueError("No database selected. Use 'USE database_name' first.")
+                if self.engine.in_transaction():
+                    raise ValueError("A transaction is already open.")
+                self.engine.begin_transaction()
+
+            results, failed = [], False
+            try:
+                for statement, params in statements:
+                    try:
+                        result = self.engine.execute(statement, params)
+                        if result.message is not None:
+                            results.append({"message": result.message})
+                        else:
+                            results.append({"columns": result.columns, "rows": result.fetchall()})
+                    except ValueError as e:
+                        results.append({"error": str(e)})
+                        failed = True
+                        if transaction:
+                            break
+            except BaseException:
+                if transaction:
+                    self.engine.rollback_transaction()
+                raise
+
+            if transaction:
+                if failed:
+                    self.engine.rollback_transaction()
+                else:
+                    self.engine.commit_transaction()
+            return results
+        finally:
+            self.release_write()
+
+    def acquire_read(self):
+        """Take a read lock on the engine with this connection's database current; raises ValueError."""
+        while True:
+            self.lock.acquire_read(self)
+            if self.engine.current_db_file == self.database:
+                return
+            self.lock.release_read(self)
+            # Switching the engine to this connection's database changes its state: that needs the write lock
+            self.acquire_write()
+            try:
+                self.activate()
+            finally:
+                self.lock.release_write()
+
+    def acquire_write(self):
+        """Take the write lock on the engine; raises ValueError if this connection's cursors hold read locks.
+
+        Does nothing while this connection's transaction already holds it.
+        """
+        if self.transaction:
+            return
+        if self.lock.held_reads(self):
+            raise ValueError("Close open cursors before running a command that changes the database.")
+        self.lock.acquire_write()
+
+    def release_write(self):
+        """Release the write lock after a command, keeping it if the command left a transaction open."""
+        self.database = self.engine.current_db_file
+        self.transaction = self.database is not None and self.engine.in_transaction()
+        if not self.transaction:
+            self.lock.release_write()
+
+    def activate(self):
+        """Make this connection's database the engine's current one. Callers hold the write lock."""
+        if self.database is not None and not os.path.exists(self.database):
+            self.database = None  # Removed through another connection
+        if self.engine.current_db_file != self.database:
+            if self.database is None:
+                self.engine.park_db()
+            else:
+                self.engine.open_db(self.database)
@@ -0,0 +1,84 @@
+"""Cursors over statement results.
+
+A cursor pulls rows from the engine lazily and hands them out as Python
+values (tuples for SQL rows, dicts for NoSQL records), one at a time or in
+batches. Nothing is formatted as text; rendering results for people is left
+to the console.
+"""
+import itertools
+
+
+BATCH_SIZE = 1000
+
+
+class Cursor:
+    """The result of one statement.
+
+    ``columns`` lists the column names of a SQL result set and is None for
+    NoSQL records and for statements without a result set. ``message`` holds
+    the output of statements that do not return rows (UPDATE, MAKE, ...).
+    Rows are produced only as they are fetched, so a cursor that is closed
+    or abandoned early never computes the rest of the result.
+
+    ``on_close`` is called once, when the rows run out or the cursor is
+    closed; connections use it to release the read lock a cursor holds.
+    """
+
+    def __init__(self, columns, rows=(), message=None, on_close=None):
+        self.columns = columns
+        self.message = message
+        self.arraysize = BATCH_SIZE
+        self._rows = iter(rows)
+        self._on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._rows)
+        except StopIteration:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def fetchone(self):
+        """Return the next row, or None when the result is exhausted."""
+        return next(self, None)
+
+    def fetchmany(self, size=None):
+        """Return a list of up to ``size`` (default ``arraysize``) further rows; empty when exhausted."""
+        size = size or self.arraysize
+        rows = list(itertools.islice(self._rows, size))
+        if len(rows) < size:
+            self.close()
+        return rows
+
+    def fetchall(self):
+        """Return all remaining rows as a list."""
+        rows = list(self._rows)
+        self.close()
+        return rows
+
+    def batches(self, size=None):
+        """Yield the remaining rows as lists of up to ``size`` (default ``arraysize``) rows."""
+        while True:
+            batch = self.fetchmany(size)
+            if not batch:
+                return
+            yield batch
+
+    def close(self):
+        """Discard the rows that have not been fetched yet."""
+        self._rows = iter(())
+        on_close, self._on_close = self._on_close, None
+        if on_close is not None:
+            on_close()
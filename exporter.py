@@ -0,0 +1,149 @@
+"""Streaming export of tables and query results.
+
+Rows are written CHUNK_ROWS at a time, so memory use does not grow with the
+size of the export. Output is compact (never pretty-printed) and can be
+gzip-compressed on the fly.
+"""
+import os
+import re
+import csv
+import gzip
+import json
+import itertools
+
+
+FORMATS = ["CSV", "JSONL"]
+COMPRESSIONS = ["GZIP"]
+CHUNK_ROWS = 10000
+
+# EXPORT TABLE name | DATABASE | SELECT ... TO path [FORMAT CSV|JSONL] [COMPRESS GZIP]
+COMMAND_PATTERN = re.compile(
+    r"""export\s+(?:table\s+(?P<table>\w+)|(?P<database>database)|(?P<select>select\s.+?))"""
+    r"""\s+to\s+(?P<path>"[^"]*"|'[^']*'|\S+)(?:\s+format\s+(?P<format>\w+))?(?:\s+compress\s+(?P<compress>\w+))?\s*;?""",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def chunks(rows, size=CHUNK_ROWS):
+    """Yield successive lists of at most ``size`` rows from any iterable."""
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def resolve_format(path, file_format=None):
+    """Return the export format, inferring it from the file extension when not given."""
+    if file_format:
+        return file_format.upper()
+    base = path[:-3] if path.lower().endswith(".gz") else path
+    return os.path.splitext(base)[1].lstrip(".").upper()
+
+
+def parse_command(command):
+    """Parse an EXPORT command into (kind, source, path, file format, compress).
+
+    ``kind`` is "table", "database" or "select" and ``source`` the table name
+    or SELECT statement. Returns None on a syntax error and raises ValueError
+    for an unsupported format or compression.
+    """
+    match = COMMAND_PATTERN.fullmatch(command.strip())
+    if not match:
+        return None
+
+    path = match.group("path").strip("'\"")
+    if match.group("table"):
+        kind, source = "table", match.group("table")
+    elif match.group("database"):
+        kind, source = "database", None
+    else:
+        kind, source = "select", match.group("select")
+
+    if kind == "database":
+        file_format = (match.group("format") or "JSONL").upper()
+    else:
+        file_format = resolve_format(path, match.group("format"))
+    if file_format not in FORMATS:
+        raise ValueError("Unsupported file format. Use CSV or JSONL.")
+
+    compression = match.group("compress")
+    if compression is not None and compression.upper() not in COMPRESSIONS:
+        raise ValueError("Unsupported compression. Use GZIP.")
+    return kind, source, path, file_format, compression is not None
+
+
+def table_path(directory, table_name, file_format, compress=False):
+    """Return the file a table is written to when a whole database is exported to a directory."""
+    return os.path.join(directory, f"{table_name}.{file_format.lower()}" + (".gz" if compress else ""))
+
+
+def open_output(path, compress=False):
+    """Open an export file for writing text, gzip-compressed if asked to or if the path ends in .gz."""
+    if compress or path.lower().endswith(".gz"):
+        return gzip.open(path, "wt", encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def export_rows(path, file_format, columns, rows, compress=False):
+    """Write rows (sequences in ``columns`` order) as CSV or JSONL and return the number written.
+
+    JSONL lines are objects keyed by column name.
+    """
+    count = 0
+    with open_output(path, compress) as f:
+        if file_format == "CSV":
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for chunk in chunks(rows):
+                writer.writerows(chunk)
+                count += len(chunk)
+        else:
+            for chunk in chunks(rows):
+                f.write("".join(
+                    json.dumps(dict(zip(columns, row)), separators=(",", ":")) + "\n"
+                    for row in chunk
+                ))
+                count += len(chunk)
+    return count
+
+
+def export_records(path, file_format, records, compress=False):
+    """Write schemaless records (dicts) as CSV or JSONL and return the number written.
+
+    For CSV the header is the union of all fields, which takes one extra pass
+    over ``records``; nested values are written as JSON.
+    """
+    if file_format != "CSV":
+        count = 0
+        with open_output(path, compress) as f:
+            for chunk in chunks(records):
+                f.write("".join(json.dumps(record, separators=(",", ":")) + "\n" for record in chunk))
+                count += len(chunk)
+        return count
+
+    fields = list(dict.fromkeys(field for record in records for field in record))
+
+    def cell(value):
+        return json.dumps(value, separators=(",", ":")) if isinstance(value, (dict, list)) else value
+
+    rows = ([cell(record.get(field)) for field in fields] for record in records)
+    return export_rows(path, file_format, fields, rows, compress)
+
+
+def export_database_json(path, tables):
+    """Write a whole database as one compact JSON object, streaming each table's rows.
+
+    ``tables`` maps each table name to ``(table_meta, rows)``; the table is
+    written as its metadata plus a "data" list, like the JSON database files.
+    """
+    with open_output(path) as f:
+        f.write("{")
+        for n, (table_name, (table_meta, rows)) in enumerate(tables.items()):
+            meta = json.dumps(table_meta, separators=(",", ":"))
+            f.write(("," if n else "") + json.dumps(table_name) + ":" + meta[:-1] + ("," if table_meta else "") + '"data":[')
+            for c, chunk in enumerate(chunks(rows)):
+                f.write(("," if c else "") + ",".join(json.dumps(row, separators=(",", ":")) for row in chunk))
+            f.write("]}")
+        f.write("}")
@@ -1,5 +1,6 @@
 import os
 import json
+import math
 import shutil
 import re
 import tkinter as tk
@@ -7,45 +8,848 @@ from tkinter import filedialog
 import csv
 import shlex
 import platform
+import bisect
+import heapq
+import itertools
+from collections import namedtuple
+
+import wal
+import pagefile
+import exporter
+import query
+import cursor
+import connection
 
 current_db = None
 current_db_file = None
-_id_counter = {}
+_id_counter = {}  # table -> last id handed out (persisted)
+# "wal" appends each change to <db>.wal and checkpoints in the background;
+# "snapshot" rewrites the whole <db>.json after every change.
+STORAGE_MODE = "wal"
+_wal_lsn = 0
+_pagefile = None  # Open PagedFile when the current database uses the binary format
+_index_fields = {}  # table -> indexed field names (persisted)
+_indexes = {}  # table -> field -> value -> ascending record positions
+_tombstones = {}  # table -> deleted records still holding their slot (persisted), see tombstone_count()
+_transaction = None  # Changes queued since BEGIN, None outside a transaction
+_transaction_tables = []  # Table names in order at BEGIN
+_transaction_backups = {}  # table -> (records, indexed fields, id counter) before the transaction first changed it
+DATABASE_FORMATS = ["json", "binary"]
+AGGREGATE_FUNCTIONS = ["count", "sum", "avg", "min", "max", "distinct"]
+IMPORT_FORMATS = ["CSV", "JSONL"]
+SELECT_USAGE = "Syntax error. Usage: SELECT ALL|field1,field2|count(*),sum(field),avg(field),min(field),max(field),distinct(field) FROM table_name [WHERE condition [AND|OR condition ...]] [ORDER BY field ASC|DESC] [GROUP BY field] [LIMIT n] [OFFSET n];"
+IMPORT_CHUNK_RECORDS = 10000
+# CSV cells written the way JSON writes numbers; anything else ("007", "1_000", "nan") stays text
+CSV_NUMBER_PATTERN = re.compile(r"-?(?:0|[1-9]\d*)(?P<fraction>\.\d+)?(?P<exponent>[eE][-+]?\d+)?")
 
 def handle_nosql_query(query):
     # Simple placeholder for actual NoSQL handling logic
     return f"[NoSQL] You entered: {query}"
 
+# Everything that belongs to the current database, kept while it is parked in _open_databases
+OpenDatabase = namedtuple("OpenDatabase", "db db_file id_counter lsn pagefile index_fields indexes tombstones transaction transaction_tables transaction_backups")
+
+def close_parked(state):
+    """Release a database evicted from the cache of open databases."""
+    if state.pagefile is not None:
+        state.pagefile.close()
+
+_open_databases = connection.DatabaseCache(close_parked, pinned=lambda state: state.transaction is not None)
+
 def load_db(db_name):
-    global current_db, current_db_file
-    db_path = f"{db_name}.json"  # No folder, just file
+    """Make a database the current one; see open_db()."""
+    open_db(pagefile.resolve(db_name))  # No folder, just file
+
+def open_db(db_path):
+    """Make the database stored at db_path the current one.
+
+    A database still parked in _open_databases is swapped back in as it was
+    left; otherwise its file is loaded and its write-ahead log replayed.
+    """
+    global current_db, current_db_file, _id_counter, _wal_lsn, _pagefile, _index_fields, _indexes, _tombstones
+    global _transaction, _transaction_tables, _transaction_backups
+    if db_path == current_db_file:
+        return
+    park_db()
+
+    state = _open_databases.take(db_path)
+    if state is not None:
+        (current_db, current_db_file, _id_counter, _wal_lsn, _pagefile, _index_fields, _indexes, _tombstones,
+         _transaction, _transaction_tables, _transaction_backups) = state
+        return
+
+    wal.wait(db_path)
     
-    if os.path.exists(db_path):
-        with open(db_path, "r") as f:
-            try:
-                current_db = json.load(f)
-            except json.JSONDecodeError:
-                current_db = {}
+    if pagefile.is_paged(db_path):
+        # Records are decoded page by page when a command first touches them
+        _pagefile = pagefile.PagedFile(db_path)
+        current_db = {table_name: _pagefile.rows(table_name) for table_name in _pagefile.tables}
+        meta = _pagefile.meta
     else:
-        current_db = {}
+        if os.path.exists(db_path):
+            with open(db_path, "r") as f:
+                try:
+                    current_db = json.load(f)
+                except json.JSONDecodeError:
+                    current_db = {}
+        else:
+            current_db = {}
+        meta = current_db.pop(wal.META_KEY, {})
 
     current_db_file = db_path
-    update_id_counter() # Update the ID counter after loading the DB
-
+    _wal_lsn = meta.get("lsn", 0)
+    _index_fields = meta.get("indexes", {})
+    _indexes = {}  # Indexes are built on first use, see table_indexes()
+    _id_counter = dict(meta.get("ids", {}))
+    _tombstones = dict(meta.get("tombstones", {}))
+
+    # Replay changes made since the last checkpoint
+    for lsn, change in wal.replay(db_path, _wal_lsn):
+        apply_change(change)
+        _wal_lsn = lsn
+
+    if wal.has_pending(db_path):
+        save_db()  # Finish a checkpoint interrupted by a previous run
+
+    update_id_counter()  # Only for tables the file stores no counter for
+
+
+def park_db():
+    """Move the current database into _open_databases, leaving no database selected."""
+    global current_db, current_db_file, _id_counter, _wal_lsn, _pagefile, _index_fields, _indexes, _tombstones
+    global _transaction, _transaction_tables, _transaction_backups
+    if current_db_file is not None and current_db is not None:
+        _open_databases.park(current_db_file, OpenDatabase(
+            current_db, current_db_file, _id_counter, _wal_lsn, _pagefile, _index_fields, _indexes, _tombstones,
+            _transaction, _transaction_tables, _transaction_backups,
+        ))
+    current_db = current_db_file = _pagefile = _transaction = None
+    _wal_lsn = 0
+    _id_counter = {}
+    _index_fields = {}
+    _indexes = {}
+    _tombstones = {}
+    _transaction_tables = []
+    _transaction_backups = {}
 
 def update_id_counter():
-    """Update the _id_counter for each table in the current database."""
-    global _id_counter
-    
+    """Recover the id counter of tables that have none stored, by scanning their records.
+
+    Counters are saved with the database, so this only scans tables of
+    files written before they were.
+    """
     if current_db is not None:
         for table_name, records in current_db.items():
-            _id_counter[table_name] = max((record.get("id", 0) for record in records), default=0)
+            if table_name not in _id_counter:
+                _id_counter[table_name] = max((record.get("id", 0) for record in live_records(records)), default=0)
+
+def advance_id_counter(table_name, record_ids):
+    """Make sure the id counter of a table is past the given ids (replayed or updated records)."""
+    record_ids = [record_id for record_id in record_ids if isinstance(record_id, int)]
+    if record_ids:
+        _id_counter[table_name] = max(_id_counter.get(table_name, 0), max(record_ids))
+
+def snapshot_meta():
+    """Return the engine metadata stored alongside the tables in the JSON file."""
+    return {"lsn": _wal_lsn, "indexes": _index_fields, "ids": _id_counter, "tombstones": _tombstones}
 
 def save_db():
     """Save the database to the current database's JSON file."""
     if current_db_file:
-        with open(current_db_file, "w") as f:
-            json.dump(current_db, f, indent=4)
+        if pagefile.is_paged(current_db_file):
+            save_paged()
+        elif STORAGE_MODE == "wal":
+            wal.checkpoint(current_db_file, current_db, snapshot_meta(), background=False)
+        else:
+            with open(current_db_file, "w") as f:
+                json.dump({**current_db, wal.META_KEY: snapshot_meta()}, f, indent=4)
+
+def save_paged():
+    """Rewrite the binary database file, copying the pages of tables that were never decoded."""
+    global _pagefile
+    tables = {table_name: ({}, records) for table_name, records in current_db.items()}
+    _pagefile = pagefile.write(current_db_file, tables, snapshot_meta(), previous=_pagefile)
+
+    for table_name, records in current_db.items():
+        if isinstance(records, pagefile.PagedRows):
+            current_db[table_name] = _pagefile.rows(table_name)
+    wal.remove(current_db_file)
+
+def close_pagefile():
+    """Unmap the binary file of the current database, if any."""
+    global _pagefile
+    if _pagefile is not None:
+        _pagefile.close()
+        _pagefile = None
+
+def live_records(records):
+    """Iterate over the records of a table, skipping the tombstones (None) left by deleted ones."""
+    return (record for record in records if record is not None)
+
+def tombstone_count(table_name):
+    """Return the number of tombstones in a table.
+
+    The count is saved with the database and kept current by apply_change();
+    only tables of files written before it was are scanned, once.
+    """
+    if table_name not in _tombstones:
+        _tombstones[table_name] = sum(1 for record in current_db[table_name] if record is None)
+    return _tombstones[table_name]
+
+def materialize(table_name):
+    """Decode a table read lazily from a binary file so it can be modified."""
+    if isinstance(current_db[table_name], pagefile.PagedRows):
+        current_db[table_name] = list(current_db[table_name])
+
+def index_key(value):
+    """Return a hashable key for a field value."""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True)
+    return value
+
+def indexed_fields(table_name):
+    """Return the fields a table has hash indexes on: "id", which always has one, then those created."""
+    return ["id"] + [field for field in _index_fields.get(table_name, []) if field != "id"]
+
+def rebuild_indexes(table_name):
+    """Rebuild every hash index of a table from its records."""
+    indexes = {}
+    for field in indexed_fields(table_name):
+        index = {}
+        for i, record in enumerate(current_db.get(table_name, [])):
+            if record is not None:
+                index.setdefault(index_key(record.get(field)), []).append(i)
+        indexes[field] = index
+    _indexes[table_name] = indexes  # Published whole, as concurrent readers may build them too
+
+def table_indexes(table_name):
+    """Return the hash indexes of a table, building them on first use."""
+    if table_name not in _indexes:
+        rebuild_indexes(table_name)
+    return _indexes[table_name]
+
+def find_positions(table_name, field, value, limit=None):
+    """Return the positions of records whose field equals value, using a hash index if one exists.
+
+    ``limit`` keeps only the first that many positions.
+    """
+    index = table_indexes(table_name).get(field)
+    if index is not None:
+        return index.get(index_key(value), [])[:limit]
+    records = current_db[table_name]
+    return list(itertools.islice((i for i, record in enumerate(records) if record is not None and record.get(field) == value), limit))
+
+def apply_change(change):
+    """Apply one logged change to the in-memory database."""
+    op = change["op"]
+    table_name = change["table"]
+
+    indexes = _indexes.get(table_name, {})  # Only indexes already built need maintenance
+
+    if op in ("insert", "delete", "update", "vacuum"):
+        materialize(table_name)
+
+    if op == "make":
+        current_db[table_name] = []
+        _id_counter[table_name] = 0
+        _tombstones[table_name] = 0
+    elif op == "insert":
+        records = current_db[table_name]
+        for field, index in indexes.items():
+            for i, record in enumerate(change["records"], start=len(records)):
+                index.setdefault(index_key(record.get(field)), []).append(i)
+        records.extend(change["records"])
+        advance_id_counter(table_name, [record.get("id") for record in change["records"]])
+    elif op == "drop":
+        del current_db[table_name]
+        _index_fields.pop(table_name, None)
+        _indexes.pop(table_name, None)
+        _id_counter.pop(table_name, None)
+        _tombstones.pop(table_name, None)
+    elif op == "truncate":
+        current_db[table_name] = []
+        _tombstones[table_name] = 0
+        rebuild_indexes(table_name)
+    elif op == "delete":
+        # Deleted records leave a tombstone so other positions stay valid; VACUUM compacts them away
+        records = current_db[table_name]
+        positions = change["positions"]
+        for field, index in indexes.items():
+            removed = {}
+            for i in positions:
+                removed.setdefault(index_key(records[i].get(field)), set()).add(i)
+            for key, gone in removed.items():
+                kept = [i for i in index[key] if i not in gone]
+                if kept:
+                    index[key] = kept
+                else:
+                    del index[key]
+        if table_name in _tombstones:  # Otherwise counted when first needed
+            _tombstones[table_name] += sum(1 for i in positions if records[i] is not None)
+        for i in positions:
+            records[i] = None
+    elif op == "vacuum":
+        current_db[table_name] = list(live_records(current_db[table_name]))
+        _tombstones[table_name] = 0
+        _indexes.pop(table_name, None)  # Positions have shifted; rebuilt on next use
+    elif op == "update":
+        records = current_db[table_name]
+        field, value = change["field"], change["value"]
+        index = indexes.get(field)
+        for i in change["positions"]:
+            if index is not None:
+                old_key = index_key(records[i].get(field))
+                index[old_key].remove(i)
+                if not index[old_key]:
+                    del index[old_key]
+                bisect.insort(index.setdefault(index_key(value), []), i)
+            # Records are replaced rather than modified, so a shallow copy of the table stays a snapshot
+            records[i] = {**records[i], field: value}
+        if field == "id":
+            advance_id_counter(table_name, [value])
+    elif op == "create_index":
+        _index_fields.setdefault(table_name, []).append(change["field"])
+        rebuild_indexes(table_name)
+    elif op == "drop_index":
+        _index_fields[table_name].remove(change["field"])
+        if not _index_fields[table_name]:
+            del _index_fields[table_name]
+        indexes.pop(change["field"], None)
+
+def record_change(change):
+    """Apply a change and persist it according to STORAGE_MODE.
+
+    Inside a transaction the change is only applied in memory and queued until COMMIT.
+    """
+    if _transaction is not None:
+        backup_table(change["table"])
+        apply_change(change)
+        _transaction.append(change)
+        return
+
+    apply_change(change)
+    persist_changes([change])
+
+def backup_table(table_name):
+    """Remember the state of a table before the open transaction first changes it."""
+    if table_name in _transaction_backups:
+        return
+
+    records = current_db.get(table_name)
+    if isinstance(records, list):
+        records = list(records)  # Records themselves are never modified in place
+    _transaction_backups[table_name] = (
+        records, list(_index_fields.get(table_name, [])), _id_counter.get(table_name, 0), _tombstones.get(table_name),
+    )
+
+def in_transaction():
+    """Return True while a transaction is open on the current database."""
+    return _transaction is not None
+
+def begin_transaction():
+    global _transaction, _transaction_tables
+    _transaction = []
+    _transaction_tables = list(current_db)
+    _transaction_backups.clear()
+
+def commit_transaction(snapshot=False):
+    """Persist every change made since BEGIN with a single write.
+
+    With ``snapshot`` the whole database is saved instead of logging the
+    changes, which is cheaper for bulk loads.
+    """
+    global _transaction
+    changes, _transaction = _transaction, None
+    _transaction_backups.clear()
+    if changes and snapshot:
+        save_db()
+    elif changes:
+        persist_changes(changes)
+    return len(changes)
+
+def rollback_transaction():
+    """Restore every table changed since BEGIN."""
+    global _transaction
+    _transaction = None
+    for table_name, (records, index_fields, id_counter, tombstones) in _transaction_backups.items():
+        if records is None:
+            current_db.pop(table_name, None)
+            _id_counter.pop(table_name, None)
+        else:
+            current_db[table_name] = records
+            # Ids handed out inside the transaction are not reused
+            _id_counter[table_name] = max(id_counter, _id_counter.get(table_name, 0))
+        if tombstones is None:
+            _tombstones.pop(table_name, None)
+        else:
+            _tombstones[table_name] = tombstones
+        if index_fields:
+            _index_fields[table_name] = index_fields
+        else:
+            _index_fields.pop(table_name, None)
+        _indexes.pop(table_name, None)  # Rebuilt on next use
+    _transaction_backups.clear()
+
+    # Put restored tables back in their original order
+    tables = {table_name: current_db[table_name] for table_name in _transaction_tables if table_name in current_db}
+    tables.update(current_db)
+    current_db.clear()
+    current_db.update(tables)
+
+def persist_changes(changes):
+    """Write applied changes to disk according to STORAGE_MODE."""
+    global _wal_lsn
+    if STORAGE_MODE != "wal":
+        save_db()
+        return
+
+    _wal_lsn += 1
+    if wal.append(current_db_file, _wal_lsn, changes) >= wal.CHECKPOINT_BYTES:
+        if pagefile.is_paged(current_db_file):
+            save_paged()
+        else:
+            wal.checkpoint(current_db_file, current_db, snapshot_meta())
+
+def parse_csv_value(text):
+    """Convert a CSV cell to an int or float when it is a plain number (CSV_NUMBER_PATTERN), else keep the string."""
+    match = CSV_NUMBER_PATTERN.fullmatch(text)
+    if match is None:
+        return text
+    if match.group("fraction") is None and match.group("exponent") is None:
+        return int(text)
+    value = float(text)
+    return value if math.isfinite(value) else text  # "1e999" overflows to infinity
+
+def read_import_records(f, file_format):
+    """Yield (line number, record) for each record of a CSV or JSONL file.
+
+    CSV files need a header row naming the fields; empty cells are left out
+    of the record.
+    """
+    if file_format == "CSV":
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, {field: parse_csv_value(value) for field, value in row.items()
+                                    if field is not None and value not in (None, "")}
+        return
+
+    for line_number, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            raise ValueError(f"Invalid JSON on line {line_number}.")
+        if not isinstance(record, dict):
+            raise ValueError(f"Expected a JSON object on line {line_number}.")
+        yield line_number, record
+
+def import_records(table_name, path, file_format):
+    """Stream a CSV or JSONL file into a table in chunks of IMPORT_CHUNK_RECORDS records.
+
+    IDs are assigned a chunk at a time; raises ValueError on malformed input.
+    Returns the number of records imported.
+    """
+    imported = 0
+    chunk = []
+
+    def insert_chunk():
+        first_id = _id_counter[table_name] + 1
+        _id_counter[table_name] += len(chunk)
+        for record_id, record in enumerate(chunk, start=first_id):
+            record["id"] = record_id
+        record_change({"op": "insert", "table": table_name, "records": chunk})
+
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        for _, record in read_import_records(f, file_format):
+            chunk.append(record)
+            if len(chunk) == IMPORT_CHUNK_RECORDS:
+                insert_chunk()
+                imported += len(chunk)
+                chunk = []
+
+    if chunk:
+        insert_chunk()
+        imported += len(chunk)
+    return imported
+
+def aggregate_records(records, group_field, aggregates):
+    """Compute aggregates over records in one pass.
+
+    ``aggregates`` is a list of (label, function, field) tuples, field being
+    None for count(*). Only one accumulator per aggregate and group is kept,
+    and one summary dict per group is returned.
+    """
+    groups = {}
+    for record in records:
+        group_value = record.get(group_field) if group_field else None
+        key = index_key(group_value)
+        entry = groups.get(key)
+        if entry is None:
+            entry = groups[key] = (group_value, [[0, None, None] for _ in aggregates])
+
+        for accumulator, (_, function, field) in zip(entry[1], aggregates):
+            if field is None:
+                accumulator[0] += 1
+                continue
+            value = record.get(field)
+            if value is None:
+                continue
+
+            if function == "distinct":
+                if accumulator[2] is None:
+                    accumulator[1], accumulator[2] = [], set()
+                if index_key(value) not in accumulator[2]:
+                    accumulator[2].add(index_key(value))
+                    accumulator[1].append(value)
+            elif function in ("sum", "avg"):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    accumulator[0] += 1
+                    accumulator[1] = value if accumulator[1] is None else accumulator[1] + value
+            elif function == "count":
+                accumulator[0] += 1
+            elif accumulator[1] is None or (value < accumulator[1] if function == "min" else value > accumulator[1]):
+                accumulator[1] = value
+
+    if not groups and not group_field:
+        groups[None] = (None, [[0, None, None] for _ in aggregates])  # Aggregates over no records still summarize
+
+    result = []
+    for group_value, accumulators in groups.values():
+        summary = {"group": group_value} if group_field else {}
+        for accumulator, (label, function, _) in zip(accumulators, aggregates):
+            count, value = accumulator[0], accumulator[1]
+            if function == "count":
+                summary[label] = count
+            elif function == "avg":
+                summary[label] = value / count if count else None
+            elif function == "distinct":
+                summary[label] = value or []
+            else:
+                summary[label] = value
+        result.append(summary)
+    return result
+
+def format_result(result):
+    """Render the result of a SELECT as indented JSON."""
+    if isinstance(result, dict):
+        return json.dumps(result, indent=4)
+    records = list(result)
+    return json.dumps(records, indent=4) if records else "No records matched."
+
+def select_records(command):
+    """Run a SELECT statement and return the matching records.
+
+    Aggregates without GROUP BY return a single summary dict instead. Raises
+    ValueError with a user-facing message on invalid queries.
+    """
+    try:
+        statement, literals = query.parse(command)
+    except query.ParseError:
+        statement = None
+    if not isinstance(statement, query.Select):
+        raise ValueError(SELECT_USAGE)
+    return run_select(statement, literals)
+
+def run_select(select, literals, types=None):
+    """Execute a parsed SELECT; ``literals`` holds the values of its Param placeholders.
+
+    Returns an iterable of records, produced lazily where the query allows it,
+    or a single summary dict for aggregates without GROUP BY.
+    """
+    if current_db is None:
+        raise ValueError("No database selected. Use 'USE database_name' to select a database.")
+
+    table_name = select.table
+    if select.join is not None:
+        raise ValueError("JOIN is only supported by the SQL engine.")
+    order_field = select.order_by
+    order_direction = "desc" if select.descending else "asc"
+    group_field = select.group_by
+
+    # Aggregate expressions such as count(*) or avg(age)
+    aggregates = []
+    for field in select.fields or ():
+        if isinstance(field, query.Aggregate):
+            function = field.function.lower()
+            if function not in AGGREGATE_FUNCTIONS:
+                raise ValueError(f"Unsupported aggregate '{function}'. Supported aggregates: {', '.join(AGGREGATE_FUNCTIONS)}")
+            if field.argument is None and function != "count":
+                raise ValueError(f"{function}(*) is not supported. Use {function}(field).")
+            aggregates.append((f"{function}({field.argument or '*'})", function, field.argument))
+    if aggregates and len(aggregates) != len(select.fields):
+        raise ValueError("Cannot mix plain fields with aggregates. Use GROUP BY to include the group value.")
+
+    # LIMIT / OFFSET: only the first `stop` records of the result are ever needed
+    offset, limit = query.bind_limit(select, literals)
+    stop = None if limit is None else offset + limit
+    scan_limit = None if order_field or group_field or aggregates else stop  # Without ordering the scan can stop early
+
+    # Perform operations
+    if table_name in current_db:
+        result = current_db[table_name]
+
+        # WHERE filter
+        if select.where is not None:
+            result = [result[i] for i in where_positions(table_name, select.where, literals, types, scan_limit)]
+        else:
+            result = live_records(result)
+
+        # Aggregates: one summary per group, computed in a single pass
+        if aggregates:
+            try:
+                result = aggregate_records(result, group_field, aggregates)
+            except TypeError:
+                raise ValueError("Cannot compare values of different types in min/max.")
+            if not group_field:
+                return result[0]
+            if order_field:
+                # Summaries are keyed by lowercased labels such as "count(*)", so match ORDER BY the same way
+                keys = {key.lower().replace(" ", ""): key for key in ["group"] + [label for label, _, _ in aggregates]}
+                if order_field.lower().replace(" ", "") not in keys:
+                    raise ValueError(f"ORDER BY field '{order_field}' must be 'group' or one of the selected aggregates.")
+                order_field = keys[order_field.lower().replace(" ", "")]
+
+        # GROUP BY
+        elif group_field:
+            grouped = {}
+            for record in result:
+                key = index_key(record.get(group_field))
+                if key not in grouped:
+                    grouped[key] = (record.get(group_field), [])
+                grouped[key][1].append(record)
+            result = [{"group": k, "records": v} for k, v in grouped.values()]
+
+        # ORDER BY, keeping only the top `stop` records in a bounded heap under LIMIT
+        if order_field and stop is not None:
+            select_top = heapq.nlargest if order_direction == "desc" else heapq.nsmallest
+            result = select_top(stop, result, key=lambda x: x.get(order_field, ""))
+        elif order_field:
+            result = sorted(result, key=lambda x: x.get(order_field, ""), reverse=(order_direction == "desc"))
+
+        if offset or stop is not None:
+            result = itertools.islice(result, offset, stop)
+
+        # Field filtering
+        if select.fields is not None and not aggregates:
+            result = ({field: r.get(field) for field in select.fields} for r in result)
+
+        return result
+    else:
+        raise ValueError(f"Table '{table_name}' does not exist.")
+
+def field_type(table_name, field):
+    """Return int or float when the first record holding the field stores one, else None."""
+    for record in live_records(current_db[table_name]):
+        if field in record:
+            if isinstance(record[field], int):
+                return int
+            elif isinstance(record[field], float):
+                return float
+            break
+    return None
+
+def coerce_value(table_name, field, value, types=None):
+    """Convert a literal to int or float when the first record holding the field stores one; raises ValueError.
+
+    ``types`` is an optional {field: int|float} cache that saves the scan for the type on later calls.
+    """
+    convert = None if types is None else types.get(field)
+    if convert is None:
+        convert = field_type(table_name, field)
+        if convert is not None and types is not None:
+            types[field] = convert
+    return value if convert is None else convert(value)
+
+def compile_predicate(table_name, where, literals, types=None):
+    """Compile a parsed WHERE condition into a function record -> bool, converting its literals once.
+
+    Literals are converted like coerce_value does; one that does not convert
+    is compared as written, so it simply matches nothing.
+    """
+    def compile_comparison(comparison):
+        field = comparison.column
+        operands = [query.bind(value, literals) for value in comparison.operands]
+        if comparison.operator != "like":
+            operands = [coerce_literal(table_name, field, value, types) for value in operands]
+        matches = query.value_predicate(comparison.operator, operands)
+        return lambda record: matches(record.get(field))
+
+    return query.compile_condition(where, compile_comparison)
+
+def coerce_literal(table_name, field, value, types=None):
+    """coerce_value() for WHERE literals: a value that does not convert is returned unchanged."""
+    try:
+        return coerce_value(table_name, field, value, types)
+    except ValueError:
+        return value
+
+def where_positions(table_name, where, literals, types=None, limit=None):
+    """Return the ascending positions of the records matching a parsed WHERE condition.
+
+    Equality on an indexed field is answered by the hash index, also when it
+    is one of several AND-ed comparisons; anything else is a single scan with
+    the compiled predicate. ``limit`` keeps only the first that many matches,
+    ending the scan as soon as they are found.
+    """
+    records = current_db[table_name]
+    if isinstance(where, query.Comparison) and where.operator == "=":
+        value = coerce_literal(table_name, where.column, query.bind(where.operands[0], literals), types)
+        return find_positions(table_name, where.column, value, limit)
+
+    predicate = compile_predicate(table_name, where, literals, types)
+    if isinstance(where, query.And):
+        indexes = table_indexes(table_name)
+        for operand in where.operands:
+            if isinstance(operand, query.Comparison) and operand.operator == "=" and operand.column in indexes:
+                value = coerce_literal(table_name, operand.column, query.bind(operand.operands[0], literals), types)
+                return list(itertools.islice((i for i in find_positions(table_name, operand.column, value) if predicate(records[i])), limit))
+    return list(itertools.islice((i for i, record in enumerate(records) if record is not None and predicate(record)), limit))
+
+def run_update(update, literals, types=None):
+    """Execute a parsed UPDATE and return the message for the user; ``types`` is passed on to coerce_value.
+
+    Raises ValueError.
+    """
+    table_name = update.table
+    if current_db is None:
+        raise ValueError("No database selected. Use 'USE database_name' to select a database.")
+    if table_name not in current_db:
+        raise ValueError(f"Table '{table_name}' not found.")
+    if update.column == "id":
+        raise ValueError("The 'id' field is the primary key and cannot be updated.")
+
+    # Detect and convert the type of the SET value
+    try:
+        set_value = coerce_value(table_name, update.column, query.bind(update.value, literals), types)
+    except ValueError:
+        raise ValueError("Type mismatch in SET clause.")
+
+    # Perform the update
+    positions = where_positions(table_name, update.where, literals, types)
+    if positions:
+        record_change({"op": "update", "table": table_name, "positions": positions, "field": update.column, "value": set_value})
+
+    return f"{len(positions)} record(s) updated in '{table_name}'."
+
+def run_exclude(exclude, literals, types=None):
+    """Execute a parsed EXCLUDE (drop a table, empty it, or delete matching records) and return the message for the user.
+
+    Raises ValueError.
+    """
+    table_name = exclude.table
+    if current_db is None:
+        raise ValueError("No database selected. Use 'USE database_name' to select a database.")
+    if table_name not in current_db:
+        raise ValueError(f"Table '{table_name}' does not exist.")
+
+    # Delete the entire table
+    if exclude.drop:
+        record_change({"op": "drop", "table": table_name})
+        return f"Table '{table_name}' has been excluded."
+
+    # Exclude all records from the table (No WHERE Clause)
+    if exclude.where is None:
+        record_change({"op": "truncate", "table": table_name})  # Clear all records but keep the table
+        return f"All records excluded from '{table_name}'."
+
+    # Remove matching records
+    positions = where_positions(table_name, exclude.where, literals, types)
+    if positions:
+        record_change({"op": "delete", "table": table_name, "positions": positions})
+        return f"Excluded {len(positions)} record(s) from '{table_name}'."
+    else:
+        return "No matching records found."
+
+def run_delete(delete, literals, types=None):
+    """Execute a parsed DELETE: remove matching records, or set one of their fields to null. Raises ValueError."""
+    table_name, field_to_delete = delete.table, delete.field
+    if current_db is None:
+        raise ValueError("No database selected. Use 'USE database_name' to select a database.")
+    if table_name not in current_db:
+        raise ValueError(f"Table '{table_name}' not found.")
+    if field_to_delete == "id":
+        raise ValueError("The 'id' field is the primary key and cannot be deleted. DELETE FROM the record instead.")
+
+    positions = where_positions(table_name, delete.where, literals, types)
+    deleted_count = len(positions)
+
+    if field_to_delete:
+        # Set the specified field to null
+        change = {"op": "update", "table": table_name, "positions": positions, "field": field_to_delete, "value": None}
+    else:
+        # If no specific field is provided, delete the record entirely
+        change = {"op": "delete", "table": table_name, "positions": positions}
+
+    if positions:
+        record_change(change)
+
+    # Return response based on whether a field was deleted or the record
+    return f"{deleted_count} record(s) updated in '{table_name}' with field '{field_to_delete}' set to null." if field_to_delete else f"{deleted_count} record(s) deleted from '{table_name}'."
+
+class PreparedStatement:
+    """A SELECT, UPDATE, EXCLUDE or DELETE parsed once, then executed with different parameters.
+
+    Each "?" in the statement is a parameter; execute() binds the values in
+    order and runs the parsed statement without looking at the text again.
+    The int/float type of compared and updated fields is looked up once and
+    reused by later executions.
+    """
+
+    def __init__(self, statement):
+        try:
+            self.statement, self.literals = query.parse(statement, parameters=True)
+        except query.ParseError as e:
+            raise ValueError(f"Syntax error: {e}")
+        self.parameters = self.literals.count(query.PARAMETER)
+        self.types = {}  # field -> int or float, see coerce_value()
+
+        if current_db is None:
+            raise ValueError("No database selected. Use 'USE database_name' to select a database.")
+        if self.statement.table not in current_db:
+            raise ValueError(f"Table '{self.statement.table}' does not exist.")
+
+    def execute(self, params=()):
+        """Run the statement with ``params`` bound to its "?" parameters and return the output of the command."""
+        try:
+            literals = query.bind_parameters(self.literals, params)
+            if isinstance(self.statement, query.Select):
+                return format_result(run_select(self.statement, literals, self.types))
+            return self.cursor(params).message
+        except ValueError as e:
+            return str(e)
+
+    def cursor(self, params=()):
+        """Run the statement with ``params`` bound and return a cursor.Cursor over its records. Raises ValueError."""
+        literals = query.bind_parameters(self.literals, params)
+        if isinstance(self.statement, query.Select):
+            return select_cursor(run_select(self.statement, literals, self.types))
+        if isinstance(self.statement, query.Update):
+            return cursor.Cursor(None, message=run_update(self.statement, literals, self.types))
+        if isinstance(self.statement, query.Exclude):
+            return cursor.Cursor(None, message=run_exclude(self.statement, literals, self.types))
+        return cursor.Cursor(None, message=run_delete(self.statement, literals, self.types))
+
+def prepare(statement):
+    """Parse and check a statement once; returns a PreparedStatement. Raises ValueError."""
+    return PreparedStatement(statement)
+
+def select_cursor(result):
+    """Wrap the result of run_select() in a cursor; a summary dict becomes its only record."""
+    return cursor.Cursor(None, [result] if isinstance(result, dict) else result)
+
+def execute(statement, params=()):
+    """Run a statement and return a cursor.Cursor over its result. Raises ValueError.
+
+    A SELECT yields its records as dicts, lazily; ``params`` are bound to its
+    "?" parameters. Any other statement runs through run_command and its
+    output becomes the cursor's message.
+    """
+    if params:
+        return prepare(statement).cursor(params)
+    if statement.strip()[:6].lower() == "select":
+        return select_cursor(select_records(statement))
+    return cursor.Cursor(None, message=run_command(statement))
 
 def get_downloads_directory():
     if platform.system() == "Windows":
@@ -55,104 +859,205 @@ def get_downloads_directory():
 
 
 def process_command(command):
+    """Run a console command and return its output; a failed command returns its error message."""
+    try:
+        return run_command(command)
+    except ValueError as e:
+        return str(e)
+
+def run_command(command):
+    """Run a console command and return its output message. Raises ValueError when the command fails."""
     global current_db, current_db_file
     
     tokens = command.strip().split()
+    if not tokens:
+        raise ValueError("Invalid command.")
 
     # Remove the semicolon if present at the end of the command
     if tokens[-1].endswith(";"):
         tokens[-1] = tokens[-1][:-1]
 
-    if not tokens:
-        return "Invalid command."
-
     action = tokens[0].lower()
     
     if action == "show" and len(tokens) == 2 and tokens[1].lower() == "databases":
-        # List all JSON database files in the current directory
-        databases = [f for f in os.listdir() if f.endswith(".json")]
+        # List all JSON and binary database files in the current directory
+        databases = [f for f in os.listdir() if f.endswith(".json") or f.endswith(pagefile.EXTENSION)]
         return "Databases: " + ", ".join(databases) if databases else "No databases found."
     
-    elif action == "create" and len(tokens) == 3 and tokens[1].lower() == "database":
+    elif action in ("begin", "commit", "rollback") and len(tokens) <= 2:
+        if current_db is None:
+            raise ValueError("No database selected. Use 'USE database_name' to select a database.")
+
+        if action == "begin":
+            if _transaction is not None:
+                raise ValueError("A transaction is already open.")
+            begin_transaction()
+            return "Transaction started."
+
+        if _transaction is None:
+            raise ValueError("No transaction is open.")
+        if action == "commit":
+            return f"Transaction committed ({commit_transaction()} change(s))."
+        rollback_transaction()
+        return "Transaction rolled back."
+
+    elif action in ("use", "remove", "exit") and len(tokens) == 2 and _transaction is not None:
+        raise ValueError("A transaction is open. COMMIT or ROLLBACK first.")
+
+    elif action == "create" and len(tokens) in (3, 5) and tokens[1].lower() == "database":
         db_name = tokens[2]
-        db_path = f"{db_name}.json"
+        db_format = "json"
+        if len(tokens) == 5:
+            if tokens[3].lower() != "format" or tokens[4].lower() not in DATABASE_FORMATS:
+                raise ValueError("Syntax error. Usage: CREATE DATABASE database_name [FORMAT JSON|BINARY];")
+            db_format = tokens[4].lower()
         
-        if os.path.exists(db_path):
-            return f"Database '{db_name}' already exists."
+        if os.path.exists(pagefile.resolve(db_name)):
+            raise ValueError(f"Database '{db_name}' already exists.")
         
-        # Create an empty JSON file
-        with open(db_path, "w") as f:
-            json.dump({}, f)
+        if db_format == "binary":
+            # Create an empty binary file
+            pagefile.write(f"{db_name}{pagefile.EXTENSION}", {}, {}).close()
+        else:
+            # Create an empty JSON file
+            with open(f"{db_name}.json", "w") as f:
+                json.dump({}, f)
         
         return f"Database '{db_name}' created successfully."
+
+    elif action in ("create", "drop") and len(tokens) >= 3 and tokens[1].lower() == "index":
+        if current_db is None:
+            raise ValueError("No database selected. Use 'USE database_name' to select a database.")
+
+        match = re.match(r"(create|drop) index on (\w+)\s*\(\s*(\w+)\s*\)\s*;?$", command.strip(), re.IGNORECASE)
+        if not match:
+            raise ValueError(f"Syntax error. Usage: {action.upper()} INDEX ON table_name(field);")
+
+        table_name, field = match.group(2), match.group(3)
+        if table_name not in current_db:
+            raise ValueError(f"Table '{table_name}' does not exist.")
+
+        indexed = field in _index_fields.get(table_name, [])
+        if action == "create":
+            if field in indexed_fields(table_name):
+                raise ValueError(f"Index on '{table_name}({field})' already exists.")
+            record_change({"op": "create_index", "table": table_name, "field": field})
+            return f"Index created on '{table_name}({field})'."
+        else:
+            if not indexed:
+                raise ValueError(f"No index on '{table_name}({field})'.")
+            record_change({"op": "drop_index", "table": table_name, "field": field})
+            return f"Index on '{table_name}({field})' dropped."
         
     elif action == "exit" and len(tokens) == 2:
         db_name = tokens[1]
 
         if current_db is None:
-            return "No database is currently in use."
+            raise ValueError("No database is currently in use.")
 
-        db_path = f"{db_name}.json"  # Direct JSON file name
+        db_path = pagefile.resolve(db_name)  # JSON or binary database file
         if not os.path.exists(db_path):
-            return f"Database '{db_name}' does not exist."
+            raise ValueError(f"Database '{db_name}' does not exist.")
 
         if current_db_file == db_path:
             save_db()  # Save changes before exiting
+            close_pagefile()
             current_db_file = None
             current_db = None
             return f"Exited from database '{db_name}'. You can now use another database."
         else:
-            return f"Database '{db_name}' is not currently in use."
+            raise ValueError(f"Database '{db_name}' is not currently in use.")
         
     elif action == "use" and len(tokens) == 2:
         db_name = tokens[1]
-        db_path = f"{db_name}.json"  # Direct JSON file name
+        db_path = pagefile.resolve(db_name)  # JSON or binary database file
 
         if not os.path.exists(db_path):
-            return f"Database '{db_name}' does not exist."
+            raise ValueError(f"Database '{db_name}' does not exist.")
         else:
             load_db(db_name)
             return f"Using database '{db_name}'."
 
     elif action == "remove" and len(tokens) == 2:
         db_name = tokens[1]
-        db_path = f"{db_name}.json"  # Direct JSON file name
+        db_path = pagefile.resolve(db_name)  # JSON or binary database file
 
         if not os.path.exists(db_path):
-            return f"Database '{db_name}' does not exist."
+            raise ValueError(f"Database '{db_name}' does not exist.")
 
-        os.remove(db_path)  # Delete the JSON file
         if current_db_file == db_path:
+            close_pagefile()
             current_db_file = None
             current_db = None
+        _open_databases.discard(db_path)
+        os.remove(db_path)  # Delete the database file
+        wal.remove(db_path)
 
         return f"Database '{db_name}' deleted successfully."
 
 
     elif action == "make" and len(tokens) >= 2:
         if current_db is None:
-            return "No database selected. Use 'USE database_name' to select a database."
+            raise ValueError("No database selected. Use 'USE database_name' to select a database.")
 
         table_name = tokens[1]
         if table_name in current_db:
-            return f"Table '{table_name}' already exists."
-        current_db[table_name] = []
-        _id_counter[table_name] = 0  # Initialize ID counter for the table
-        save_db()
+            raise ValueError(f"Table '{table_name}' already exists.")
+        record_change({"op": "make", "table": table_name})  # Also starts the table's ID counter
         return f"Table '{table_name}' created successfully."
 
 
 
+    # IMPORT file INTO table [FORMAT CSV|JSONL]
+    elif action == "import":
+        try:
+            parts = shlex.split(command.strip().rstrip(";"))
+        except ValueError:
+            parts = []
+        if len(parts) not in (4, 6) or parts[2].lower() != "into" or (len(parts) == 6 and parts[4].lower() != "format"):
+            raise ValueError("Syntax error. Usage: IMPORT file_path INTO table_name [FORMAT CSV|JSONL];")
+
+        path, table_name = parts[1], parts[3]
+        file_format = parts[5].upper() if len(parts) == 6 else os.path.splitext(path)[1].lstrip(".").upper()
+        if file_format not in IMPORT_FORMATS:
+            raise ValueError("Error: Unsupported file format. Use CSV or JSONL.")
+
+        if current_db is None:
+            raise ValueError("No database selected. Use 'USE database_name' to select a database.")
+        if table_name not in current_db:
+            raise ValueError(f"Table '{table_name}' does not exist.")
+        if not os.path.exists(path):
+            raise ValueError(f"File '{path}' not found.")
+
+        # Run the import as a transaction so a bad line leaves the table untouched
+        # and the records are saved with one snapshot rather than logged
+        own_transaction = _transaction is None
+        if own_transaction:
+            begin_transaction()
+        id_counter = _id_counter[table_name]
+        try:
+            imported = import_records(table_name, path, file_format)
+        except (ValueError, OSError) as e:
+            if own_transaction:
+                rollback_transaction()
+                _id_counter[table_name] = id_counter
+                raise ValueError(f"Import failed, no records were imported: {e}")
+            raise ValueError(f"Import failed: {e} Records read before the error remain in the open transaction.")
+
+        if own_transaction:
+            commit_transaction(snapshot=True)
+        return f"{imported} record(s) imported into '{table_name}'."
+
     elif action == "include":
         if len(tokens) < 3:
-            return "Syntax error. Usage: INCLUDE table_name [{key: value, ...}, {key: value, ...}];"
+            raise ValueError("Syntax error. Usage: INCLUDE table_name [{key: value, ...}, {key: value, ...}];")
         
         table_name = tokens[1]
         data_block = command.split("[", 1)[-1].split("]", 1)[0]  # Extract data inside [ ... ]
 
         try:
             if not data_block.strip():
-                return "Empty data provided."
+                raise ValueError("Empty data provided.")
 
             # Convert unquoted keys and values to valid JSON format
             def fix_json_format(data):
@@ -171,13 +1076,13 @@ def process_command(command):
                 obj_dict = {}
                 for key, value in obj:
                     if key in seen_keys:
-                        return f"Error: Duplicate key '{key}' found within a JSON object."
+                        raise ValueError(f"Error: Duplicate key '{key}' found within a JSON object.")
                     seen_keys.add(key)
                     obj_dict[key] = value
                 parsed_records.append(obj_dict)
 
             if not isinstance(parsed_records, list):
-                return "Invalid format. Expected an array of JSON objects."
+                raise ValueError("Invalid format. Expected an array of JSON objects.")
 
             if table_name in current_db:
                 inserted_ids = []
@@ -188,287 +1093,137 @@ def process_command(command):
                         _id_counter[table_name] += 1
                         record["id"] = _id_counter[table_name]
 
-                        current_db[table_name].append(record)
                         inserted_ids.append(record["id"])
                     else:
-                        return "Invalid data format. Each entry should be a JSON object."
+                        raise ValueError("Invalid data format. Each entry should be a JSON object.")
 
-                save_db()
+                record_change({"op": "insert", "table": table_name, "records": parsed_records})
                 return f"{len(inserted_ids)} records included into '{table_name}' with IDs {inserted_ids}."
             else:
-                return f"Table '{table_name}' does not exist."
+                raise ValueError(f"Table '{table_name}' does not exist.")
         except json.JSONDecodeError as e:
-            return f"Invalid JSON format: {e}"
+            raise ValueError(f"Invalid JSON format: {e}")
 
 
     elif action == "select":
-        if len(tokens) < 4 or tokens[2].lower() != "from":
-            return "Syntax error. Usage: SELECT ALL|field1,field2 FROM table_name [WHERE field='value'] [ORDER BY field ASC|DESC] [GROUP BY field];"
-
-        fields_token = tokens[1].lower()
-        table_name = tokens[3]
-        condition_clause = None
-        order_field = None
-        order_direction = "asc"
-        group_field = None
-
-        # Initialize fields
-        fields = [] if fields_token == "all" else [f.strip() for f in fields_token.split(",")]
-
-        # Handle WHERE clause
-        if "where" in tokens:
-            where_index = tokens.index("where")
-            condition_clause = " ".join(tokens[where_index + 1:])
-            if "order" in tokens:
-                condition_clause = " ".join(tokens[where_index + 1:tokens.index("order")])
-            elif "group" in tokens:
-                condition_clause = " ".join(tokens[where_index + 1:tokens.index("group")])
-
-        # Handle ORDER BY
-        if "order" in tokens and "by" in tokens:
-            order_index = tokens.index("order")
-            order_field = tokens[order_index + 2]
-            if len(tokens) > order_index + 3 and tokens[order_index + 3].lower() in ["asc", "desc"]:
-                order_direction = tokens[order_index + 3].lower()
-
-        # Handle GROUP BY
-        if "group" in tokens and "by" in tokens:
-            group_index = tokens.index("group")
-            group_field = tokens[group_index + 2]
-
-        # Perform operations
-        if table_name in current_db:
-            result = current_db[table_name]
-
-            # WHERE filter
-            if condition_clause:
-                if "=" in condition_clause:
-                    condition_field, condition_value = condition_clause.split("=")
-                    condition_field = condition_field.strip()
-                    condition_value = condition_value.strip().strip("'\"")
-                    result = [r for r in result if r.get(condition_field) == condition_value]
-                else:
-                    return "Only '=' conditions are supported."
-
-            # GROUP BY
-            if group_field:
-                grouped = {}
-                for record in result:
-                    key = record.get(group_field)
-                    if key not in grouped:
-                        grouped[key] = []
-                    grouped[key].append(record)
-                result = [{"group": k, "records": v} for k, v in grouped.items()]
-
-            # ORDER BY
-            if order_field:
-                result = sorted(result, key=lambda x: x.get(order_field, ""), reverse=(order_direction == "desc"))
-
-            # Field filtering
-            if fields_token != "all":
-                result = [{field: r.get(field) for field in fields} for r in result]
-
-            return json.dumps(result, indent=4) if result else "No records matched."
-        else:
-            return f"Table '{table_name}' does not exist."
+        return format_result(select_records(command))
 
 
 
     elif action.lower() == "update":
         try:
-            # Use shlex to split the command, preserving quoted values
-            tokens = shlex.split(command.replace("=", " = "))
-            lowered_tokens = [t.lower() for t in tokens]
-
-            if len(tokens) < 8 or "set" not in lowered_tokens or "where" not in lowered_tokens:
-                return "Syntax error. Usage: UPDATE table_name SET field=value WHERE condition;"
-
-            table_name = tokens[1]
-            set_index = lowered_tokens.index("set")
-            where_index = lowered_tokens.index("where")
-
-            # Validate SET clause
-            if tokens[set_index + 2] != "=":
-                return "Syntax error in SET clause."
-            set_field = tokens[set_index + 1]
-            set_value = tokens[set_index + 3].strip("'").strip('"')
-
-            # Validate WHERE clause
-            if tokens[where_index + 2] != "=":
-                return "Syntax error in WHERE clause."
-            condition_field = tokens[where_index + 1]
-            condition_value = tokens[where_index + 3].strip("'").strip('"')
-
-            if table_name not in current_db:
-                return f"Table '{table_name}' not found."
-
-            modified_count = 0
-
-            # Detect and convert types for WHERE value
-            for record in current_db[table_name]:
-                if condition_field in record:
-                    if isinstance(record[condition_field], int):
-                        try:
-                            condition_value = int(condition_value)
-                        except ValueError:
-                            return "Type mismatch in WHERE clause."
-                    elif isinstance(record[condition_field], float):
-                        try:
-                            condition_value = float(condition_value)
-                        except ValueError:
-                            return "Type mismatch in WHERE clause."
-                    break
-
-            # Detect and convert types for SET value
-            for record in current_db[table_name]:
-                if set_field in record:
-                    if isinstance(record[set_field], int):
-                        try:
-                            set_value = int(set_value)
-                        except ValueError:
-                            return "Type mismatch in SET clause."
-                    elif isinstance(record[set_field], float):
-                        try:
-                            set_value = float(set_value)
-                        except ValueError:
-                            return "Type mismatch in SET clause."
-                    break
-
-            # Perform the update
-            for record in current_db[table_name]:
-                if record.get(condition_field) == condition_value:
-                    record[set_field] = set_value
-                    modified_count += 1
-
-            save_db()  # Save changes to the JSON file
-            return f"{modified_count} record(s) updated in '{table_name}'."
+            statement, literals = query.parse(command)
+        except query.ParseError:
+            statement = None
+        if not isinstance(statement, query.Update):
+            raise ValueError("Syntax error. Usage: UPDATE table_name SET field=value WHERE condition;")
 
+        try:
+            return run_update(statement, literals)
+        except ValueError:
+            raise
         except Exception as e:
-            return f"Error processing update command: {e}"
+            raise ValueError(f"Error processing update command: {e}")
 
 
     elif action == "exclude":
-            if len(tokens) < 2:
-                return "Syntax error. Usage: EXCLUDE table_name; OR EXCLUDE FROM table_name WHERE condition;"
-
-            # Case 1: Exclude the entire table (Delete table itself)
-            if len(tokens) == 2:
-                table_name = tokens[1]
-
-                # Ensure table exists
-                if table_name not in current_db:
-                    return f"Table '{table_name}' does not exist."
-
-                # Delete the entire table
-                del current_db[table_name]
-                save_db()
-                return f"Table '{table_name}' has been excluded."
-
-            # Case 2: Exclude records from a table (Must include 'FROM')
-            if tokens[1].lower() == "from":
-                if len(tokens) < 3:
-                    return "Syntax error. Usage: EXCLUDE FROM table_name; OR EXCLUDE FROM table_name WHERE condition;"
-
-                table_name = tokens[2]
-
-                # Ensure table exists
-                if table_name not in current_db:
-                    return f"Table '{table_name}' does not exist."
-
-                # Case 2a: Exclude all records from the table (No WHERE Clause)
-                if len(tokens) == 3:
-                    current_db[table_name] = []  # Clear all records but keep the table
-                    save_db()
-                    return f"All records excluded from '{table_name}'."
-
-                # Case 2b: Exclude specific records using WHERE condition
-                if len(tokens) > 3 and tokens[3].lower() == "where":
-                    if len(tokens) < 6 or "=" not in " ".join(tokens[4:]):
-                        return "Syntax error in WHERE clause. Expected format: EXCLUDE FROM table_name WHERE field = value;"
-
-                    # Extract condition clause
-                    condition_clause = " ".join(tokens[4:])
-                    condition_field, condition_value = condition_clause.split("=")
-                    condition_field = condition_field.strip()
-                    condition_value = condition_value.strip().strip("'")
-
-                    # Convert condition value type if necessary
-                    for record in current_db[table_name]:
-                        if condition_field in record:
-                            if isinstance(record[condition_field], int):
-                                condition_value = int(condition_value)
-                            elif isinstance(record[condition_field], float):
-                                condition_value = float(condition_value)
-                            break  # Stop checking after the first record
-
-                    # Remove matching records
-                    original_count = len(current_db[table_name])
-                    current_db[table_name] = [record for record in current_db[table_name] if record.get(condition_field) != condition_value]
-
-                    # Save and return response
-                    if len(current_db[table_name]) < original_count:
-                        save_db()
-                        return f"Excluded {original_count - len(current_db[table_name])} record(s) from '{table_name}'."
-                    else:
-                        return "No matching records found."
-
-            return "Syntax error. Use: EXCLUDE table_name; OR EXCLUDE FROM table_name WHERE condition;"
+        try:
+            statement, literals = query.parse(command)
+        except query.ParseError:
+            statement = None
+        if not isinstance(statement, query.Exclude):
+            raise ValueError("Syntax error. Use: EXCLUDE table_name; OR EXCLUDE FROM table_name WHERE condition;")
+        return run_exclude(statement, literals)
 
     elif action == "delete":
         try:
-            if "from" not in tokens or "where" not in tokens:
-                return "Syntax error. Usage: DELETE [field] FROM table_name WHERE condition;"
+            statement, literals = query.parse(command)
+        except query.ParseError:
+            statement = None
+        if not isinstance(statement, query.Delete):
+            raise ValueError("Syntax error. Usage: DELETE [field] FROM table_name WHERE condition;")
 
-            # Determine if field to delete is specified
-            field_to_delete = tokens[1].lower() if len(tokens) > 1 else None
-            table_name = tokens[3]
-            where_index = tokens.index("where")
-            condition_clause = " ".join(tokens[where_index + 1:])
+        try:
+            return run_delete(statement, literals)
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Error processing delete command: {e}")
 
-            # Handle condition parsing
-            condition_field, condition_value = condition_clause.split("=")
-            condition_field = condition_field.strip()
-            condition_value = condition_value.strip().strip("'")
+    # EXPORT TABLE name | DATABASE | SELECT ... TO path [FORMAT CSV|JSONL] [COMPRESS GZIP]
+    elif action == "export":
+        try:
+            target = exporter.parse_command(command)
+        except ValueError as e:
+            raise ValueError(f"Error: {e}")
+        if target is None:
+            raise ValueError("Syntax error. Usage: EXPORT TABLE table_name | DATABASE | SELECT ... TO path [FORMAT CSV|JSONL] [COMPRESS GZIP];")
+        kind, source, path, file_format, compress = target
 
-            if table_name in current_db:
-                deleted_count = 0
-                for record in current_db[table_name]:
-                    if record.get(condition_field) == condition_value:
-                        if field_to_delete:
-                            # Set the specified field to null
-                            record[field_to_delete] = None
-                        else:
-                            # If no specific field is provided, delete the record entirely
-                            current_db[table_name].remove(record)
-                        deleted_count += 1
-
-                # Save the changes to the file
-                save_db()
-
-                # Return response based on whether a field was deleted or the record
-                return f"{deleted_count} record(s) updated in '{table_name}' with field '{field_to_delete}' set to null." if field_to_delete else f"{deleted_count} record(s) deleted from '{table_name}'."
-            else:
-                return f"Table '{table_name}' not found."
-        
-        except Exception as e:
-            return f"Error processing delete command: {e}"
+        if current_db is None:
+            raise ValueError("No database selected. Use 'USE database_name' to select a database.")
 
+        try:
+            if kind == "database":
+                os.makedirs(path, exist_ok=True)
+                count = 0
+                for table_name, records in current_db.items():
+                    table_file = exporter.table_path(path, table_name, file_format, compress)
+                    records = live_records(records)
+                    if file_format == "CSV":
+                        records = list(records)  # The CSV header takes a pass of its own
+                    count += exporter.export_records(table_file, file_format, records, compress)
+                return f"{count} record(s) from {len(current_db)} table(s) exported to '{path}'."
+
+            if kind == "table":
+                if source not in current_db:
+                    raise ValueError(f"Table '{source}' does not exist.")
+                records = live_records(current_db[source])
+                if file_format == "CSV":
+                    records = list(records)  # The CSV header takes a pass of its own
+            else:
+                records = select_records(source)
+                if isinstance(records, dict):
+                    records = [records]
+                elif file_format == "CSV":
+                    records = list(records)  # The CSV header takes a pass of its own
+            count = exporter.export_records(path, file_format, records, compress)
+            return f"{count} record(s) exported to '{path}'."
+        except OSError as e:
+            raise ValueError(f"Error exporting database: {e}")
+
+    # VACUUM [table_name]: drop the tombstones of deleted records and rewrite the database file
+    elif action == "vacuum" and len(tokens) <= 2:
+        if current_db is None:
+            raise ValueError("No database selected. Use 'USE database_name' to select a database.")
+        if _transaction is not None:
+            raise ValueError("VACUUM cannot run inside a transaction.")
 
+        table_names = tokens[1:] or list(current_db)
+        for table_name in table_names:
+            if table_name not in current_db:
+                raise ValueError(f"Table '{table_name}' does not exist.")
 
+        removed = 0
+        for table_name in table_names:
+            tombstones = tombstone_count(table_name)
+            if tombstones:
+                record_change({"op": "vacuum", "table": table_name})
+                removed += tombstones
+        save_db()  # Rewrite the file compactly, folding in the log
+        return f"Removed {removed} deleted record(s) from {len(table_names)} table(s)."
 
- # Stop after removing the first matching record
-                    
     elif action == "count":
         if len(tokens) < 2:
-            return "Syntax error. Usage: COUNT table_name;"
+            raise ValueError("Syntax error. Usage: COUNT table_name;")
 
         table_name = tokens[1]
 
         if table_name in current_db:
-            record_count = len(current_db[table_name])
+            record_count = len(current_db[table_name]) - tombstone_count(table_name)
             return f"Table '{table_name}' contains {record_count} record(s)."
         else:
-            return f"Table '{table_name}' does not exist."
+            raise ValueError(f"Table '{table_name}' does not exist.")
         
     elif action == "show" and len(tokens) == 2 and tokens[1].lower() == "tables":
     # Show all table names
@@ -477,6 +1232,8 @@ def process_command(command):
             return f"Tables: {', '.join(table_names)}"
         else:
             return "No tables found."
+
+    raise ValueError(f"Unknown command '{tokens[0]}'.")
             
 def cli():
     print("SimpleDB CLI. Type 'exit' to quit.")
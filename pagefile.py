@@ -0,0 +1,175 @@
+"""Binary, page-based database files opened with mmap.
+
+Layout of a ``<db>.xdb`` file::
+
+    header     MAGIC, directory offset (u64), directory length (u64)
+    pages      each page is a JSON array of up to PAGE_ROWS rows or records
+    directory  JSON: {"meta": {...}, "tables": {name: {"meta": ..., "pages": [[offset, length, rows], ...]}}}
+
+Opening a file only reads the header and the directory. A page is decoded
+the first time a query touches a row on it, so USE is near-instant and
+resident memory follows the working set.
+"""
+import os
+import re
+import json
+import mmap
+import bisect
+import struct
+
+
+MAGIC = b"XDBPAGE1"
+HEADER = struct.Struct("<8sQQ")
+EXTENSION = ".xdb"
+PAGE_ROWS = 1024
+DB_NAME_PATTERN = re.compile(r"\w+")  # Database files live in the working directory, so names cannot hold a path
+
+
+def resolve(db_name):
+    """Return the file path of a database: the binary file if it exists, else the JSON file.
+
+    Raises ValueError for a name that is not a single word, such as "../cfg".
+    """
+    if not DB_NAME_PATTERN.fullmatch(db_name):
+        raise ValueError(f"Invalid database name '{db_name}'. Use only letters, digits and underscores.")
+    binary_path = f"{db_name}{EXTENSION}"
+    return binary_path if os.path.exists(binary_path) else f"{db_name}.json"
+
+
+def is_paged(db_path):
+    """Return True if a database path uses the binary page format."""
+    return bool(db_path) and db_path.endswith(EXTENSION)
+
+
+class PagedFile:
+    """A read-only, memory-mapped view of a binary database file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic = self._map[:len(MAGIC)]
+        if len(self._map) < HEADER.size or magic != MAGIC:
+            self.close()
+            raise ValueError(f"'{path}' is not a binary database file.")
+
+        _, offset, length = HEADER.unpack_from(self._map, 0)
+        directory = json.loads(self._map[offset:offset + length])
+        self.meta = directory["meta"]
+        self.tables = directory["tables"]
+
+    def table_meta(self, table_name):
+        """Return the metadata stored for a table (column definitions, ...)."""
+        return self.tables[table_name]["meta"]
+
+    def rows(self, table_name):
+        """Return a lazily decoded sequence over the rows of a table."""
+        return PagedRows(self, self.tables[table_name]["pages"])
+
+    def read_page(self, offset, length):
+        return json.loads(self._map[offset:offset + length])
+
+    def raw_page(self, offset, length):
+        return self._map[offset:offset + length]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class PagedRows:
+    """Read-only sequence of the rows of one table, decoded page by page."""
+
+    def __init__(self, pagefile, pages):
+        self.pagefile = pagefile
+        self.pages = pages
+        self._starts = []
+        total = 0
+        for _, _, count in pages:
+            self._starts.append(total)
+            total += count
+        self._length = total
+        self._cached = (None, None)  # (page number, decoded rows)
+
+    def __len__(self):
+        return self._length
+
+    def _page(self, number):
+        if self._cached[0] != number:
+            offset, length, _ = self.pages[number]
+            self._cached = (number, self.pagefile.read_page(offset, length))
+        return self._cached[1]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._length
+        if not 0 <= i < self._length:
+            raise IndexError("row index out of range")
+        number = bisect.bisect_right(self._starts, i) - 1
+        return self._page(number)[i - self._starts[number]]
+
+    def __iter__(self):
+        for offset, length, _ in self.pages:
+            yield from self.pagefile.read_page(offset, length)
+
+    def take(self, positions):
+        """Return the rows at ``positions``, in that order, decoding each page they fall on only once.
+
+        Only one decoded page is kept, so fetching rows in index order one
+        by one could decode the same page again for nearly every row.
+        """
+        positions = list(positions)
+        rows = {i: self[i] for i in sorted(set(positions))}
+        return [rows[i] for i in positions]
+
+
+def write(path, tables, meta, previous=None):
+    """Write a binary database file and return it opened.
+
+    ``tables`` maps each table name to ``(table_meta, rows)``. Tables whose
+    rows are still an undecoded PagedRows of ``previous`` have their pages
+    copied verbatim. ``previous`` is closed before the new file replaces it.
+    """
+    tmp_path = path + ".tmp"
+    directory = {"meta": meta, "tables": {}}
+
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, 0, 0))
+
+        for table_name, (table_meta, rows) in tables.items():
+            pages = []
+            if isinstance(rows, PagedRows) and rows.pagefile is previous:
+                for offset, length, count in rows.pages:
+                    pages.append([f.tell(), length, count])
+                    f.write(previous.raw_page(offset, length))
+            else:
+                chunk = []
+                for row in rows:
+                    chunk.append(row)
+                    if len(chunk) == PAGE_ROWS:
+                        pages.append(_write_page(f, chunk))
+                        chunk = []
+                if chunk:
+                    pages.append(_write_page(f, chunk))
+            directory["tables"][table_name] = {"meta": table_meta, "pages": pages}
+
+        data = json.dumps(directory, separators=(",", ":")).encode()
+        offset = f.tell()
+        f.write(data)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, offset, len(data)))
+        f.flush()
+        os.fsync(f.fileno())
+
+    if previous is not None:
+        previous.close()
+    os.replace(tmp_path, path)
+    return PagedFile(path)
+
+
+def _write_page(f, rows):
+    data = json.dumps(rows, separators=(",", ":")).encode()
+    offset = f.tell()
+    f.write(data)
+    return [offset, len(data), len(rows)]
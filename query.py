@@ -0,0 +1,478 @@
+"""Lexer and parser shared by the SQL and NoSQL engines.
+
+Statements are split into tokens once and parsed into small, immutable AST
+nodes. Number and string literals are lifted out of the token stream and
+replaced by Param placeholders, so statements that differ only in their
+literals normalize to the same text. Parsed statements are kept in an LRU
+cache keyed by that text; repeated statements only pay for tokenizing.
+
+Literal values are handed to the engines as the text written in the
+statement (quotes removed); each engine converts them to the type of the
+column or field they are compared with. A "?" is a parameter: it parses
+like a literal, and its value is supplied when a prepared statement is
+executed (see bind_parameters()).
+"""
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+
+CACHE_SIZE = 256
+
+TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+        '(?P<single>[^']*)'
+      | "(?P<double>[^"]*)"
+      | (?P<operator><=|>=|!=|<>|=|<|>)
+      | (?P<punct>[(),;])
+      | (?P<parameter>\?)
+      | (?P<word>[^\s,()=<>!'";?]+)
+    )""", re.VERBOSE)
+NUMBER_PATTERN = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+INTEGER_PATTERN = re.compile(r"[-+]?\d+")
+SCRIPT_PATTERN = re.compile(r"""'[^']*'?|"[^"]*"?|;|[^;'"]+""")
+
+COMPARISON_OPERATORS = ["=", "!=", "<", "<=", ">", ">=", "between", "in", "like", "is null"]
+
+PARAMETER = object()  # Stands in the literals for a "?" until a value is bound
+
+# AST nodes
+Param = namedtuple("Param", "index")  # A literal lifted out of the statement, see bind()
+Aggregate = namedtuple("Aggregate", "function argument")  # argument is None for COUNT(*)
+Comparison = namedtuple("Comparison", "column operator operands")  # operator is one of COMPARISON_OPERATORS
+And = namedtuple("And", "operands")
+Or = namedtuple("Or", "operands")
+Not = namedtuple("Not", "operand")
+Join = namedtuple("Join", "table left right")  # JOIN table ON left = right
+Select = namedtuple("Select", "fields table join where group_by order_by descending limit offset")  # fields is None for ALL
+Update = namedtuple("Update", "table column value where")
+Exclude = namedtuple("Exclude", "table where drop")  # EXCLUDE table drops it; EXCLUDE FROM table [WHERE ...] deletes rows
+Delete = namedtuple("Delete", "field table where")  # NoSQL DELETE [field] FROM table WHERE ...
+
+_cache = OrderedDict()  # normalized statement text -> AST
+_cache_lock = threading.Lock()
+
+
+class ParseError(ValueError):
+    """Raised for statements the parser cannot make sense of."""
+
+
+def tokenize(text):
+    """Split a statement into (kind, text) tokens and lift out its literals.
+
+    Returns (tokens, literals): number and string literals appear in
+    ``tokens`` as ("literal", i) and their text is ``literals[i]``. A "?"
+    is also a literal, with PARAMETER as its value.
+    """
+    tokens, literals = [], []
+    position, end = 0, len(text.rstrip())
+    while position < end:
+        match = TOKEN_PATTERN.match(text, position)
+        if match is None:
+            raise ParseError(f"Unexpected character '{text[position]}'.")
+        position = match.end()
+
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "parameter":
+            tokens.append(("literal", len(literals)))
+            literals.append(PARAMETER)
+        elif kind in ("single", "double") or (kind == "word" and NUMBER_PATTERN.fullmatch(value)):
+            tokens.append(("literal", len(literals)))
+            literals.append(value)
+        else:
+            tokens.append((kind, "!=" if value == "<>" else value))
+    return tokens, literals
+
+
+def split_script(text):
+    """Split a script into its statements at the semicolons outside quoted strings, dropping empty ones."""
+    statements, current = [], []
+    for match in SCRIPT_PATTERN.finditer(text):
+        if match.group() == ";":
+            statements.append("".join(current))
+            current = []
+        else:
+            current.append(match.group())
+    statements.append("".join(current))
+    return [statement.strip() for statement in statements if statement.strip()]
+
+
+def normalize(tokens):
+    """Return the cache key of a token stream: its text with every literal replaced by '?'."""
+    return " ".join("?" if kind == "literal" else value for kind, value in tokens)
+
+
+def parse(text, parameters=False):
+    """Return (statement AST, literal values) for a statement, reusing cached ASTs.
+
+    Raises ParseError on a syntax error, or if the statement has "?"
+    parameters and ``parameters`` is False.
+    """
+    tokens, literals = tokenize(text)
+    if not parameters and PARAMETER in literals:
+        raise ParseError("Parameters ('?') are only allowed in prepared statements.")
+    key = normalize(tokens)
+    with _cache_lock:
+        statement = _cache.get(key)
+        if statement is not None:
+            _cache.move_to_end(key)
+            return statement, literals
+
+    parser = Parser(tokens, literals)
+    statement = parser.statement()
+    if parser.cacheable:
+        with _cache_lock:
+            _cache[key] = statement
+            if len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+    return statement, literals
+
+
+def bind(value, literals):
+    """Return the text of a value node: a Param is looked up in ``literals``, a bare word is returned as is."""
+    return literals[value.index] if isinstance(value, Param) else value
+
+
+def bind_parameters(literals, params):
+    """Return a copy of ``literals`` with its "?" parameters replaced by ``params``, in order.
+
+    Raises ValueError if the number of values does not match.
+    """
+    slots = [i for i, value in enumerate(literals) if value is PARAMETER]
+    if len(params) != len(slots):
+        raise ValueError(f"Expected {len(slots)} parameter(s) but got {len(params)}.")
+    bound = list(literals)
+    for i, value in zip(slots, params):
+        bound[i] = value
+    return bound
+
+
+def comparisons(condition):
+    """Yield every Comparison in a WHERE condition."""
+    if isinstance(condition, Comparison):
+        yield condition
+    elif isinstance(condition, Not):
+        yield from comparisons(condition.operand)
+    else:
+        for operand in condition.operands:
+            yield from comparisons(operand)
+
+
+def map_columns(condition, function):
+    """Return a copy of a WHERE condition with each column name replaced by function(name)."""
+    if isinstance(condition, Comparison):
+        return condition._replace(column=function(condition.column))
+    if isinstance(condition, Not):
+        return Not(map_columns(condition.operand, function))
+    return type(condition)(tuple(map_columns(operand, function) for operand in condition.operands))
+
+
+def like_pattern(pattern):
+    """Compile a LIKE pattern (% matches any run of characters, _ any single one) to a regex."""
+    parts = ("." * len(part) if part[0] == "_" else ".*" if part[0] == "%" else re.escape(part)
+             for part in re.findall(r"%+|_+|[^%_]+", pattern))
+    return re.compile("".join(parts), re.DOTALL)
+
+
+def value_predicate(operator, operands):
+    """Return a function value -> bool testing `value operator operands`.
+
+    A missing value (None) only matches IS NULL, and a value of a type that
+    cannot be compared with the operands does not match.
+    """
+    if operator == "is null":
+        return lambda x: x is None
+    if operator == "like":
+        regex = like_pattern(str(operands[0]))
+        return lambda x: x is not None and regex.fullmatch(x if isinstance(x, str) else str(x)) is not None
+    if operator == "in":
+        try:
+            values = set(operands)
+        except TypeError:  # Unhashable operands
+            values = list(operands)
+    elif operator == "between":
+        low, high = operands
+    else:
+        value = operands[0]
+
+    compare = {
+        "=": lambda x: x == value,
+        "!=": lambda x: x != value,
+        "<": lambda x: x < value,
+        "<=": lambda x: x <= value,
+        ">": lambda x: x > value,
+        ">=": lambda x: x >= value,
+        "between": lambda x: low <= x <= high,
+        "in": lambda x: x in values,
+    }[operator]
+
+    def predicate(x):
+        if x is None:
+            return False
+        try:
+            return compare(x)
+        except TypeError:
+            return False
+    return predicate
+
+
+def compile_condition(condition, compile_comparison):
+    """Compile a WHERE condition into a single predicate function.
+
+    ``compile_comparison(comparison)`` returns the predicate of one
+    Comparison; AND, OR and NOT are combined here into nested closures, so
+    nothing is interpreted per row.
+    """
+    if isinstance(condition, Comparison):
+        return compile_comparison(condition)
+    if isinstance(condition, Not):
+        operand = compile_condition(condition.operand, compile_comparison)
+        return lambda item: not operand(item)
+
+    operands = [compile_condition(operand, compile_comparison) for operand in condition.operands]
+    predicate = operands[0]
+    for operand in operands[1:]:
+        if isinstance(condition, And):
+            predicate = (lambda a, b: lambda item: a(item) and b(item))(predicate, operand)
+        else:
+            predicate = (lambda a, b: lambda item: a(item) or b(item))(predicate, operand)
+    return predicate
+
+
+def bind_limit(select, literals):
+    """Return the (offset, limit) of a SELECT as ints, limit being None without LIMIT. Raises ValueError."""
+    try:
+        offset = 0 if select.offset is None else int(bind(select.offset, literals))
+        limit = None if select.limit is None else int(bind(select.limit, literals))
+    except (TypeError, ValueError):
+        offset = limit = -1
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ValueError("LIMIT and OFFSET must be non-negative integers.")
+    return offset, limit
+
+
+def label(field):
+    """Return the display name of a selected field, e.g. "age" or "count(*)"."""
+    if isinstance(field, Aggregate):
+        return f"{field.function}({field.argument or '*'})"
+    return field
+
+
+class Parser:
+    """Recursive-descent parser over the tokens of one statement."""
+
+    def __init__(self, tokens, literals):
+        self.tokens = tokens
+        self.literals = literals
+        self.position = 0
+        self.cacheable = True  # False once a literal was used as a name, see name()
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def advance(self):
+        token = self.peek()
+        if token[0] is None:
+            raise ParseError("Unexpected end of statement.")
+        self.position += 1
+        return token
+
+    def accept(self, *keywords):
+        """Consume the next token if it is one of the keywords (case-insensitive) and return it lowercased."""
+        kind, value = self.peek()
+        if kind == "word" and value.lower() in keywords:
+            self.position += 1
+            return value.lower()
+        return None
+
+    def expect(self, keyword):
+        if not self.accept(keyword):
+            raise ParseError(f"Expected {keyword.upper()}.")
+
+    def punct(self, symbol):
+        if self.peek() == ("punct", symbol):
+            self.position += 1
+            return True
+        return False
+
+    def name(self):
+        """Parse a table, column or field name."""
+        kind, value = self.advance()
+        if kind == "word":
+            return value
+        if kind == "literal" and self.literals[value] is not PARAMETER:
+            # A name that looks like a number; the AST now depends on the literal, so don't cache it
+            self.cacheable = False
+            return self.literals[value]
+        raise ParseError(f"Expected a name but got '{value}'.")
+
+    def value(self):
+        """Parse a literal (returned as a Param) or a bare word used as a value."""
+        kind, value = self.advance()
+        if kind == "literal":
+            return Param(value)
+        if kind == "word":
+            return value
+        raise ParseError(f"Expected a value but got '{value}'.")
+
+    def statement(self):
+        kind, value = self.peek()
+        keyword = value.lower() if kind == "word" else None
+        parse = {
+            "select": self.select,
+            "update": self.update,
+            "exclude": self.exclude,
+            "delete": self.delete,
+        }.get(keyword)
+        if parse is None:
+            raise ParseError(f"Unsupported statement '{value}'.")
+        self.position += 1
+        statement = parse()
+
+        self.punct(";")
+        if self.peek()[0] is not None:
+            raise ParseError(f"Unexpected '{self.peek()[1]}'.")
+        return statement
+
+    def select(self):
+        """SELECT ALL | field, ... FROM table [[INNER] JOIN table ON column = column] [WHERE condition]
+        [GROUP BY field] [ORDER BY field [ASC|DESC]] [LIMIT count] [OFFSET count]"""
+        if self.accept("all") or self.accept("*"):
+            fields = None
+        else:
+            fields = [self.field()]
+            while self.punct(","):
+                fields.append(self.field())
+            fields = tuple(fields)
+
+        self.expect("from")
+        table = self.name()
+
+        join = None
+        inner = self.accept("inner")
+        if self.accept("join"):
+            join_table = self.name()
+            self.expect("on")
+            left = self.name()
+            if self.advance() != ("operator", "="):
+                raise ParseError("Expected '=' in JOIN condition.")
+            join = Join(join_table, left, self.name())
+        elif inner:
+            raise ParseError("Expected JOIN.")
+
+        where = self.where() if self.accept("where") else None
+
+        group_by = order_by = limit = offset = None
+        descending = False
+        while True:
+            if self.accept("group"):
+                self.expect("by")
+                group_by = self.name()
+            elif self.accept("order"):
+                self.expect("by")
+                order_by = label(self.field())
+                descending = self.accept("asc", "desc") == "desc"
+            elif self.accept("limit"):
+                limit = self.value()
+            elif self.accept("offset"):
+                offset = self.value()
+            else:
+                break
+        return Select(fields, table, join, where, group_by, order_by, descending, limit, offset)
+
+    def field(self):
+        """A field name or an aggregate such as count(*) or avg(age)."""
+        name = self.name()
+        if not self.punct("("):
+            return name
+        argument = None if self.accept("*") else self.name()
+        if not self.punct(")"):
+            raise ParseError("Expected ')'.")
+        return Aggregate(name, argument)
+
+    def where(self):
+        """condition {OR condition}, where AND binds tighter than OR and NOT tighter than AND"""
+        operands = [self.conjunction()]
+        while self.accept("or"):
+            operands.append(self.conjunction())
+        return operands[0] if len(operands) == 1 else Or(tuple(operands))
+
+    def conjunction(self):
+        operands = [self.negation()]
+        while self.accept("and"):
+            operands.append(self.negation())
+        return operands[0] if len(operands) == 1 else And(tuple(operands))
+
+    def negation(self):
+        if self.accept("not"):
+            return Not(self.negation())
+        if self.punct("("):
+            condition = self.where()
+            if not self.punct(")"):
+                raise ParseError("Expected ')'.")
+            return condition
+        return self.comparison()
+
+    def comparison(self):
+        """column operator value | column [NOT] BETWEEN low AND high | column [NOT] IN (value, ...)
+        | column [NOT] LIKE pattern | column IS [NOT] NULL"""
+        column = self.name()
+        if self.accept("is"):
+            negated = self.accept("not")
+            self.expect("null")
+            comparison = Comparison(column, "is null", ())
+            return Not(comparison) if negated else comparison
+
+        negated = self.accept("not")
+        if self.accept("between"):
+            low = self.value()
+            self.expect("and")
+            comparison = Comparison(column, "between", (low, self.value()))
+        elif self.accept("in"):
+            if not self.punct("("):
+                raise ParseError("Expected '(' after IN.")
+            values = [self.value()]
+            while self.punct(","):
+                values.append(self.value())
+            if not self.punct(")"):
+                raise ParseError("Expected ')'.")
+            comparison = Comparison(column, "in", tuple(values))
+        elif self.accept("like"):
+            comparison = Comparison(column, "like", (self.value(),))
+        elif negated:
+            raise ParseError("Expected BETWEEN, IN or LIKE after NOT.")
+        else:
+            kind, operator = self.advance()
+            if kind != "operator":
+                raise ParseError(f"Unsupported operator '{operator}'.")
+            comparison = Comparison(column, operator, (self.value(),))
+        return Not(comparison) if negated else comparison
+
+    def update(self):
+        """UPDATE table SET column = value WHERE condition"""
+        table = self.name()
+        self.expect("set")
+        column = self.name()
+        if self.advance() != ("operator", "="):
+            raise ParseError("Expected '=' in SET clause.")
+        value = self.value()
+        self.expect("where")
+        return Update(table, column, value, self.where())
+
+    def exclude(self):
+        """EXCLUDE table | EXCLUDE FROM table [WHERE condition]"""
+        if not self.accept("from"):
+            return Exclude(self.name(), None, True)
+        table = self.name()
+        where = self.where() if self.accept("where") else None
+        return Exclude(table, where, False)
+
+    def delete(self):
+        """DELETE [field] FROM table WHERE condition"""
+        field = None if self.accept("from") else self.name()
+        if field is not None:
+            self.expect("from")
+        table = self.name()
+        self.expect("where")
+        return Delete(field, table, self.where())
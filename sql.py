@@ -1,40 +1,1232 @@
 import os
 import json
+import math
 import re
 import csv
+import shlex
 import platform
+import bisect
+import copy
+import heapq
+import itertools
+from collections import namedtuple
+
+import wal
+import columnar
+import pagefile
+import exporter
+import query
+import cursor
+import connection
 
 
 current_db = None
 current_db_file = None
+# "wal" appends each change to <db>.wal and checkpoints in the background;
+# "snapshot" rewrites the whole <db>.json after every change.
+STORAGE_MODE = "wal"
+_wal_lsn = 0
+_pagefile = None  # Open PagedFile when the current database uses the binary format
+_sorted_indexes = {}  # table -> column -> sorted [(value, row position), ...]
+_column_positions = {}  # table -> column -> position of its value in a row, computed at MAKE and load
+_transaction = None  # Changes queued since BEGIN, None outside a transaction
+_transaction_tables = []  # Table names in order at BEGIN
+_transaction_backups = {}  # table -> table state before the transaction first changed it
 SUPPORTED_TYPES = ["INT", "FLOAT", "TEXT", "TIMESTAMP"] 
+ORDERED_INDEX_TYPES = ["INT", "FLOAT", "TIMESTAMP"]
+COMPARISON_OPERATORS = ["=", "!=", "<", "<=", ">", ">=", "between", "in", "like", "is null"]
+RANGE_OPERATORS = ["=", "<", "<=", ">", ">=", "between"]  # Answered by an ordered index
+STORAGE_ENGINES = ["row", "columnar"]
+AGGREGATE_FUNCTIONS = ["COUNT", "SUM", "AVG", "MIN", "MAX"]
+DATABASE_FORMATS = ["json", "binary"]
+SELECT_USAGE = "Syntax error. Use: SELECT [ALL | col1, col2, ... | COUNT(*), SUM(col), AVG(col), MIN(col), MAX(col)] FROM table_name [JOIN table_name ON col = col] [WHERE condition [AND|OR condition ...]] [GROUP BY col] [ORDER BY col [ASC|DESC]] [LIMIT n] [OFFSET n]"
+IMPORT_FORMATS = ["CSV", "JSONL"]
+IMPORT_CHUNK_ROWS = 10000
 def handle_sql_query(query):
     # Simple placeholder for actual SQL handling logic
     return f"[SQL] You entered: {query}"
 
 
+# Everything that belongs to the current database, kept while it is parked in _open_databases
+OpenDatabase = namedtuple("OpenDatabase", "db db_file lsn pagefile sorted_indexes column_positions transaction transaction_tables transaction_backups")
+
+def close_parked(state):
+    """Release a database evicted from the cache of open databases."""
+    if state.pagefile is not None:
+        state.pagefile.close()
+
+_open_databases = connection.DatabaseCache(close_parked, pinned=lambda state: state.transaction is not None)
+
 def load_db(db_name):
-    """Load the database file into memory."""
-    global current_db, current_db_file
-    db_path = f"{db_name}.json"
-    
-    if os.path.exists(db_path):
-        with open(db_path, "r") as f:
-            try:
-                current_db = json.load(f)
-            except json.JSONDecodeError:
-                current_db = {}
+    """Make a database the current one; see open_db()."""
+    open_db(pagefile.resolve(db_name))
+
+def open_db(db_path):
+    """Make the database stored at db_path the current one.
+
+    A database still parked in _open_databases is swapped back in as it was
+    left, open transaction included. Otherwise the file is loaded into memory
+    and its write-ahead log replayed; binary databases are memory-mapped and
+    their rows decoded on first use.
+    """
+    global current_db, current_db_file, _wal_lsn, _pagefile, _sorted_indexes, _column_positions
+    global _transaction, _transaction_tables, _transaction_backups
+    if db_path == current_db_file:
+        return
+    park_db()
+
+    state = _open_databases.take(db_path)
+    if state is not None:
+        (current_db, current_db_file, _wal_lsn, _pagefile, _sorted_indexes, _column_positions,
+         _transaction, _transaction_tables, _transaction_backups) = state
+        return
+
+    wal.wait(db_path)
+
+    if pagefile.is_paged(db_path):
+        _pagefile = pagefile.PagedFile(db_path)
+        current_db = {
+            table_name: {**_pagefile.table_meta(table_name), "data": _pagefile.rows(table_name)}
+            for table_name in _pagefile.tables
+        }
+        _wal_lsn = _pagefile.meta.get("lsn", 0)
     else:
-        current_db = {}
+        if os.path.exists(db_path):
+            with open(db_path, "r") as f:
+                try:
+                    current_db = json.load(f)
+                except json.JSONDecodeError:
+                    current_db = {}
+        else:
+            current_db = {}
+
+        _wal_lsn = current_db.pop(wal.META_KEY, {}).get("lsn", 0)
+        for table_info in current_db.values():
+            table_info["data"] = new_table_data(table_info, table_info["data"])
 
     current_db_file = db_path
+    _sorted_indexes = {}  # Indexes are built on first use, see table_indexes()
+    _column_positions = {table_name: column_map(table_info["columns"]) for table_name, table_info in current_db.items()}
+
+    for lsn, change in wal.replay(db_path, _wal_lsn):
+        apply_change(change)
+        _wal_lsn = lsn
+
+    if wal.has_pending(db_path):
+        save_db()  # Finish a checkpoint interrupted by a previous run
+
+def park_db():
+    """Move the current database into _open_databases, leaving no database selected."""
+    global current_db, current_db_file, _wal_lsn, _pagefile, _sorted_indexes, _column_positions
+    global _transaction, _transaction_tables, _transaction_backups
+    if current_db_file is not None and current_db is not None:
+        _open_databases.park(current_db_file, OpenDatabase(
+            current_db, current_db_file, _wal_lsn, _pagefile, _sorted_indexes, _column_positions,
+            _transaction, _transaction_tables, _transaction_backups,
+        ))
+    current_db = current_db_file = _pagefile = _transaction = None
+    _wal_lsn = 0
+    _sorted_indexes = {}
+    _column_positions = {}
+    _transaction_tables = []
+    _transaction_backups = {}
 
 def save_db():
     """Save the database to the JSON file."""
     if current_db_file:
-        with open(current_db_file, "w") as f:
-            json.dump(current_db, f, indent=4)
+        if pagefile.is_paged(current_db_file):
+            save_paged()
+        elif STORAGE_MODE == "wal":
+            wal.checkpoint(current_db_file, current_db, {"lsn": _wal_lsn}, background=False, default=json_default)
+        else:
+            with open(current_db_file, "w") as f:
+                json.dump(current_db, f, indent=4, default=json_default)
+
+def save_paged():
+    """Rewrite the binary database file, copying the pages of tables that were never decoded."""
+    global _pagefile
+    tables = {
+        table_name: ({k: v for k, v in table_info.items() if k != "data"}, table_info["data"])
+        for table_name, table_info in current_db.items()
+    }
+    _pagefile = pagefile.write(current_db_file, tables, {"lsn": _wal_lsn}, previous=_pagefile)
+
+    for table_name, table_info in current_db.items():
+        if isinstance(table_info["data"], pagefile.PagedRows):
+            table_info["data"] = _pagefile.rows(table_name)
+    wal.remove(current_db_file)
+
+def close_pagefile():
+    """Unmap the binary file of the current database, if any."""
+    global _pagefile
+    if _pagefile is not None:
+        _pagefile.close()
+        _pagefile = None
+
+def json_default(obj):
+    """json.dump hook that writes columnar and paged table data as lists of rows."""
+    if isinstance(obj, (columnar.ColumnStore, pagefile.PagedRows)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def convert_value(column_type, value):
+    """Convert a literal from a command, or a bound parameter, to the Python type of a column; raises ValueError."""
+    if column_type == "INT":
+        if isinstance(value, float):
+            raise ValueError(f"Expected an integer but got {value}.")
+        return int(value)
+    elif column_type == "FLOAT":
+        return float(value)
+    return value.strip("'\"") if isinstance(value, str) else str(value)
+
+def convert_import_value(column_type, value):
+    """Convert a CSV cell or JSONL value read by IMPORT to the Python type of a column; raises ValueError.
+
+    Unlike convert_value() nothing is coerced: an INT takes an integer or
+    text spelling one in full, a FLOAT any finite number, TEXT and
+    TIMESTAMP only text. Nulls and booleans are rejected.
+    """
+    if value is None or isinstance(value, bool):
+        raise ValueError(f"Expected {column_type} but got {json.dumps(value)}.")
+    if isinstance(value, str):
+        if column_type in ("TEXT", "TIMESTAMP"):
+            return value
+        text = value.strip()
+        if column_type == "INT" and query.INTEGER_PATTERN.fullmatch(text):
+            return int(text)
+        if column_type == "FLOAT" and query.NUMBER_PATTERN.fullmatch(text):
+            return float(text)
+    elif column_type == "INT" and isinstance(value, int):
+        return value
+    elif column_type == "FLOAT" and isinstance(value, (int, float)) and math.isfinite(value):
+        return float(value)
+    raise ValueError(f"Expected {column_type} but got {value!r}.")
+
+def new_table_data(table_info, rows=()):
+    """Return the row container for a table: a list of row tuples, or a ColumnStore for columnar tables."""
+    if table_info.get("engine") == "columnar":
+        return columnar.ColumnStore([table_info["types"][c] for c in table_info["columns"]], rows)
+    return list(map(tuple, rows))
+
+def column_map(columns):
+    """Return {column: position} for rows laid out in the order of ``columns``."""
+    return {column: i for i, column in enumerate(columns)}
+
+def materialize(table_name):
+    """Decode a table read lazily from a binary file so it can be modified."""
+    table_info = current_db[table_name]
+    if isinstance(table_info["data"], pagefile.PagedRows):
+        table_info["data"] = new_table_data(table_info, table_info["data"])
+
+def fetch_rows(table_data, positions):
+    """Return the rows at ``positions`` in that order; rows of a binary table are decoded page by page."""
+    if isinstance(table_data, pagefile.PagedRows):
+        return table_data.take(positions)
+    return [table_data[i] for i in positions]
+
+def table_indexes(table_name):
+    """Return the ordered indexes of a table, building them on first use."""
+    if table_name not in _sorted_indexes:
+        rebuild_indexes(table_name)
+    return _sorted_indexes[table_name]
+
+def rebuild_indexes(table_name):
+    """Rebuild the ordered indexes of a table from its rows."""
+    table_info = current_db[table_name]
+    indexes = {}
+    for column in table_info.get("indexes", []):
+        column_index = _column_positions[table_name][column]
+        indexes[column] = sorted((row[column_index], i) for i, row in enumerate(table_info["data"]))
+    _sorted_indexes[table_name] = indexes  # Published whole, as concurrent readers may build them too
+
+def index_positions(index, operator, operands):
+    """Return row positions in index order for `column operator operands` using bisection."""
+    if operator == "between":
+        low, high = operands
+    elif operator in ("=", ">=", ">"):
+        low, high = operands[0], operands[0] if operator == "=" else None
+    else:
+        low, high = None, operands[0]
+
+    if low is None:
+        start = 0
+    elif operator == ">":
+        start = bisect.bisect_right(index, (low, float("inf")))
+    else:
+        start = bisect.bisect_left(index, (low,))
+
+    if high is None:
+        end = len(index)
+    elif operator == "<":
+        end = bisect.bisect_left(index, (high,))
+    else:
+        end = bisect.bisect_right(index, (high, float("inf")))
+
+    return [pos for _, pos in index[start:end]]
+
+def convert_operands(column_type, operator, operands):
+    """Convert the operands of a comparison to the type of its column; LIKE patterns stay text. Raises ValueError."""
+    if operator == "like":
+        return [str(value) for value in operands]
+    return [convert_value(column_type, value) for value in operands]
+
+def find_positions(table_name, column, operator, operands, limit=None):
+    """Return positions of rows matching `column operator operands`.
+
+    Positions come back in index order when the column has an ordered index
+    and the operator is one of RANGE_OPERATORS, otherwise in table order.
+    ``limit`` stops a row-by-row scan after that many matches.
+    """
+    table_info = current_db[table_name]
+    operands = convert_operands(table_info["types"][column], operator, operands)
+    if operator in RANGE_OPERATORS:
+        index = table_indexes(table_name).get(column)
+        if index is not None:
+            return index_positions(index, operator, operands)
+
+    column_index = _column_positions[table_name][column]
+    if isinstance(table_info["data"], columnar.ColumnStore):
+        return table_info["data"].positions(column_index, operator, operands)
+
+    matches = query.value_predicate(operator, operands)
+    return list(itertools.islice((i for i, row in enumerate(table_info["data"]) if matches(row[column_index])), limit))
+
+def compile_predicate(table_info, column_positions, where, literals):
+    """Compile a parsed WHERE condition into a function row -> bool, converting its literals once. Raises ValueError."""
+    def compile_comparison(comparison):
+        column_index = column_positions[comparison.column]
+        operands = [query.bind(value, literals) for value in comparison.operands]
+        matches = query.value_predicate(comparison.operator, convert_operands(table_info["types"][comparison.column], comparison.operator, operands))
+        return lambda row: matches(row[column_index])
+
+    return query.compile_condition(where, compile_comparison)
+
+def condition_mask(table_name, where, literals):
+    """Evaluate a parsed WHERE condition over a columnar table as one NumPy boolean mask. Raises ValueError."""
+    table_info = current_db[table_name]
+    table_data = table_info["data"]
+    if isinstance(where, query.Comparison):
+        operands = [query.bind(value, literals) for value in where.operands]
+        operands = convert_operands(table_info["types"][where.column], where.operator, operands)
+        return table_data.mask(_column_positions[table_name][where.column], where.operator, operands)
+    if isinstance(where, query.Not):
+        return ~condition_mask(table_name, where.operand, literals)
+
+    masks = [condition_mask(table_name, operand, literals) for operand in where.operands]
+    mask = masks[0]
+    for other in masks[1:]:
+        mask = mask & other if isinstance(where, query.And) else mask | other
+    return mask
+
+def apply_change(change):
+    """Apply one logged change to the in-memory database."""
+    op = change["op"]
+    table_name = change["table"]
+    indexes = _sorted_indexes.get(table_name, {})  # Only indexes already built need maintenance
+
+    if op in ("insert", "delete", "update"):
+        materialize(table_name)
+
+    if op == "make":
+        table_info = {"columns": change["columns"], "types": change["types"]}
+        if change.get("engine", "row") != "row":
+            table_info["engine"] = change["engine"]
+        table_info["data"] = new_table_data(table_info)
+        current_db[table_name] = table_info
+        _sorted_indexes[table_name] = {}
+        _column_positions[table_name] = column_map(table_info["columns"])
+    elif op == "insert":
+        table_data = current_db[table_name]["data"]
+        start = len(table_data)
+        # Store the rows first: a columnar extend can still reject a value, and then no index may have changed
+        table_data.extend(map(tuple, change["rows"]))
+        for column, index in indexes.items():
+            column_index = _column_positions[table_name][column]
+            for i, row in enumerate(change["rows"], start=start):
+                bisect.insort(index, (row[column_index], i))
+    elif op == "drop":
+        del current_db[table_name]
+        _sorted_indexes.pop(table_name, None)
+        _column_positions.pop(table_name, None)
+    elif op == "truncate":
+        current_db[table_name]["data"] = new_table_data(current_db[table_name])
+        for index in indexes.values():
+            index.clear()
+    elif op == "delete":
+        positions = set(change["positions"])
+        table_data = current_db[table_name]["data"]
+        if isinstance(table_data, columnar.ColumnStore):
+            table_data.delete(positions)
+        else:
+            table_data[:] = [row for i, row in enumerate(table_data) if i not in positions]
+
+        # Shift the surviving index entries down past the deleted rows
+        deleted = sorted(positions)
+        for index in indexes.values():
+            index[:] = [(value, i - bisect.bisect_left(deleted, i)) for value, i in index if i not in positions]
+    elif op == "update":
+        table_info = current_db[table_name]
+        table_data = table_info["data"]
+        column_index, value = change["column"], change["value"]
+        index = indexes.get(table_info["columns"][column_index])
+        is_columnar = isinstance(table_data, columnar.ColumnStore)
+        for i in change["positions"]:
+            old_value = table_data.get(i, column_index) if is_columnar else table_data[i][column_index]
+            if is_columnar:
+                table_data.set_value(i, column_index, value)  # May raise OverflowError, before the index is touched
+            else:
+                # Rows are tuples, replaced rather than modified, so a shallow copy of the table stays a snapshot
+                row = table_data[i]
+                table_data[i] = row[:column_index] + (value,) + row[column_index + 1:]
+            if index is not None:
+                index.pop(bisect.bisect_left(index, (old_value, i)))
+                bisect.insort(index, (value, i))
+    elif op == "create_index":
+        current_db[table_name].setdefault("indexes", []).append(change["column"])
+        rebuild_indexes(table_name)
+    elif op == "drop_index":
+        current_db[table_name]["indexes"].remove(change["column"])
+        indexes.pop(change["column"], None)
+
+def record_change(change):
+    """Apply a change and persist it according to STORAGE_MODE.
+
+    Inside a transaction the change is only applied in memory and queued until COMMIT.
+    """
+    if _transaction is not None:
+        backup_table(change["table"])
+        apply_change(change)
+        _transaction.append(change)
+        return
+
+    apply_change(change)
+    persist_changes([change])
+
+def backup_table(table_name):
+    """Remember the state of a table before the open transaction first changes it."""
+    if table_name in _transaction_backups:
+        return
+
+    table_info = current_db.get(table_name)
+    if table_info is not None:
+        table_info = dict(table_info)
+        if "indexes" in table_info:
+            table_info["indexes"] = list(table_info["indexes"])
+        if isinstance(table_info["data"], columnar.ColumnStore):
+            table_info["data"] = copy.deepcopy(table_info["data"])
+        elif isinstance(table_info["data"], list):
+            table_info["data"] = list(table_info["data"])  # Rows themselves are never modified in place
+    _transaction_backups[table_name] = table_info
+
+def in_transaction():
+    """Return True while a transaction is open on the current database."""
+    return _transaction is not None
+
+def begin_transaction():
+    global _transaction, _transaction_tables
+    _transaction = []
+    _transaction_tables = list(current_db)
+    _transaction_backups.clear()
+
+def commit_transaction(snapshot=False):
+    """Persist every change made since BEGIN with a single write.
+
+    With ``snapshot`` the whole database is saved instead of logging the
+    changes, which is cheaper for bulk loads.
+    """
+    global _transaction
+    changes, _transaction = _transaction, None
+    _transaction_backups.clear()
+    if changes and snapshot:
+        save_db()
+    elif changes:
+        persist_changes(changes)
+    return len(changes)
+
+def rollback_transaction():
+    """Restore every table changed since BEGIN."""
+    global _transaction
+    _transaction = None
+    for table_name, table_info in _transaction_backups.items():
+        if table_info is None:
+            current_db.pop(table_name, None)
+            _column_positions.pop(table_name, None)
+        else:
+            current_db[table_name] = table_info
+            _column_positions[table_name] = column_map(table_info["columns"])
+        _sorted_indexes.pop(table_name, None)  # Rebuilt on next use
+    _transaction_backups.clear()
+
+    # Put restored tables back in their original order
+    tables = {table_name: current_db[table_name] for table_name in _transaction_tables if table_name in current_db}
+    tables.update(current_db)
+    current_db.clear()
+    current_db.update(tables)
+
+def persist_changes(changes):
+    """Write applied changes to disk according to STORAGE_MODE."""
+    global _wal_lsn
+    if STORAGE_MODE != "wal":
+        save_db()
+        return
+
+    _wal_lsn += 1
+    if wal.append(current_db_file, _wal_lsn, changes) >= wal.CHECKPOINT_BYTES:
+        if pagefile.is_paged(current_db_file):
+            save_paged()
+        else:
+            wal.checkpoint(current_db_file, current_db, {"lsn": _wal_lsn}, default=json_default)
             
+def read_import_rows(f, file_format, columns):
+    """Yield (line number, values) for each row of a CSV or JSONL file, in table column order.
+
+    CSV files need a header row naming the columns; JSONL lines are objects
+    keyed by column name or arrays in column order.
+    """
+    if file_format == "CSV":
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader, [])]
+        missing = [column for column in columns if column not in header]
+        if missing:
+            raise ValueError(f"Column '{missing[0]}' is missing from the CSV header.")
+        order = [header.index(column) for column in columns]
+        for values in reader:
+            if values:
+                yield reader.line_num, [values[i] if i < len(values) else "" for i in order]
+        return
+
+    for line_number, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            raise ValueError(f"Invalid JSON on line {line_number}.")
+        if isinstance(record, dict):
+            missing = [column for column in columns if column not in record]
+            if missing:
+                raise ValueError(f"Column '{missing[0]}' is missing on line {line_number}.")
+            record = [record[column] for column in columns]
+        yield line_number, record
+
+def import_rows(table_name, path, file_format):
+    """Stream a CSV or JSONL file into a table in chunks of IMPORT_CHUNK_ROWS rows.
+
+    Values are checked and converted with convert_import_value(); raises
+    ValueError on malformed input. Returns the number of rows imported.
+    """
+    table_info = current_db[table_name]
+    columns = table_info["columns"]
+    column_types = [table_info["types"][column] for column in columns]
+
+    imported = 0
+    chunk = []
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        for line_number, values in read_import_rows(f, file_format, columns):
+            if len(values) != len(columns):
+                raise ValueError(f"Expected {len(columns)} values on line {line_number} but got {len(values)}.")
+            row = []
+            for column, column_type, value in zip(columns, column_types, values):
+                try:
+                    row.append(convert_import_value(column_type, value))
+                except ValueError as e:
+                    raise ValueError(f"Type mismatch for column '{column}' on line {line_number}: {e}")
+            chunk.append(row)
+
+            if len(chunk) == IMPORT_CHUNK_ROWS:
+                record_change({"op": "insert", "table": table_name, "rows": chunk})
+                imported += len(chunk)
+                chunk = []
+
+    if chunk:
+        record_change({"op": "insert", "table": table_name, "rows": chunk})
+        imported += len(chunk)
+    return imported
+
+def aggregate_rows(rows, group_index, aggregates):
+    """Fold rows into running accumulators, one set per group.
+
+    ``aggregates`` is a list of (function, column index) pairs, the column
+    index being None for COUNT(*). Returns {group key: [[count, value], ...]},
+    so memory grows with the number of groups rather than rows.
+    """
+    groups = {}
+    for row in rows:
+        key = None if group_index is None else row[group_index]
+        accumulators = groups.get(key)
+        if accumulators is None:
+            accumulators = groups[key] = [[0, None] for _ in aggregates]
+
+        for accumulator, (function, column_index) in zip(accumulators, aggregates):
+            accumulator[0] += 1
+            if function == "COUNT":
+                continue
+            value = row[column_index]
+            if accumulator[1] is None:
+                accumulator[1] = value
+            elif function in ("SUM", "AVG"):
+                accumulator[1] += value
+            elif function == "MIN":
+                if value < accumulator[1]:
+                    accumulator[1] = value
+            elif value > accumulator[1]:
+                accumulator[1] = value
+    return groups
+
+def finish_aggregate(function, accumulator):
+    """Return the final value of an accumulator built by aggregate_rows."""
+    count, value = accumulator
+    if function == "COUNT":
+        return count
+    if function == "AVG":
+        return value / count if count else None
+    return value
+
+def format_table(columns, rows):
+    """Render rows as an ASCII table."""
+    if not rows:
+        return "No records found."
+
+    # Column widths
+    col_widths = [max(len(str(col)), max(len(str(row[i])) for row in rows)) for i, col in enumerate(columns)]
+
+    # Build output table
+    def build_border():
+        return "+" + "+".join("-" * (w + 2) for w in col_widths) + "+"
+
+    def build_row(values):
+        return "|" + "|".join(f" {str(val).ljust(w)} " for val, w in zip(values, col_widths)) + "|"
+
+    output_lines = [build_border()]
+    output_lines.append(build_row(columns))
+    output_lines.append(build_border())
+
+    for row in rows:
+        output_lines.append(build_row(row))
+
+    output_lines.append(build_border())
+    return "\n".join(output_lines)
+
+def where_positions(table_name, where, literals, limit=None, checked=False):
+    """Return the positions of the rows matching a parsed WHERE condition; raises ValueError.
+
+    A single comparison may use an ordered index. A compound condition on a
+    columnar table is evaluated as NumPy masks when NumPy is installed;
+    otherwise it is compiled into one predicate, and an index on one of its
+    AND-ed comparisons narrows the rows the predicate has to test. With a
+    ``limit``, rows tested one by one stop being scanned once that many
+    match, which keeps the first matches in table order. ``checked`` skips
+    the column, operator and type checks a PreparedStatement has already made.
+    """
+    table_info = current_db[table_name]
+    for comparison in () if checked else query.comparisons(where):
+        if comparison.column not in table_info["columns"]:
+            raise ValueError(f"Column '{comparison.column}' does not exist in table '{table_name}'.")
+        if comparison.operator not in COMPARISON_OPERATORS:
+            raise ValueError(f"Unsupported operator '{comparison.operator}'. Supported operators: {', '.join(COMPARISON_OPERATORS)}")
+        column_type = table_info["types"][comparison.column]
+        try:
+            convert_operands(column_type, comparison.operator, [query.bind(value, literals) for value in comparison.operands])
+        except ValueError:
+            raise ValueError(f"Type mismatch for column '{comparison.column}'. Expected {column_type}.")
+
+    if isinstance(where, query.Comparison):
+        operands = [query.bind(value, literals) for value in where.operands]
+        return find_positions(table_name, where.column, where.operator, operands, limit)
+
+    table_data = table_info["data"]
+    if isinstance(table_data, columnar.ColumnStore) and columnar.np is not None:
+        return columnar.np.flatnonzero(condition_mask(table_name, where, literals)).tolist()
+
+    predicate = compile_predicate(table_info, _column_positions[table_name], where, literals)
+    if isinstance(where, query.And):
+        indexes = table_indexes(table_name)
+        for operand in where.operands:
+            if isinstance(operand, query.Comparison) and operand.operator in RANGE_OPERATORS and operand.column in indexes:
+                operands = [query.bind(value, literals) for value in operand.operands]
+                candidates = find_positions(table_name, operand.column, operand.operator, operands)
+                return list(itertools.islice((i for i in sorted(candidates) if predicate(table_data[i])), limit))
+    return list(itertools.islice((i for i, row in enumerate(table_data) if predicate(row)), limit))
+
+def column_entries(table_name, column, positions=None):
+    """Return [(value, row position), ...] for a column, optionally limited to some row positions."""
+    table_data = current_db[table_name]["data"]
+    column_index = _column_positions[table_name][column]
+    if positions is None:
+        positions = range(len(table_data))
+    if isinstance(table_data, columnar.ColumnStore):
+        return list(zip(table_data.values(column_index, positions), positions))
+    return [(table_data[i][column_index], i) for i in positions]
+
+def merge_join(left_entries, right_entries):
+    """Pair up the positions of two lists of (value, position) sorted by value, matching equal values."""
+    pairs = []
+    i = j = 0
+    while i < len(left_entries) and j < len(right_entries):
+        left_value, right_value = left_entries[i][0], right_entries[j][0]
+        if left_value < right_value:
+            i += 1
+        elif left_value > right_value:
+            j += 1
+        else:
+            i_end, j_end = i, j
+            while i_end < len(left_entries) and left_entries[i_end][0] == left_value:
+                i_end += 1
+            while j_end < len(right_entries) and right_entries[j_end][0] == right_value:
+                j_end += 1
+            pairs.extend((p, q) for _, p in left_entries[i:i_end] for _, q in right_entries[j:j_end])
+            i, j = i_end, j_end
+    return pairs
+
+def join_positions(left, left_column, left_positions, right, right_column, right_positions):
+    """Return (left position, right position) pairs of the rows whose join columns are equal.
+
+    ``*_positions`` limit each side to some rows (None for all of them).
+    When both columns have an ordered index the two indexes are merged in
+    order (sort-merge join); otherwise the smaller side is loaded into a hash
+    table that the other side probes (hash join). Both are O(n + m) plus the
+    size of the result.
+    """
+    left_index = table_indexes(left).get(left_column)
+    right_index = table_indexes(right).get(right_column)
+    if left_index is not None and right_index is not None:
+        if left_positions is not None:
+            wanted = set(left_positions)
+            left_index = [entry for entry in left_index if entry[1] in wanted]
+        if right_positions is not None:
+            wanted = set(right_positions)
+            right_index = [entry for entry in right_index if entry[1] in wanted]
+        return merge_join(left_index, right_index)
+
+    left_entries = column_entries(left, left_column, left_positions)
+    right_entries = column_entries(right, right_column, right_positions)
+    swapped = len(right_entries) < len(left_entries)
+    build, probe = (right_entries, left_entries) if swapped else (left_entries, right_entries)
+
+    buckets = {}
+    for value, position in build:
+        buckets.setdefault(value, []).append(position)
+
+    pairs = []
+    for value, position in probe:
+        for match in buckets.get(value, ()):
+            pairs.append((position, match) if swapped else (match, position))
+    return pairs
+
+def join_columns(left, right):
+    """Return {"table.column": (table, column)} for the columns of two joined tables. Raises ValueError."""
+    if right not in current_db:
+        raise ValueError(f"Table '{right}' does not exist.")
+    if left == right:
+        raise ValueError("A table cannot be joined with itself.")
+
+    columns = {}
+    for table_name in (left, right):
+        for column in current_db[table_name]["columns"]:
+            columns[f"{table_name}.{column}"] = (table_name, column)
+    return columns
+
+def resolve_join_column(columns, name):
+    """Return the qualified name of a column of two joined tables, written with or without its table. Raises ValueError."""
+    if name in columns:
+        return name
+    matches = [qualified for qualified, (_, column) in columns.items() if column == name]
+    if len(matches) > 1:
+        raise ValueError(f"Column '{name}' is ambiguous. Use {' or '.join(matches)}.")
+    if not matches:
+        left, right = dict.fromkeys(table_name for table_name, _ in columns.values())
+        raise ValueError(f"Column '{name}' does not exist in tables '{left}' and '{right}'.")
+    return matches[0]
+
+def join_tables(select, literals, checked=False):
+    """Run the JOIN of a SELECT and return (select, joined table).
+
+    The joined table is a table_info-like dict whose rows are a row of the
+    first table followed by a row of the second, with "table.column" names.
+    The returned SELECT uses those names and keeps only the part of the
+    WHERE condition that spans both tables; AND-ed conditions on a single
+    table filter that table before the join. ``checked`` is passed on to
+    where_positions(). Raises ValueError.
+    """
+    left, right = select.table, select.join.table
+    columns = join_columns(left, right)
+
+    def resolve(name):
+        return resolve_join_column(columns, name)
+
+    left_column, right_column = resolve(select.join.left), resolve(select.join.right)
+    if columns[left_column][0] == columns[right_column][0]:
+        raise ValueError("The JOIN condition must compare a column of each table.")
+    if columns[left_column][0] != left:
+        left_column, right_column = right_column, left_column
+    left_type = current_db[left]["types"][columns[left_column][1]]
+    right_type = current_db[right]["types"][columns[right_column][1]]
+    if left_type != right_type and not {left_type, right_type} <= {"INT", "FLOAT"}:
+        raise ValueError(f"Cannot join a {left_type} column with a {right_type} column.")
+
+    # Push conditions on a single table down to that table
+    conditions = [] if select.where is None else list(select.where.operands) if isinstance(select.where, query.And) else [select.where]
+    pushed = {left: [], right: []}
+    residual = []
+    for condition in conditions:
+        tables = {columns[resolve(comparison.column)][0] for comparison in query.comparisons(condition)}
+        (pushed[tables.pop()] if len(tables) == 1 else residual).append(condition)
+
+    positions = {}
+    for table_name, table_conditions in pushed.items():
+        positions[table_name] = None
+        if table_conditions:
+            condition = table_conditions[0] if len(table_conditions) == 1 else query.And(tuple(table_conditions))
+            condition = query.map_columns(condition, lambda name: columns[resolve(name)][1])
+            positions[table_name] = sorted(where_positions(table_name, condition, literals, checked=checked))
+
+    pairs = join_positions(left, columns[left_column][1], positions[left], right, columns[right_column][1], positions[right])
+    left_rows = fetch_rows(current_db[left]["data"], [i for i, _ in pairs])
+    right_rows = fetch_rows(current_db[right]["data"], [j for _, j in pairs])
+    joined = {
+        "columns": list(columns),
+        "types": {qualified: current_db[table_name]["types"][column] for qualified, (table_name, column) in columns.items()},
+        "data": [tuple(left_row) + tuple(right_row) for left_row, right_row in zip(left_rows, right_rows)],
+    }
+
+    def qualify_field(field):
+        if isinstance(field, query.Aggregate):
+            return field if field.argument is None else field._replace(argument=resolve(field.argument))
+        return resolve(field)
+
+    order_by = select.order_by
+    aggregate = re.fullmatch(r"(\w+)\((.+)\)", order_by or "")
+    if aggregate and aggregate.group(2) != "*":
+        order_by = f"{aggregate.group(1)}({resolve(aggregate.group(2))})"
+    elif order_by is not None and not aggregate:
+        order_by = resolve(order_by)
+    where = None
+    if residual:
+        where = query.map_columns(residual[0] if len(residual) == 1 else query.And(tuple(residual)), resolve)
+
+    select = select._replace(
+        fields=None if select.fields is None else tuple(qualify_field(field) for field in select.fields),
+        where=where,
+        group_by=None if select.group_by is None else resolve(select.group_by),
+        order_by=order_by,
+    )
+    return select, joined
+
+def select_rows(command):
+    """Run a SELECT statement and return (column names, iterable of result rows).
+
+    Rows are produced lazily where possible, so callers can stream large
+    results. Raises ValueError with a user-facing message on invalid queries.
+    """
+    try:
+        statement, literals = query.parse(command)
+    except query.ParseError:
+        statement = None
+    if not isinstance(statement, query.Select):
+        raise ValueError(SELECT_USAGE)
+    return run_select(statement, literals)
+
+def run_select(select, literals, checked=False):
+    """Execute a parsed SELECT; ``literals`` holds the values of its Param placeholders.
+
+    Returns (columns, rows) where rows is an iterable of tuples, produced lazily
+    where the query allows it. ``checked`` is passed on to where_positions().
+    """
+    if current_db is None:
+        raise ValueError("No database selected. Use 'USE database_name' first.")
+
+    table_name = select.table
+    if table_name not in current_db:
+        raise ValueError(f"Table '{table_name}' does not exist.")
+
+    if select.join is not None:
+        select, table_info = join_tables(select, literals, checked)
+        column_positions = column_map(table_info["columns"])
+        indexes = {}
+    else:
+        table_info = current_db[table_name]
+        column_positions = _column_positions[table_name]
+        indexes = None  # Looked up when ORDER BY needs them
+
+    table_columns = table_info["columns"]
+    table_data = table_info["data"]
+    filtered_data = table_data
+    positions = None  # Matching row positions, None when there is no WHERE clause
+    condition_column = None  # Column of a WHERE comparison answered in that column's index order
+
+    # LIMIT / OFFSET: only the first `stop` rows of the result are ever needed
+    offset, limit = query.bind_limit(select, literals)
+    stop = None if limit is None else offset + limit
+    ordered = select.order_by is not None or select.group_by is not None or any(
+        isinstance(field, query.Aggregate) for field in select.fields or []
+    )
+    scan_limit = None if ordered else stop  # Without ordering the scan can stop early
+
+    # WHERE clause
+    if select.where is not None and select.join is not None:
+        try:
+            predicate = compile_predicate(table_info, column_positions, select.where, literals)
+        except ValueError:
+            raise ValueError("Type mismatch in WHERE clause.")
+        filtered_data = (row for row in table_data if predicate(row))
+    elif select.where is not None:
+        if isinstance(select.where, query.Comparison) and select.where.operator in RANGE_OPERATORS:
+            condition_column = select.where.column  # find_positions() returns other operators in table order
+        positions = where_positions(table_name, select.where, literals, scan_limit, checked)
+        filtered_data = [table_data[i] for i in sorted(positions)]
+
+    # Fields to select, with their aggregate function if any
+    if select.fields is None:
+        selected_columns = table_columns
+        aggregates = [None] * len(table_columns)
+    else:
+        selected_columns = [query.label(field) for field in select.fields]
+        aggregates = []
+        for field in select.fields:
+            if not isinstance(field, query.Aggregate):
+                if field not in column_positions:
+                    raise ValueError(f"Column '{field}' does not exist in table '{table_name}'.")
+                aggregates.append(None)
+                continue
+
+            function, argument = field.function.upper(), field.argument
+            if function not in AGGREGATE_FUNCTIONS:
+                raise ValueError(f"Unsupported aggregate '{function}'. Supported aggregates: {', '.join(AGGREGATE_FUNCTIONS)}")
+            if argument is None:
+                if function != "COUNT":
+                    raise ValueError(f"{function}(*) is not supported. Use {function}(column).")
+                aggregates.append((function, None))
+                continue
+            if argument not in column_positions:
+                raise ValueError(f"Column '{argument}' does not exist in table '{table_name}'.")
+            if function in ("SUM", "AVG") and table_info["types"][argument] not in ("INT", "FLOAT"):
+                raise ValueError(f"{function} requires an INT or FLOAT column.")
+            aggregates.append((function, column_positions[argument]))
+
+    # GROUP BY
+    group_by_column = select.group_by
+    if group_by_column is not None:
+        if group_by_column not in column_positions:
+            raise ValueError(f"Column '{group_by_column}' does not exist in table '{table_name}'.")
+        group_by_index = column_positions[group_by_column]
+
+    # ORDER BY
+    order_by_column = select.order_by
+    order_direction = "desc" if select.descending else "asc"
+
+    # Aggregate query: one output row per group, built from running accumulators
+    if any(aggregates):
+        for col, aggregate in zip(selected_columns, aggregates):
+            if aggregate is None and col != group_by_column:
+                raise ValueError(f"Column '{col}' must appear in GROUP BY or inside an aggregate.")
+
+        functions = [aggregate for aggregate in aggregates if aggregate is not None]
+        if group_by_column is None and isinstance(table_data, columnar.ColumnStore):
+            # Scan whole columns instead of rows
+            rows_positions = None if positions is None else sorted(positions)
+            values = [table_data.aggregate(column_index, function, rows_positions) for function, column_index in functions]
+            result_rows = [values]
+            keys = [None]
+        else:
+            groups = aggregate_rows(filtered_data, None if group_by_column is None else group_by_index, functions)
+            if group_by_column is None and not groups:
+                groups[None] = [[0, None] for _ in functions]  # Aggregates over no rows still return one row
+            result_rows = [
+                [finish_aggregate(function, accumulator) for (function, _), accumulator in zip(functions, accumulators)]
+                for accumulators in groups.values()
+            ]
+            keys = list(groups)
+
+        # Put group keys back in place of the plain columns
+        output_rows = []
+        for r, values in enumerate(result_rows):
+            values = iter(values)
+            output_rows.append(tuple(keys[r] if aggregate is None else next(values) for aggregate in aggregates))
+
+        if order_by_column is not None:
+            headers = [col.lower().replace(" ", "") for col in selected_columns]
+            if order_by_column.lower() not in headers:
+                raise ValueError(f"ORDER BY column '{order_by_column}' must be one of the selected columns.")
+            order_by_index = headers.index(order_by_column.lower())
+            output_rows.sort(key=lambda row: (row[order_by_index] is None, row[order_by_index]), reverse=(order_direction == "desc"))
+
+        return selected_columns, output_rows[offset:stop]
+
+    if group_by_column is not None:
+        # Keep only the first row of each group
+        grouped = {}
+        for row in filtered_data:
+            grouped.setdefault(row[group_by_index], row)
+        filtered_data = list(grouped.values())
+
+    if order_by_column is not None:
+        if order_by_column not in column_positions:
+            raise ValueError(f"Column '{order_by_column}' does not exist in table '{table_name}'.")
+        order_by_index = column_positions[order_by_column]
+        index = (table_indexes(table_name) if indexes is None else indexes).get(order_by_column)
+
+        if index is not None and group_by_column is None:
+            # Stream rows in index order instead of sorting them, fetching only the rows kept by LIMIT
+            if positions is None:
+                ordered = (i for _, i in (reversed(index) if order_direction == "desc" else index))
+            else:
+                if condition_column == order_by_column:
+                    ordered = positions  # Already in index order
+                else:
+                    wanted = set(positions)
+                    ordered = [i for _, i in index if i in wanted]
+                if order_direction == "desc":
+                    ordered = ordered[::-1]
+            filtered_data = fetch_rows(table_data, itertools.islice(ordered, stop))
+        elif stop is not None:
+            # Top-K: keep the first `stop` rows in a bounded heap instead of sorting all of them
+            select_top = heapq.nlargest if order_direction == "desc" else heapq.nsmallest
+            filtered_data = select_top(stop, filtered_data, key=lambda row: row[order_by_index])
+        else:
+            filtered_data = sorted(filtered_data, key=lambda row: row[order_by_index], reverse=(order_direction == "desc"))
+
+    selected_indexes = [column_positions[col] for col in selected_columns]
+    return selected_columns, (tuple(row[i] for i in selected_indexes) for row in itertools.islice(filtered_data, offset, stop))
+
+def export_to_downloads(db_name, file_name, file_format):
+    """Export the whole database to the Downloads folder as one JSON or CSV file. Raises ValueError."""
+    try:
+        if file_format not in ["CSV", "JSON"]:
+            raise ValueError("Error: Unsupported file format. Use CSV or JSON.")
+
+        downloads_folder = get_downloads_directory()
+        file_path = os.path.join(downloads_folder, f"{file_name}.{file_format.lower()}")
+
+        if file_format == "JSON":
+            tables = {
+                table_name: ({k: v for k, v in table_info.items() if k != "data"}, table_info["data"])
+                for table_name, table_info in current_db.items()
+            }
+            exporter.export_database_json(file_path, tables)
+            return f"Database '{db_name}' successfully exported as JSON! File saved at: {file_path}"
+
+        elif file_format == "CSV":
+            if not isinstance(current_db, dict) or not current_db:
+                raise ValueError("Error: Database is empty or has an invalid structure for CSV export.")
+
+            with open(file_path, "w", newline="", encoding="utf-8") as csv_file:
+                writer = csv.writer(csv_file)
+
+                for table_name, table_info in current_db.items():
+                    if not isinstance(table_info, dict) or "columns" not in table_info or "data" not in table_info:
+                        continue  # Skip invalid tables
+
+                    writer.writerow([f"Table: {table_name}"])  # Table name
+                    writer.writerow(table_info["columns"])  # Column headers
+
+                    for chunk in exporter.chunks(table_info["data"]):
+                        writer.writerows(chunk)  # Write row data
+
+                    writer.writerow([])  # Blank line for separation
+
+            return f"Database '{db_name}' successfully exported as CSV! File saved at: {file_path}"
+
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Error exporting database: {e}")
+
+def run_update(update, literals, checked=False):
+    """Execute a parsed UPDATE and return the message for the user; ``checked`` is passed on to where_positions().
+
+    Raises ValueError.
+    """
+    if current_db is None:
+        raise ValueError("No database selected. Use 'USE database_name' first.")
+
+    table_name = update.table
+    if table_name not in current_db:
+        raise ValueError(f"Table '{table_name}' does not exist.")
+
+    table_info = current_db[table_name]
+    field_index = _column_positions[table_name].get(update.column)
+    if field_index is None:
+        raise ValueError(f"Column '{update.column}' does not exist in table '{table_name}'.")
+
+    # Find each row the condition matches
+    positions = where_positions(table_name, update.where, literals, checked=checked)
+
+    if not positions:
+        return "No records matched the condition."
+
+    # Convert the new value to the correct type
+    field_type = table_info["types"][update.column]
+    try:
+        new_value = convert_value(field_type, query.bind(update.value, literals))
+        record_change({"op": "update", "table": table_name, "positions": positions, "column": field_index, "value": new_value})
+    except ValueError:
+        raise ValueError(f"Type mismatch for column '{update.column}'. Expected {field_type}.")
+    except OverflowError:
+        raise ValueError(f"Value out of range for column '{update.column}'.")
+    return f"{len(positions)} record(s) updated in '{table_name}'."
+
+def run_exclude(exclude, literals, checked=False):
+    """Execute a parsed EXCLUDE (drop a table, empty it, or delete matching rows) and return the message for the user.
+
+    ``checked`` is passed on to where_positions(). Raises ValueError.
+    """
+    if current_db is None:
+        raise ValueError("No database selected. Use 'USE database_name' first.")
+
+    table_name = exclude.table
+    if table_name not in current_db:
+        raise ValueError(f"Table '{table_name}' not found.")
+
+    if exclude.drop:
+        record_change({"op": "drop", "table": table_name})
+        return f"Table '{table_name}' has been dropped."
+
+    if exclude.where is None:
+        record_change({"op": "truncate", "table": table_name})
+        return f"All records from '{table_name}' have been deleted."
+
+    positions = where_positions(table_name, exclude.where, literals, checked=checked)
+    if positions:
+        record_change({"op": "delete", "table": table_name, "positions": positions})
+    return f"Excluded {len(positions)} record(s) from '{table_name}'."
+
+class PreparedStatement:
+    """A SELECT, UPDATE or EXCLUDE parsed and checked once, then executed with different parameters.
+
+    Each "?" in the statement is a parameter; execute() binds the values in
+    order and runs the parsed statement without looking at the text again.
+    Its columns, those of a JOINed table included, are resolved when it is
+    prepared: constant literals are converted to the type of their column
+    then, parameters as they are bound. If a table it reads is replaced by
+    one of a different shape, the statement is checked again.
+    """
+
+    def __init__(self, statement):
+        try:
+            self.statement, self.literals = query.parse(statement, parameters=True)
+        except query.ParseError as e:
+            raise ValueError(f"Syntax error: {e}")
+        if not isinstance(self.statement, (query.Select, query.Update, query.Exclude)):
+            raise ValueError("Only SELECT, UPDATE and EXCLUDE statements can be prepared.")
+        self.parameters = self.literals.count(query.PARAMETER)
+        self.check()
+
+    def tables(self):
+        """Return the names of the tables the statement reads."""
+        join = getattr(self.statement, "join", None)
+        return [self.statement.table] if join is None else [self.statement.table, join.table]
+
+    def schema(self):
+        """Return the column types of the tables the statement reads, None for a missing table."""
+        return [current_db[table_name]["types"] if table_name in current_db else None for table_name in self.tables()]
+
+    def check(self):
+        """Resolve every column the statement names and convert its constant literals. Raises ValueError."""
+        if current_db is None:
+            raise ValueError("No database selected. Use 'USE database_name' first.")
+        statement = self.statement
+        table_name = statement.table
+        if table_name not in current_db:
+            raise ValueError(f"Table '{table_name}' does not exist.")
+
+        if len(self.tables()) == 2:
+            columns = join_columns(*self.tables())
+
+            def column_type(name):
+                joined_table, column = columns[resolve_join_column(columns, name)]
+                return current_db[joined_table]["types"][column]
+        else:
+            types = current_db[table_name]["types"]
+
+            def column_type(name):
+                if name not in types:
+                    raise ValueError(f"Column '{name}' does not exist in table '{table_name}'.")
+                return types[name]
+
+        if isinstance(statement, query.Select):
+            for field in statement.fields or ():
+                if not isinstance(field, query.Aggregate):
+                    column_type(field)
+                    continue
+                if field.function.upper() not in AGGREGATE_FUNCTIONS:
+                    raise ValueError(f"Unsupported aggregate '{field.function.upper()}'. Supported aggregates: {', '.join(AGGREGATE_FUNCTIONS)}")
+                if field.argument is not None:
+                    column_type(field.argument)
+            if statement.group_by is not None:
+                column_type(statement.group_by)
+            if statement.order_by is not None and not re.fullmatch(r"\w+\(.+\)", statement.order_by):
+                column_type(statement.order_by)
+
+        self.conversions = {}  # literal index -> (column, column type, operator), see convert()
+        if isinstance(statement, query.Update) and isinstance(statement.value, query.Param):
+            self.conversions[statement.value.index] = (statement.column, column_type(statement.column), "=")
+        elif isinstance(statement, query.Update):
+            column_type(statement.column)
+        for comparison in () if statement.where is None else query.comparisons(statement.where):
+            if comparison.operator not in COMPARISON_OPERATORS:
+                raise ValueError(f"Unsupported operator '{comparison.operator}'. Supported operators: {', '.join(COMPARISON_OPERATORS)}")
+            comparison_type = column_type(comparison.column)
+            for value in comparison.operands:
+                if isinstance(value, query.Param):
+                    self.conversions[value.index] = (comparison.column, comparison_type, comparison.operator)
+
+        self.bound = list(self.literals)  # Constant literals converted, "?" slots left for bind_parameters()
+        for i in self.conversions:
+            if self.bound[i] is not query.PARAMETER:
+                self.convert(self.bound, i)
+        self.slots = [i for i in self.conversions if self.literals[i] is query.PARAMETER]
+        self.checked_schema = self.schema()
+
+    def convert(self, literals, i):
+        """Convert literals[i] in place to the type of the column it is compared with or assigned to. Raises ValueError."""
+        column, column_type, operator = self.conversions[i]
+        try:
+            literals[i] = convert_operands(column_type, operator, [literals[i]])[0]
+        except ValueError:
+            raise ValueError(f"Type mismatch for column '{column}'. Expected {column_type}.")
+
+    def execute(self, params=()):
+        """Run the statement with ``params`` bound to its "?" parameters and return the output of the command."""
+        try:
+            result = self.cursor(params)
+        except ValueError as e:
+            return str(e)
+        if result.columns is None:
+            return result.message
+        return format_table(result.columns, result.fetchall())
+
+    def cursor(self, params=()):
+        """Run the statement with ``params`` bound and return a cursor.Cursor over its rows. Raises ValueError."""
+        if current_db is None or self.schema() != self.checked_schema:
+            self.check()
+        literals = query.bind_parameters(self.bound, params)
+        for i in self.slots:
+            self.convert(literals, i)
+        if isinstance(self.statement, query.Select):
+            columns, rows = run_select(self.statement, literals, checked=True)
+            return cursor.Cursor(columns, rows)
+        if isinstance(self.statement, query.Update):
+            return cursor.Cursor(None, message=run_update(self.statement, literals, checked=True))
+        return cursor.Cursor(None, message=run_exclude(self.statement, literals, checked=True))
+
+def prepare(statement):
+    """Parse and check a statement once; returns a PreparedStatement. Raises ValueError."""
+    return PreparedStatement(statement)
+
+def execute(statement, params=()):
+    """Run a statement and return a cursor.Cursor over its result. Raises ValueError.
+
+    A SELECT yields its rows as typed tuples, lazily; ``params`` are bound to
+    its "?" parameters. Any other statement runs through run_command and its
+    output becomes the cursor's message.
+    """
+    if params:
+        return prepare(statement).cursor(params)
+    if statement.strip()[:6].lower() == "select":
+        columns, rows = select_rows(statement)
+        return cursor.Cursor(columns, rows)
+    return cursor.Cursor(None, message=run_command(statement))
+
 def get_downloads_directory():
     if platform.system() == "Windows":
         return os.path.join(os.environ["USERPROFILE"], "Downloads")
@@ -42,26 +1234,89 @@ def get_downloads_directory():
         return os.path.join(os.path.expanduser("~"), "Downloads")
 
 def process_command(command):
+    """Run a console command and return its output; a failed command returns its error message."""
+    try:
+        return run_command(command)
+    except ValueError as e:
+        return str(e)
+
+def run_command(command):
+    """Run a console command and return its output message. Raises ValueError when the command fails."""
     global current_db, current_db_file
     
     tokens = command.strip().split()
     if not tokens:
-        return "Invalid command."
+        raise ValueError("Invalid command.")
 
     action = tokens[0].lower()
     
     # CREATE DATABASE
-    if action == "create" and len(tokens) == 3 and tokens[1].lower() == "database":
+    if action == "create" and len(tokens) in (3, 5) and tokens[1].lower() == "database":
         db_name = tokens[2]
-        db_path = f"{db_name}.json"
+        db_format = "json"
+        if len(tokens) == 5:
+            if tokens[3].lower() != "format" or tokens[4].lower().rstrip(";") not in DATABASE_FORMATS:
+                raise ValueError("Syntax error. Use: CREATE DATABASE database_name [FORMAT JSON|BINARY]")
+            db_format = tokens[4].lower().rstrip(";")
         
-        if os.path.exists(db_path):
-            return f"Database '{db_name}' already exists."
+        if os.path.exists(pagefile.resolve(db_name)):
+            raise ValueError(f"Database '{db_name}' already exists.")
         
-        with open(db_path, "w") as f:
-            json.dump({}, f)
+        if db_format == "binary":
+            pagefile.write(f"{db_name}{pagefile.EXTENSION}", {}, {}).close()
+        else:
+            with open(f"{db_name}.json", "w") as f:
+                json.dump({}, f)
         
         return f"Database '{db_name}' created successfully."
+
+    # TRANSACTIONS
+    elif action.rstrip(";") in ("begin", "commit", "rollback") and len(tokens) <= 2:
+        action = action.rstrip(";")
+        if current_db is None:
+            raise ValueError("No database selected. Use 'USE database_name' first.")
+
+        if action == "begin":
+            if _transaction is not None:
+                raise ValueError("A transaction is already open.")
+            begin_transaction()
+            return "Transaction started."
+
+        if _transaction is None:
+            raise ValueError("No transaction is open.")
+        if action == "commit":
+            return f"Transaction committed ({commit_transaction()} change(s))."
+        rollback_transaction()
+        return "Transaction rolled back."
+
+    # CREATE INDEX / DROP INDEX
+    elif action in ("create", "drop") and len(tokens) >= 3 and tokens[1].lower() == "index":
+        if current_db is None:
+            raise ValueError("No database selected. Use 'USE database_name' first.")
+
+        match = re.match(r"(create|drop) index on (\w+)\s*\(\s*(\w+)\s*\)\s*;?$", command.strip(), re.IGNORECASE)
+        if not match:
+            raise ValueError(f"Syntax error. Use: {action.upper()} INDEX ON table_name(column);")
+
+        table_name, column = match.group(2), match.group(3)
+        if table_name not in current_db:
+            raise ValueError(f"Table '{table_name}' does not exist.")
+        if column not in current_db[table_name]["columns"]:
+            raise ValueError(f"Column '{column}' does not exist in table '{table_name}'.")
+
+        indexed = column in current_db[table_name].get("indexes", [])
+        if action == "create":
+            if indexed:
+                raise ValueError(f"Index on '{table_name}({column})' already exists.")
+            if current_db[table_name]["types"][column] not in ORDERED_INDEX_TYPES:
+                raise ValueError(f"Indexes are only supported on {', '.join(ORDERED_INDEX_TYPES)} columns.")
+            record_change({"op": "create_index", "table": table_name, "column": column})
+            return f"Index created on '{table_name}({column})'."
+        else:
+            if not indexed:
+                raise ValueError(f"No index on '{table_name}({column})'.")
+            record_change({"op": "drop_index", "table": table_name, "column": column})
+            return f"Index on '{table_name}({column})' dropped."
     
     
     elif action == "show" and len(tokens) == 2 and tokens[1].lower() == "tables":
@@ -72,12 +1327,15 @@ def process_command(command):
         else:
             return "No tables found."
         
+    elif action in ("use", "remove", "exit") and len(tokens) == 2 and _transaction is not None:
+        raise ValueError("A transaction is open. COMMIT or ROLLBACK first.")
+
     elif action == "use" and len(tokens) == 2:
         db_name = tokens[1]
-        db_path = f"{db_name}.json"
+        db_path = pagefile.resolve(db_name)
 
         if not os.path.exists(db_path):
-            return f"Database '{db_name}' does not exist."
+            raise ValueError(f"Database '{db_name}' does not exist.")
         else:
             load_db(db_name)
             return f"Using database '{db_name}'."
@@ -85,28 +1343,34 @@ def process_command(command):
         
     elif action == "remove" and len(tokens) == 2:
         db_name = tokens[1]
-        db_path = f"{db_name}.json"  # Direct JSON file name
+        db_path = pagefile.resolve(db_name)
 
         if not os.path.exists(db_path):
-            return f"Database '{db_name}' does not exist."
+            raise ValueError(f"Database '{db_name}' does not exist.")
 
-        os.remove(db_path)  # Delete the JSON file
         if current_db_file == db_path:
+            close_pagefile()
             current_db_file = None
             current_db = None
+        _open_databases.discard(db_path)
+        os.remove(db_path)  # Delete the database file
+        wal.remove(db_path)
 
         return f"Database '{db_name}' deleted successfully."
 
     # MAKE TABLE
     elif action == "make":
         if current_db is None:
-            return "No database selected. Use 'USE database_name' first."
+            raise ValueError("No database selected. Use 'USE database_name' first.")
         
-        match = re.match(r"make (\w+)\s*\((.+)\);?", command, re.IGNORECASE)
+        match = re.match(r"make (\w+)\s*\((.+)\)(?:\s+engine\s+(\w+))?\s*;?$", command.strip(), re.IGNORECASE)
         if not match:
-            return "Syntax error. Use: MAKE table_name (column1 TYPE, column2 TYPE, ...);"
+            raise ValueError("Syntax error. Use: MAKE table_name (column1 TYPE, column2 TYPE, ...) [ENGINE ROW|COLUMNAR];")
 
-        table_name, columns_part = match.groups()
+        table_name, columns_part, engine = match.groups()
+        engine = (engine or "row").lower()
+        if engine not in STORAGE_ENGINES:
+            raise ValueError(f"Unsupported engine '{engine}'. Supported engines: {', '.join(e.upper() for e in STORAGE_ENGINES)}")
         columns = [col.strip() for col in columns_part.split(",")]
 
         column_names = []
@@ -115,31 +1379,68 @@ def process_command(command):
         for col in columns:
             parts = col.split()
             if len(parts) != 2:
-                return f"Invalid column definition: '{col}'. Use 'column_name TYPE'."
+                raise ValueError(f"Invalid column definition: '{col}'. Use 'column_name TYPE'.")
             column_name, column_type = parts
             column_names.append(column_name)
             if column_type.upper() not in SUPPORTED_TYPES:
-                return f"Unsupported data type '{column_type}'. Supported types: {', '.join(SUPPORTED_TYPES)}"
+                raise ValueError(f"Unsupported data type '{column_type}'. Supported types: {', '.join(SUPPORTED_TYPES)}")
             column_types[column_name] = column_type.upper()  # Store the column type here
 
         if table_name in current_db:
-            return f"Table '{table_name}' already exists."
+            raise ValueError(f"Table '{table_name}' already exists.")
         
-        current_db[table_name] = {"columns": column_names, "types": column_types, "data": []}
-        save_db()
+        record_change({"op": "make", "table": table_name, "columns": column_names, "types": column_types, "engine": engine})
         return f"Table '{table_name}' created with columns {column_names} and types {column_types}."
 
 
     # INCLUDE DATA
+    # IMPORT file INTO table [FORMAT CSV|JSONL]
+    elif action == "import":
+        try:
+            parts = shlex.split(command.strip().rstrip(";"))
+        except ValueError:
+            parts = []
+        if len(parts) not in (4, 6) or parts[2].lower() != "into" or (len(parts) == 6 and parts[4].lower() != "format"):
+            raise ValueError("Syntax error. Use: IMPORT file_path INTO table_name [FORMAT CSV|JSONL]")
+
+        path, table_name = parts[1], parts[3]
+        file_format = parts[5].upper() if len(parts) == 6 else os.path.splitext(path)[1].lstrip(".").upper()
+        if file_format not in IMPORT_FORMATS:
+            raise ValueError("Error: Unsupported file format. Use CSV or JSONL.")
+
+        if current_db is None:
+            raise ValueError("No database selected. Use 'USE database_name' first.")
+        if table_name not in current_db:
+            raise ValueError(f"Table '{table_name}' does not exist.")
+        if not os.path.exists(path):
+            raise ValueError(f"File '{path}' not found.")
+
+        # Run the import as a transaction so a bad line leaves the table untouched
+        # and the rows are saved with one snapshot rather than logged
+        own_transaction = _transaction is None
+        if own_transaction:
+            begin_transaction()
+        try:
+            imported = import_rows(table_name, path, file_format)
+        except (ValueError, OverflowError, OSError) as e:
+            if own_transaction:
+                rollback_transaction()
+                raise ValueError(f"Import failed, no rows were imported: {e}")
+            raise ValueError(f"Import failed: {e} Rows read before the error remain in the open transaction.")
+
+        if own_transaction:
+            commit_transaction(snapshot=True)
+        return f"{imported} record(s) imported into '{table_name}'."
+
     elif action == "include":
         match = re.match(r"include (\w+)\s*(\(.*\));?", command, re.IGNORECASE)
         if not match:
-            return "Syntax error. Use: INCLUDE table_name (val1, val2, ...), (val1, val2, ...);"
+            raise ValueError("Syntax error. Use: INCLUDE table_name (val1, val2, ...), (val1, val2, ...);")
 
         table_name, values_section = match.groups()
 
         if table_name not in current_db:
-            return f"Table '{table_name}' does not exist."
+            raise ValueError(f"Table '{table_name}' does not exist.")
 
         table_columns = current_db[table_name]["columns"]
         column_types = current_db[table_name]["types"]
@@ -147,12 +1448,12 @@ def process_command(command):
         # Extract all groups of values within parentheses
         value_tuples = re.findall(r"\(([^)]+)\)", values_section)
 
-        inserted_count = 0
+        inserted_rows = []
         for value_group in value_tuples:
             values = [val.strip() for val in value_group.split(",")]
 
             if len(values) != len(table_columns):
-                return f"Column mismatch. Expected {len(table_columns)} values but got {len(values)}."
+                raise ValueError(f"Column mismatch. Expected {len(table_columns)} values but got {len(values)}.")
 
             # Convert values based on column types
             converted_values = []
@@ -168,248 +1469,49 @@ def process_command(command):
                     elif column_type == "TIMESTAMP":
                         converted_values.append(values[i].strip("'\""))
                     else:
-                        return f"Unsupported data type '{column_type}' for column '{column}'."
+                        raise ValueError(f"Unsupported data type '{column_type}' for column '{column}'.")
                 except ValueError:
-                    return f"Type mismatch for column '{column}'. Expected {column_type}."
+                    raise ValueError(f"Type mismatch for column '{column}'. Expected {column_type}.")
 
-            current_db[table_name]["data"].append(converted_values)
-            inserted_count += 1
+            inserted_rows.append(converted_values)
 
-        save_db()
-        return f"{inserted_count} record(s) inserted into '{table_name}'."
+        try:
+            record_change({"op": "insert", "table": table_name, "rows": inserted_rows})
+        except OverflowError:
+            raise ValueError(f"Value out of range for a column of '{table_name}'.")
+        return f"{len(inserted_rows)} record(s) inserted into '{table_name}'."
 
     
     elif action == "exclude":
         try:
-            # Case: exclude table_name → drop the table
-            if len(tokens) == 2:
-                table_name = tokens[1]
-                if table_name in current_db:
-                    del current_db[table_name]
-                    save_db()
-                    return f"Table '{table_name}' has been dropped."
-                else:
-                    return f"Table '{table_name}' not found."
-
-            # Case: exclude from table_name → truncate table
-            if tokens[1] == "from" and len(tokens) == 3:
-                table_name = tokens[2]
-                if table_name in current_db:
-                    current_db[table_name]["data"] = []
-                    save_db()
-                    return f"All records from '{table_name}' have been deleted."
-                else:
-                    return f"Table '{table_name}' not found."
-
-            # Case: exclude from table_name where field=value → delete specific rows
-            if "from" in tokens and "where" in tokens:
-                from_index = tokens.index("from")
-                where_index = tokens.index("where")
-
-                table_name = tokens[from_index + 1]
-                condition_clause = " ".join(tokens[where_index + 1:])
-
-                if "=" not in condition_clause:
-                    return "Syntax error in WHERE clause."
-
-                # Parse the condition
-                condition_field, condition_value = condition_clause.split("=")
-                condition_field = condition_field.strip()
-                condition_value = condition_value.strip().strip('"').strip("'")
-
-                if table_name in current_db:
-                    table_columns = current_db[table_name]["columns"]
-                    table_data = current_db[table_name]["data"]
-
-                    # Check if the condition field exists
-                    if condition_field not in table_columns:
-                        return f"Field '{condition_field}' not found in table '{table_name}'."
-
-                    condition_index = table_columns.index(condition_field)
-                    field_type = current_db[table_name]["types"][condition_field]
-
-                    # Convert to correct type
-                    if field_type == "INT":
-                        condition_value = int(condition_value)
-
-                    # Filter out matching rows
-                    initial_len = len(table_data)
-                    table_data[:] = [row for row in table_data if row[condition_index] != condition_value]
-                    modified_count = initial_len - len(table_data)
-
-                    save_db()
-                    return f"Excluded {modified_count} record(s) from '{table_name}'."
-                else:
-                    return f"Table '{table_name}' not found."
-
-            return "Syntax error. Usage:\n - exclude table_name\n - exclude from table_name\n - exclude from table_name WHERE field=value"
+            statement, literals = query.parse(command)
+        except query.ParseError:
+            statement = None
+        if not isinstance(statement, query.Exclude):
+            raise ValueError("Syntax error. Usage:\n - exclude table_name\n - exclude from table_name\n - exclude from table_name WHERE field=value")
 
+        try:
+            return run_exclude(statement, literals)
+        except ValueError:
+            raise
         except Exception as e:
-            return f"Error processing exclude command: {e}"
+            raise ValueError(f"Error processing exclude command: {e}")
 
 
     # SELECT DATA
     elif action == "select":
-        if len(tokens) < 4 or "from" not in tokens:
-            return "Syntax error. Use: SELECT [ALL | col1, col2, ...] FROM table_name [WHERE ...] [GROUP BY col] [ORDER BY col [ASC|DESC]]"
-
-        from_index = tokens.index("from")
-        fields_part = " ".join(tokens[1:from_index])
-        table_name = tokens[from_index + 1]
-
-        if table_name not in current_db:
-            return f"Table '{table_name}' does not exist."
-
-        table_columns = current_db[table_name]["columns"]
-        table_data = current_db[table_name]["data"]
-        filtered_data = table_data
-
-        # WHERE clause
-        if "where" in tokens:
-            where_index = tokens.index("where")
-            if where_index + 3 >= len(tokens):
-                return "Syntax error. Use: SELECT ... FROM table_name WHERE column = value"
-
-            condition_column = tokens[where_index + 1]
-            condition_value = tokens[where_index + 3].strip("'\"")
-
-            if condition_column not in table_columns:
-                return f"Column '{condition_column}' does not exist in table '{table_name}'."
-
-            condition_index = table_columns.index(condition_column)
-            filtered_data = [
-                row for row in filtered_data if str(row[condition_index]) == condition_value
-            ]
-
-        # GROUP BY
-        group_by_column = None
-        if "group" in tokens and "by" in tokens:
-            group_index = tokens.index("group")
-            if tokens[group_index + 1].lower() == "by" and group_index + 2 < len(tokens):
-                group_by_column = tokens[group_index + 2]
-                if group_by_column not in table_columns:
-                    return f"Column '{group_by_column}' does not exist in table '{table_name}'."
-                group_by_index = table_columns.index(group_by_column)
-                grouped = {}
-                for row in filtered_data:
-                    key = row[group_by_index]
-                    grouped.setdefault(key, []).append(row)
-                filtered_data = [group[0] for group in grouped.values()]  # Show one row per group (simplified)
-            else:
-                return "Syntax error. Use: GROUP BY column"
-
-        # ORDER BY
-        order_by_column = None
-        order_direction = "asc"
-        if "order" in tokens and "by" in tokens:
-            order_index = tokens.index("order")
-            if tokens[order_index + 1].lower() == "by" and order_index + 2 < len(tokens):
-                order_by_column = tokens[order_index + 2]
-                if order_by_column not in table_columns:
-                    return f"Column '{order_by_column}' does not exist in table '{table_name}'."
-                if order_index + 3 < len(tokens) and tokens[order_index + 3].lower() in ["asc", "desc"]:
-                    order_direction = tokens[order_index + 3].lower()
-                order_by_index = table_columns.index(order_by_column)
-                filtered_data.sort(key=lambda row: row[order_by_index], reverse=(order_direction == "desc"))
-            else:
-                return "Syntax error. Use: ORDER BY column [ASC|DESC]"
-
-        # Fields to select
-        if fields_part.lower() == "all":
-            selected_columns = table_columns
-        else:
-            selected_columns = [col.strip() for col in fields_part.split(",")]
-            for col in selected_columns:
-                if col not in table_columns:
-                    return f"Column '{col}' does not exist in table '{table_name}'."
-
-        selected_indexes = [table_columns.index(col) for col in selected_columns]
-
-        # Column widths
-        col_widths = []
-        for i, col in enumerate(selected_columns):
-            max_width = max(len(str(row[selected_indexes[i]])) for row in filtered_data) if filtered_data else 0
-            col_widths.append(max(len(col), max_width))
-
-        # Build output table
-        def build_border():
-            return "+" + "+".join("-" * (w + 2) for w in col_widths) + "+"
-
-        def build_row(values):
-            return "|" + "|".join(f" {str(val).ljust(w)} " for val, w in zip(values, col_widths)) + "|"
-
-        output_lines = [build_border()]
-        output_lines.append(build_row(selected_columns))
-        output_lines.append(build_border())
-
-        for row in filtered_data:
-            output_lines.append(build_row([row[i] for i in selected_indexes]))
-
-        output_lines.append(build_border())
-        return "\n".join(output_lines) if filtered_data else "No records found."
-
-
+        result = execute(command)
+        return format_table(result.columns, result.fetchall())
 
     elif action == "update":
-        if "set" not in tokens or "where" not in tokens:
-            return "Syntax error. Usage: UPDATE table_name SET field_name = new_value WHERE condition;"
-
-        table_name = tokens[1]
-        set_index = tokens.index("set")
-        where_index = tokens.index("where")
-
-        # Extract the SET clause and WHERE clause
-        set_clause = " ".join(tokens[set_index + 1:where_index])
-        where_clause = " ".join(tokens[where_index + 1:])
-
-        if "=" not in set_clause or "=" not in where_clause:
-            return "Syntax error in SET or WHERE clause."
-
-        # Split the SET clause into field_name and new_value
-        field_name, new_value = set_clause.split("=")
-        field_name = field_name.strip()
-        new_value = new_value.strip().strip('"')
-
-        # Split the WHERE clause into condition_field and condition_value
-        condition_field, condition_value = where_clause.split("=")
-        condition_field = condition_field.strip()
-        condition_value = condition_value.strip().strip('"').strip("'")  # Strip both double and single quotes
-
-        if table_name in current_db:
-            table_info = current_db[table_name]
-            columns = table_info["columns"]
-            data = table_info["data"]
-
-            if field_name not in columns or condition_field not in columns:
-                return "Invalid column name."
-
-            field_index = columns.index(field_name)
-            condition_index = columns.index(condition_field)
-
-            modified_count = 0
-
-            # Loop through each row and update if condition matches
-            for row in data:
-                if str(row[condition_index]) == condition_value:
-                    # Convert the new value to the correct type
-                    if table_info["types"][field_name] == "INT":
-                        new_value = int(new_value)
-                    elif table_info["types"][field_name] == "FLOAT":
-                        new_value = float(new_value)
-                    
-                    # Update the field value
-                    row[field_index] = new_value
-                    modified_count += 1
-
-            if modified_count > 0:
-                save_db()
-                return f"{modified_count} record(s) updated in '{table_name}'."
-            else:
-                return "No records matched the condition."
-        else:
-            return f"Table '{table_name}' does not exist."
+        try:
+            statement, literals = query.parse(command)
+        except query.ParseError:
+            statement = None
+        if not isinstance(statement, query.Update):
+            raise ValueError("Syntax error. Usage: UPDATE table_name SET field_name = new_value WHERE condition;")
+        return run_update(statement, literals)
 
-        
     elif action == "show" and len(tokens) == 2 and tokens[1].lower() == "databases":
         databases = []
         for f in os.listdir():
@@ -423,6 +1525,7 @@ def process_command(command):
                         if f == "storage.json":
                             db_type = "NoSQL"
                         elif isinstance(db_content, dict):
+                            db_content.pop(wal.META_KEY, None)
                             if all(
                                 isinstance(table, dict) and 
                                 "columns" in table and 
@@ -440,70 +1543,79 @@ def process_command(command):
                     except json.JSONDecodeError:
                         databases.append(f"{db_name} (Corrupted)")
 
+            elif f.endswith(pagefile.EXTENSION):
+                db_name = f[:-len(pagefile.EXTENSION)]
+                try:
+                    paged = pagefile.PagedFile(f)
+                except (ValueError, OSError):
+                    databases.append(f"{db_name} (Corrupted)")
+                    continue
+                if all("columns" in table["meta"] and "types" in table["meta"] for table in paged.tables.values()):
+                    databases.append(f"{db_name} (SQL, binary)")
+                else:
+                    databases.append(f"{db_name} (Unknown, binary)")
+                paged.close()
+
         return "Databases: " + ", ".join(databases) if databases else "No databases found."
     
     elif action == "exit" and len(tokens) == 2:
         db_name = tokens[1]
 
         if current_db is None:
-            return "No database is currently in use."
+            raise ValueError("No database is currently in use.")
 
-        db_path = f"{db_name}.json"  # Direct JSON file name
+        db_path = pagefile.resolve(db_name)
         if not os.path.exists(db_path):
-            return f"Database '{db_name}' does not exist."
+            raise ValueError(f"Database '{db_name}' does not exist.")
 
         if current_db_file == db_path:
             save_db()  # Save changes before exiting
+            close_pagefile()
             current_db_file = None
             current_db = None
             return f"Exited from database '{db_name}'. You can now use another database."
         else:
-            return f"Database '{db_name}' is not currently in use."
+            raise ValueError(f"Database '{db_name}' is not currently in use.")
     
     
     elif action == "export":
-        try:
-            parts = command.split()
-            if len(parts) != 6 or parts[2].lower() != "as" or parts[4].lower() != "in":
-                return "Invalid export command format. Use: EXPORT database_name AS file_name IN [CSV/JSON]"
-
-            db_name, file_name, file_format = parts[1], parts[3], parts[5].upper()
-
-            if file_format not in ["CSV", "JSON"]:
-                return "Error: Unsupported file format. Use CSV or JSON."
-
-            downloads_folder = get_downloads_directory()
-            file_path = os.path.join(downloads_folder, f"{file_name}.{file_format.lower()}")
-
-            if file_format == "JSON":  
-                with open(file_path, "w", encoding="utf-8") as f:
-                    json.dump(current_db, f, indent=4)
-                return f"Database '{db_name}' successfully exported as JSON! File saved at: {file_path}"
-
-            elif file_format == "CSV":
-                if not isinstance(current_db, dict) or not current_db:
-                    return "Error: Database is empty or has an invalid structure for CSV export."
-
-                with open(file_path, "w", newline="", encoding="utf-8") as csv_file:
-                    writer = csv.writer(csv_file)
+        parts = command.split()
+        if len(parts) == 6 and parts[2].lower() == "as" and parts[4].lower() == "in":
+            return export_to_downloads(parts[1], parts[3], parts[5].upper())
 
-                    for table_name, table_info in current_db.items():
-                        if not isinstance(table_info, dict) or "columns" not in table_info or "data" not in table_info:
-                            continue  # Skip invalid tables
-
-                        writer.writerow([f"Table: {table_name}"])  # Table name
-                        writer.writerow(table_info["columns"])  # Column headers
-
-                        for record in table_info["data"]:
-                            writer.writerow(record)  # Write row data
-
-                        writer.writerow([])  # Blank line for separation
+        try:
+            target = exporter.parse_command(command)
+        except ValueError as e:
+            raise ValueError(f"Error: {e}")
+        if target is None:
+            raise ValueError("Invalid export command format. Use: EXPORT TABLE table_name | DATABASE | SELECT ... "
+                             "TO path [FORMAT CSV|JSONL] [COMPRESS GZIP], or EXPORT database_name AS file_name IN [CSV/JSON]")
+        kind, source, path, file_format, compress = target
 
-                return f"Database '{db_name}' successfully exported as CSV! File saved at: {file_path}"
+        if current_db is None:
+            raise ValueError("No database selected. Use 'USE database_name' first.")
 
-        except Exception as e:
-            return f"Error exporting database: {e}"
+        try:
+            if kind == "database":
+                os.makedirs(path, exist_ok=True)
+                count = 0
+                for table_name, table_info in current_db.items():
+                    table_file = exporter.table_path(path, table_name, file_format, compress)
+                    count += exporter.export_rows(table_file, file_format, table_info["columns"], table_info["data"], compress)
+                return f"{count} row(s) from {len(current_db)} table(s) exported to '{path}'."
+
+            if kind == "table":
+                if source not in current_db:
+                    raise ValueError(f"Table '{source}' does not exist.")
+                columns, rows = current_db[source]["columns"], current_db[source]["data"]
+            else:
+                columns, rows = select_rows(source)
+            count = exporter.export_rows(path, file_format, columns, rows, compress)
+            return f"{count} row(s) exported to '{path}'."
+        except OSError as e:
+            raise ValueError(f"Error exporting database: {e}")
 
+    raise ValueError(f"Unknown command '{tokens[0]}'.")
 
 if __name__ == "__main__":
     print("Welcome to the simple database. Type 'exit' to quit.")
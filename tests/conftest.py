@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sql
+import nosql
+
+
+def forget(engine):
+    """Drop every database an engine holds in memory without saving it, as a crash would."""
+    engine.park_db()
+    cache = engine._open_databases
+    for db_path in list(cache._entries):
+        engine.close_parked(cache.take(db_path))
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Run each test in an empty directory with no database open in either engine."""
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    for engine in (sql, nosql):
+        forget(engine)
+
+
+@pytest.fixture
+def sql_db():
+    """An empty JSON SQL database named "db", selected."""
+    assert sql.process_command("CREATE DATABASE db") == "Database 'db' created successfully."
+    sql.process_command("USE db")
+    return sql
+
+
+@pytest.fixture
+def nosql_db():
+    """An empty JSON NoSQL database named "db", selected."""
+    assert nosql.process_command("CREATE DATABASE db") == "Database 'db' created successfully."
+    nosql.process_command("USE db")
+    return nosql
@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pytest
+
+import sql
+import nosql
+import connection
+
+
+def in_thread(function, *args):
+    """Start function(*args) on a thread; returns the thread and a list that receives its result."""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function(*args)), daemon=True)
+    thread.start()
+    return thread, result
+
+
+@pytest.fixture
+def alice_and_bob():
+    sql.process_command("CREATE DATABASE db")
+    alice = connection.Connection(sql, "db")
+    bob = connection.Connection(sql, "db")
+    alice.process_command("MAKE t (id INT)")
+    return alice, bob
+
+
+def test_connections_keep_their_own_database():
+    sql.process_command("CREATE DATABASE one")
+    sql.process_command("CREATE DATABASE two")
+    first = connection.Connection(sql, "one")
+    second = connection.Connection(sql, "two")
+    first.process_command("MAKE a (id INT)")
+    second.process_command("MAKE b (id INT)")
+    assert first.process_command("SHOW TABLES") == "Tables: a"
+    assert second.process_command("SHOW TABLES") == "Tables: b"
+
+
+def test_transaction_is_isolated_from_other_connections(alice_and_bob):
+    alice, bob = alice_and_bob
+    alice.process_command("BEGIN")
+    alice.process_command("INCLUDE t (1)")
+
+    reader, read = in_thread(bob.execute_batch, [("SELECT ALL FROM t", ())])
+    writer, wrote = in_thread(bob.process_command, "INCLUDE t (2)")
+    time.sleep(0.2)
+    assert reader.is_alive() and writer.is_alive()  # Bob waits for Alice's transaction to end
+    assert alice.execute("SELECT ALL FROM t").fetchall() == [(1,)]
+
+    alice.process_command("ROLLBACK")
+    reader.join(5)
+    writer.join(5)
+    assert read[0][0]["rows"] in ([], [(2,)])  # Never Alice's uncommitted row
+    assert wrote == ["1 record(s) inserted into 't'."]
+    assert bob.execute("SELECT ALL FROM t").fetchall() == [(2,)]
+
+
+def test_nosql_transaction_is_isolated_from_other_connections():
+    nosql.process_command("CREATE DATABASE db")
+    alice = connection.Connection(nosql, "db")
+    bob = connection.Connection(nosql, "db")
+    alice.process_command("MAKE t")
+    alice.process_command("BEGIN")
+    alice.process_command("INCLUDE t [{v: 1}]")
+
+    writer, wrote = in_thread(bob.process_command, "INCLUDE t [{v: 2}]")
+    time.sleep(0.2)
+    assert writer.is_alive()
+    alice.process_command("ROLLBACK")
+    writer.join(5)
+    assert bob.execute("SELECT v FROM t").fetchall() == [{"v": 2}]
+
+
+def test_open_cursor_blocks_only_its_own_connections_writes(alice_and_bob):
+    alice, bob = alice_and_bob
+    alice.process_command("INCLUDE t (1), (2)")
+    result = alice.execute("SELECT ALL FROM t")
+    assert result.fetchone() == (1,)
+
+    with pytest.raises(ValueError, match="Close open cursors"):
+        alice.execute("INCLUDE t (3)")
+
+    # Bob's write on this same thread waits for the cursor instead of failing
+    threading.Timer(0.2, result.close).start()
+    assert bob.process_command("INCLUDE t (3)") == "1 record(s) inserted into 't'."
+    assert alice.execute("SELECT ALL FROM t").fetchall() == [(1,), (2,), (3,)]
+
+
+def test_transactional_batch_rolls_back_on_any_error(alice_and_bob):
+    alice, _ = alice_and_bob
+    results = alice.execute_batch([
+        ("INCLUDE t (1)", ()),
+        ("INCLUDE t ('oops')", ()),
+        ("INCLUDE t (2)", ()),
+    ], transaction=True)
+    assert results == [
+        {"message": "1 record(s) inserted into 't'."},
+        {"error": "Type mismatch for column 'id'. Expected INT."},
+    ]
+    assert alice.execute("SELECT ALL FROM t").fetchall() == []
+    assert not sql.in_transaction()
+
+
+def test_batch_without_transaction_keeps_going(alice_and_bob):
+    alice, _ = alice_and_bob
+    results = alice.execute_batch([
+        ("INCLUDE t (1)", ()),
+        ("INCLUDE nope (1)", ()),
+        ("SELECT ALL FROM t WHERE id = ?", (1,)),
+    ])
+    assert results == [
+        {"message": "1 record(s) inserted into 't'."},
+        {"error": "Table 'nope' does not exist."},
+        {"columns": ["id"], "rows": [(1,)]},
+    ]
+
+
+def test_transactional_batch_is_saved_with_one_log_append(alice_and_bob, monkeypatch):
+    alice, _ = alice_and_bob
+    saves = []
+    persist_changes = sql.persist_changes
+    monkeypatch.setattr(sql, "persist_changes", lambda changes: saves.append(changes) or persist_changes(changes))
+    monkeypatch.setattr(sql, "save_db", lambda: pytest.fail("The batch rewrote the whole database."))
+    alice.execute_batch([(f"INCLUDE t ({i})", ()) for i in range(5)], transaction=True)
+    assert len(saves) == 1 and len(saves[0]) == 5
+    assert len(alice.execute("SELECT ALL FROM t").fetchall()) == 5
@@ -0,0 +1,89 @@
+import pytest
+
+import nosql
+from conftest import forget
+
+
+def records(statement):
+    return nosql.execute(statement).fetchall()
+
+
+def test_group_by_aggregates_order_by_their_labels(nosql_db):
+    nosql.process_command("MAKE t")
+    nosql.process_command('INCLUDE t [{g: "a", n: 1}, {g: "b", n: 2}, {g: "b", n: 3}, {g: "c", n: 4}, {g: "c"}, {g: "c"}]')
+
+    assert records("SELECT COUNT(*), SUM(n) FROM t GROUP BY g ORDER BY COUNT(*) DESC") == [
+        {"group": "c", "count(*)": 3, "sum(n)": 4},
+        {"group": "b", "count(*)": 2, "sum(n)": 5},
+        {"group": "a", "count(*)": 1, "sum(n)": 1},
+    ]
+    assert [r["group"] for r in records("SELECT sum(n) FROM t GROUP BY g ORDER BY Sum(n) LIMIT 2")] == ["a", "c"]
+    assert [r["group"] for r in records("SELECT count(*) FROM t GROUP BY g ORDER BY group DESC")] == ["c", "b", "a"]
+    assert nosql.process_command("SELECT avg(n) FROM t") == '{\n    "avg(n)": 2.5\n}'
+
+    with pytest.raises(ValueError, match="ORDER BY field 'g'"):
+        records("SELECT count(*) FROM t GROUP BY g ORDER BY g")
+
+
+def test_csv_cells_become_numbers_only_when_plain():
+    parsed = [nosql.parse_csv_value(text) for text in ["7", "-3", "0", "1.5", "2e3", "007", "1_000", "nan", "inf", "1e999", "+5", ".5"]]
+    assert parsed == [7, -3, 0, 1.5, 2000.0, "007", "1_000", "nan", "inf", "1e999", "+5", ".5"]
+
+
+def test_import_csv(nosql_db):
+    nosql.process_command("MAKE t")
+    with open("in.csv", "w") as f:
+        f.write("code,n,x\n007,12,nan\n")
+    assert nosql.process_command("IMPORT in.csv INTO t") == "1 record(s) imported into 't'."
+    assert records("SELECT code, n, x FROM t") == [{"code": "007", "n": 12, "x": "nan"}]
+
+
+def test_count_and_vacuum_with_tombstones(nosql_db):
+    nosql.process_command("MAKE t")
+    nosql.process_command("INCLUDE t [" + ", ".join(f"{{v: {i}}}" for i in range(10)) + "]")
+    nosql.process_command("DELETE FROM t WHERE v < 4")
+    assert nosql.process_command("COUNT t") == "Table 't' contains 6 record(s)."
+
+    nosql.process_command("BEGIN")
+    nosql.process_command("DELETE FROM t WHERE v = 9")
+    assert nosql.process_command("COUNT t") == "Table 't' contains 5 record(s)."
+    nosql.process_command("ROLLBACK")
+    assert nosql.process_command("COUNT t") == "Table 't' contains 6 record(s)."
+
+    assert nosql.process_command("VACUUM t") == "Removed 4 deleted record(s) from 1 table(s)."
+    assert len(nosql.current_db["t"]) == 6
+    assert records("SELECT v FROM t WHERE id = 5") == [{"v": 4}]
+    assert nosql.process_command("COUNT t") == "Table 't' contains 6 record(s)."
+
+
+def test_ids_are_indexed_and_never_reused(nosql_db):
+    nosql.process_command("MAKE t")
+    nosql.process_command("INCLUDE t [{v: 1}, {v: 2}, {v: 3}]")
+    assert "id" in nosql.table_indexes("t")
+    assert records("SELECT v FROM t WHERE id = 2") == [{"v": 2}]
+
+    nosql.process_command("DELETE FROM t WHERE id = 3")
+    nosql.process_command("EXIT db")
+    forget(nosql)
+    nosql.process_command("USE db")
+    assert nosql.process_command("INCLUDE t [{v: 4}]") == "1 records included into 't' with IDs [4]."
+
+
+def test_rolled_back_drop_keeps_the_id_counter(nosql_db):
+    nosql.process_command("MAKE t")
+    nosql.process_command("INCLUDE t [{v: 1}]")
+    nosql.process_command("BEGIN")
+    nosql.process_command("EXCLUDE t")
+    nosql.process_command("ROLLBACK")
+    assert nosql.process_command("INCLUDE t [{v: 2}]") == "1 records included into 't' with IDs [2]."
+
+
+def test_ids_cannot_be_changed(nosql_db):
+    nosql.process_command("MAKE t")
+    nosql.process_command('INCLUDE t [{name: "a"}, {name: "c"}]')
+
+    assert nosql.process_command('UPDATE t SET id = 1 WHERE name = "c"') == "The 'id' field is the primary key and cannot be updated."
+    assert nosql.prepare("UPDATE t SET id = ? WHERE name = ?").execute([1, "c"]) == "The 'id' field is the primary key and cannot be updated."
+    assert nosql.process_command('DELETE id FROM t WHERE name = "c"').startswith("The 'id' field is the primary key")
+    assert records("SELECT name FROM t WHERE id = 1") == [{"name": "a"}]
+    assert records("SELECT name FROM t WHERE id = 2") == [{"name": "c"}]
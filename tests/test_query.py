@@ -0,0 +1,116 @@
+import pytest
+
+import query
+import sql
+import nosql
+
+
+def test_parse_lifts_literals_out_of_the_statement():
+    statement, literals = query.parse("SELECT a, COUNT(*) FROM t WHERE a >= 3 AND b = 'x;y' ORDER BY a DESC LIMIT 5 OFFSET 2")
+    assert statement.fields == ("a", query.Aggregate("COUNT", None))
+    assert statement.where == query.And((
+        query.Comparison("a", ">=", (query.Param(0),)),
+        query.Comparison("b", "=", (query.Param(1),)),
+    ))
+    assert (statement.order_by, statement.descending) == ("a", True)
+    assert literals == ["3", "x;y", "5", "2"]
+    assert query.bind_limit(statement, literals) == (2, 5)
+
+
+def test_statements_differing_only_in_literals_share_a_parse():
+    first, _ = query.parse("SELECT ALL FROM t WHERE a = 1")
+    second, literals = query.parse("SELECT ALL FROM t WHERE a = 2")
+    assert first is second
+    assert literals == ["2"]
+
+
+def test_syntax_errors_raise_parse_error():
+    with pytest.raises(query.ParseError):
+        query.parse("SELECT FROM WHERE")
+    with pytest.raises(query.ParseError):
+        query.parse("SELECT ALL FROM t WHERE a = ?")  # Parameters need parameters=True
+
+
+def test_bind_parameters():
+    statement, literals = query.parse("SELECT ALL FROM t WHERE a = ? AND b IN (?, 2) LIMIT ?", parameters=True)
+    bound = query.bind_parameters(literals, [1, "x", 3])
+    assert bound == [1, "x", "2", 3]
+    assert query.bind_limit(statement, bound) == (0, 3)
+    with pytest.raises(ValueError, match="Expected 3 parameter"):
+        query.bind_parameters(literals, [1])
+    with pytest.raises(ValueError, match="non-negative"):
+        query.bind_limit(statement, query.bind_parameters(literals, [1, "x", -1]))
+
+
+def test_split_script_ignores_semicolons_in_quotes():
+    script = "INCLUDE t (1, 'a;b'); SELECT ALL FROM t ;; "
+    assert query.split_script(script) == ["INCLUDE t (1, 'a;b')", "SELECT ALL FROM t"]
+
+
+def test_sql_prepared_statement(sql_db):
+    sql.process_command("MAKE t (id INT, name TEXT)")
+    sql.process_command("INCLUDE t (1, 'a'), (2, 'b'), (3, 'c')")
+
+    select = sql.prepare("SELECT name FROM t WHERE id >= ? ORDER BY id LIMIT ?")
+    assert select.cursor([2, 1]).fetchall() == [("b",)]
+    assert select.cursor([1, 5]).fetchall() == [("a",), ("b",), ("c",)]
+    assert select.execute([1]) == "Expected 2 parameter(s) but got 1."
+
+    update = sql.prepare("UPDATE t SET name = ? WHERE id = ?")
+    assert update.execute(["z", 3]) == "1 record(s) updated in 't'."
+    assert update.execute(["z", "x"]) == "Type mismatch for column 'id'. Expected INT."
+    assert sql.execute("SELECT name FROM t WHERE id = ?", ["3"]).fetchall() == [("z",)]
+
+    with pytest.raises(ValueError, match="does not exist"):
+        sql.prepare("SELECT ALL FROM t WHERE nope = ?")
+
+
+@pytest.mark.parametrize("statement, error", [
+    ("SELECT nope FROM t WHERE id = ?", "Column 'nope' does not exist"),
+    ("SELECT ALL FROM t WHERE id = ? OR nope = 1", "Column 'nope' does not exist"),
+    ("SELECT ALL FROM t WHERE NOT (id = ? AND nope = 1)", "Column 'nope' does not exist"),
+    ("SELECT MAX(nope) FROM t WHERE id = ?", "Column 'nope' does not exist"),
+    ("SELECT ALL FROM t WHERE id = ? ORDER BY nope", "Column 'nope' does not exist"),
+    ("UPDATE t SET nope = ? WHERE id = 1", "Column 'nope' does not exist"),
+    ("SELECT ALL FROM t WHERE id = 'x' AND name = ?", "Type mismatch for column 'id'"),
+    ("SELECT ALL FROM t JOIN o ON id = tid WHERE nope = ?", "does not exist in tables 't' and 'o'"),
+])
+def test_prepare_checks_every_column(sql_db, statement, error):
+    sql.process_command("MAKE t (id INT, name TEXT)")
+    sql.process_command("MAKE o (tid INT, total FLOAT)")
+    with pytest.raises(ValueError, match=error):
+        sql.prepare(statement)
+
+
+def test_prepared_join_resolves_qualified_columns(sql_db):
+    sql.process_command("MAKE a (id INT, name TEXT)")
+    sql.process_command("MAKE b (aid INT, x INT)")
+    sql.process_command("INCLUDE a (1, 'p'), (2, 'q')")
+    sql.process_command("INCLUDE b (1, 10), (2, 20), (2, 5)")
+
+    select = sql.prepare("SELECT name, x FROM a JOIN b ON id = aid WHERE b.x = ?")
+    assert select.cursor([20]).fetchall() == [("q", 20)]
+    assert select.cursor(["5"]).fetchall() == [("q", 5)]
+    assert select.execute(["z"]) == "Type mismatch for column 'b.x'. Expected INT."
+
+
+def test_prepared_statement_follows_a_remade_table(sql_db):
+    sql.process_command("MAKE t (id INT)")
+    select = sql.prepare("SELECT ALL FROM t WHERE id = ?")
+    sql.process_command("EXCLUDE t")
+    assert select.execute([1]) == "Table 't' does not exist."
+
+    sql.process_command("MAKE t (id TEXT)")
+    sql.process_command("INCLUDE t ('k')")
+    assert select.cursor(["k"]).fetchall() == [("k",)]
+
+
+def test_nosql_prepared_statement(nosql_db):
+    nosql.process_command("MAKE t")
+    nosql.process_command("INCLUDE t [{v: 1}, {v: 2}, {v: 3}]")
+
+    select = nosql.prepare("SELECT v FROM t WHERE v > ? ORDER BY v DESC")
+    assert select.cursor([1]).fetchall() == [{"v": 3}, {"v": 2}]
+    assert select.execute([1, 2]) == "Expected 1 parameter(s) but got 2."
+    assert nosql.prepare("UPDATE t SET v = ? WHERE v = ?").execute([10]) == "Expected 2 parameter(s) but got 1."
+    assert nosql.prepare("DELETE FROM t WHERE v = ?").execute([2]) == "1 record(s) deleted from 't'."
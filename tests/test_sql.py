@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+import sql
+
+
+def rows(statement):
+    return sql.execute(statement).fetchall()
+
+
+@pytest.fixture
+def indexed(sql_db):
+    """A table t(x, name) with an ordered index on x, its rows out of x order."""
+    sql.process_command("MAKE t (x INT, name TEXT)")
+    sql.process_command("INCLUDE t (5, 'e'), (9, 'i'), (1, 'a'), (3, 'c'), (7, 'g')")
+    sql.process_command("CREATE INDEX ON t(x)")
+    return sql
+
+
+@pytest.mark.parametrize("where, expected", [
+    ("", [1, 3, 5, 7, 9]),
+    ("WHERE x >= 3", [3, 5, 7, 9]),
+    ("WHERE x BETWEEN 2 AND 8", [3, 5, 7]),
+    ("WHERE x != 3", [1, 5, 7, 9]),
+    ("WHERE x IN (9, 1)", [1, 9]),
+    ("WHERE NOT x = 5", [1, 3, 7, 9]),
+    ("WHERE name LIKE '%' AND x < 6", [1, 3, 5]),
+    ("WHERE name IN ('i', 'a', 'g')", [1, 7, 9]),
+])
+def test_indexed_order_by(indexed, where, expected):
+    assert [x for x, in rows(f"SELECT x FROM t {where} ORDER BY x")] == expected
+    assert [x for x, in rows(f"SELECT x FROM t {where} ORDER BY x DESC")] == expected[::-1]
+    assert [x for x, in rows(f"SELECT x FROM t {where} ORDER BY x LIMIT 2 OFFSET 1")] == expected[1:3]
+
+
+def test_index_is_maintained_by_changes(indexed):
+    sql.process_command("UPDATE t SET x = 0 WHERE name = 'i'")
+    sql.process_command("EXCLUDE FROM t WHERE x = 5")
+    sql.process_command("INCLUDE t (4, 'd')")
+    assert rows("SELECT name FROM t WHERE x <= 4 ORDER BY x") == [("i",), ("a",), ("c",), ("d",)]
+
+
+def test_join(sql_db):
+    sql.process_command("MAKE users (id INT, name TEXT)")
+    sql.process_command("MAKE orders (user_id INT, total FLOAT)")
+    sql.process_command("INCLUDE users (1, 'ann'), (2, 'bob')")
+    sql.process_command("INCLUDE orders (2, 5.0), (1, 7.5), (2, 1.0)")
+    assert rows("SELECT name, total FROM users JOIN orders ON id = user_id WHERE total > 2 ORDER BY total") == [
+        ("bob", 5.0), ("ann", 7.5),
+    ]
+
+
+def test_failed_commands_raise_from_execute(sql_db):
+    sql.process_command("MAKE t (id INT)")
+    with pytest.raises(ValueError, match="Type mismatch"):
+        sql.execute("INCLUDE t ('oops')")
+    with pytest.raises(ValueError, match="Unknown command"):
+        sql.execute("FROBNICATE t")
+    assert sql.process_command("INCLUDE nope (1)") == "Table 'nope' does not exist."
+
+
+def write_jsonl(path, records):
+    with open(path, "w") as f:
+        f.writelines(json.dumps(record) + "\n" for record in records)
+
+
+def test_import_converts_strictly(sql_db):
+    sql.process_command("MAKE t (i INT, f FLOAT, s TEXT)")
+
+    write_jsonl("rows.jsonl", [{"i": 1, "f": 2, "s": "a"}, ["3", "4.5", "b"]])
+    assert sql.process_command("IMPORT rows.jsonl INTO t") == "2 record(s) imported into 't'."
+    assert rows("SELECT ALL FROM t") == [(1, 2.0, "a"), (3, 4.5, "b")]
+
+    for record in ({"i": 1.9, "f": 1, "s": "x"}, {"i": 1, "f": 1, "s": None}, {"i": True, "f": 1, "s": "x"}):
+        write_jsonl("bad.jsonl", [{"i": 7, "f": 7, "s": "ok"}, record])
+        assert sql.process_command("IMPORT bad.jsonl INTO t").startswith("Import failed, no rows were imported: Type mismatch")
+
+    with open("bad.csv", "w") as f:
+        f.write("i,f,s\n1_000,nan,x\n")
+    assert "Type mismatch for column 'i' on line 2" in sql.process_command("IMPORT bad.csv INTO t")
+    assert len(rows("SELECT ALL FROM t")) == 2
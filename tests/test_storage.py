@@ -0,0 +1,104 @@
+import os
+
+import pytest
+
+import sql
+import nosql
+import pagefile
+import columnar
+from conftest import forget
+
+
+def rows(statement):
+    return sql.execute(statement).fetchall()
+
+
+def reopen(engine, db_name="db"):
+    """Save and close the current database, forget it, and load it again from its file."""
+    engine.process_command(f"EXIT {db_name}")
+    forget(engine)
+    engine.process_command(f"USE {db_name}")
+
+
+def test_columnar_table_reopens(sql_db):
+    sql.process_command("MAKE m (id INT, score FLOAT, tag TEXT) ENGINE COLUMNAR")
+    sql.process_command("INCLUDE m (1, 1.5, 'a'), (2, 2.5, 'b'), (3, 3.5, 'a')")
+    sql.process_command("UPDATE m SET score = 10.0 WHERE id = 2")
+    reopen(sql)
+
+    assert isinstance(sql.current_db["m"]["data"], columnar.ColumnStore)
+    assert rows("SELECT ALL FROM m WHERE tag = 'a' OR score > 5") == [(1, 1.5, "a"), (2, 10.0, "b"), (3, 3.5, "a")]
+    assert rows("SELECT SUM(score), MAX(id) FROM m") == [(15.0, 3)]
+    assert rows("SELECT tag, COUNT(*) FROM m GROUP BY tag ORDER BY tag") == [("a", 2), ("b", 1)]
+
+
+@pytest.mark.parametrize("statement", [f"INCLUDE c (3, {2 ** 70})", f"UPDATE c SET v = {2 ** 70} WHERE id = 1"])
+def test_columnar_overflow_leaves_the_index_intact(sql_db, statement):
+    sql.process_command("MAKE c (id INT, v INT) ENGINE COLUMNAR")
+    sql.process_command("INCLUDE c (1, 5), (2, 1)")
+    sql.process_command("CREATE INDEX ON c(v)")
+
+    assert sql.process_command(statement).startswith("Value out of range")
+    assert rows("SELECT ALL FROM c WHERE v > 0 ORDER BY v") == [(2, 1), (1, 5)]
+    assert rows("SELECT id FROM c WHERE v <= 5 ORDER BY v DESC") == [(1,), (2,)]
+
+
+def test_sql_binary_database_reopens():
+    sql.process_command("CREATE DATABASE db FORMAT BINARY")
+    assert os.path.exists(f"db{pagefile.EXTENSION}")
+    sql.process_command("USE db")
+    sql.process_command("MAKE t (id INT, name TEXT)")
+    sql.process_command("INCLUDE t (3, 'c'), (1, 'a'), (2, 'b')")
+    sql.process_command("CREATE INDEX ON t(id)")
+    reopen(sql)
+
+    assert isinstance(sql.current_db["t"]["data"], pagefile.PagedRows)  # Decoded lazily
+    assert rows("SELECT name FROM t ORDER BY id") == [("a",), ("b",), ("c",)]
+    assert rows("SELECT ALL FROM t WHERE id >= 2 ORDER BY id DESC") == [(3, "c"), (2, "b")]
+
+    sql.process_command("UPDATE t SET name = 'x' WHERE id = 1")
+    reopen(sql)
+    assert rows("SELECT name FROM t WHERE id = 1") == [("x",)]
+
+
+def test_paged_rows_take_decodes_each_page_once(monkeypatch):
+    monkeypatch.setattr(pagefile, "PAGE_ROWS", 10)
+    sql.process_command("CREATE DATABASE db FORMAT BINARY")
+    sql.process_command("USE db")
+    sql.process_command("MAKE t (id INT)")
+    sql.record_change({"op": "insert", "table": "t", "rows": [[i] for i in range(5000)]})
+    reopen(sql)
+
+    paged = sql.current_db["t"]["data"]
+    decoded = []
+    read_page = pagefile.PagedFile.read_page
+    monkeypatch.setattr(pagefile.PagedFile, "read_page", lambda self, *page: decoded.append(page) or read_page(self, *page))
+    positions = list(range(4999, -1, -7))
+    assert paged.take(positions) == [[i] for i in positions]
+    assert len(decoded) == len(set(decoded)) == len(paged.pages)
+
+
+def test_nosql_binary_database_reopens():
+    nosql.process_command("CREATE DATABASE db FORMAT BINARY")
+    nosql.process_command("USE db")
+    nosql.process_command("MAKE t")
+    nosql.process_command("INCLUDE t [{v: 1}, {v: 2}, {v: 3}]")
+    nosql.process_command("DELETE FROM t WHERE v = 2")
+    reopen(nosql)
+
+    assert nosql.execute("SELECT ALL FROM t").fetchall() == [{"v": 1, "id": 1}, {"v": 3, "id": 3}]
+    assert nosql.process_command("COUNT t") == "Table 't' contains 2 record(s)."
+    assert nosql.process_command("INCLUDE t [{v: 4}]") == "1 records included into 't' with IDs [4]."
+
+
+@pytest.mark.parametrize("engine", [sql, nosql])
+@pytest.mark.parametrize("command", ["CREATE DATABASE ../cfg", "USE ../cfg", "REMOVE ../cfg", "USE /tmp/cfg", "USE cfg.json"])
+def test_database_names_cannot_reach_other_files(workdir, monkeypatch, engine, command):
+    (workdir / "inner").mkdir()
+    (workdir / "cfg.json").write_text('{"hosts": []}')
+    monkeypatch.chdir(workdir / "inner")
+
+    assert engine.process_command(command).startswith("Invalid database name")
+    assert (workdir / "cfg.json").read_text() == '{"hosts": []}'
+    assert sorted(os.listdir(workdir)) == ["cfg.json", "inner"]
+    assert os.listdir(workdir / "inner") == []
@@ -0,0 +1,72 @@
+import json
+
+import sql
+import nosql
+import wal
+from conftest import forget
+
+
+def rows(statement):
+    return sql.execute(statement).fetchall()
+
+
+def test_sql_changes_are_replayed_after_a_crash(sql_db):
+    sql.process_command("MAKE t (id INT, name TEXT)")
+    sql.process_command("INCLUDE t (1, 'a'), (2, 'b'), (3, 'c')")
+    sql.process_command("UPDATE t SET name = 'z' WHERE id = 2")
+    sql.process_command("EXCLUDE FROM t WHERE id = 3")
+
+    with open("db.json") as f:
+        assert "t" not in json.load(f)  # Nothing checkpointed yet: the changes only exist in the log
+    forget(sql)
+
+    sql.process_command("USE db")
+    assert rows("SELECT ALL FROM t") == [(1, "a"), (2, "z")]
+
+
+def test_torn_log_tail_is_ignored(sql_db):
+    sql.process_command("MAKE t (id INT)")
+    sql.process_command("INCLUDE t (1)")
+    forget(sql)
+    with open(wal.wal_path("db.json"), "a") as f:
+        f.write('{"lsn": 3, "changes": [{"op": "ins')
+
+    sql.process_command("USE db")
+    assert rows("SELECT ALL FROM t") == [(1,)]
+
+
+def test_checkpoint_folds_the_log_into_the_snapshot(sql_db, monkeypatch):
+    monkeypatch.setattr(wal, "CHECKPOINT_BYTES", 1)
+    for statement in ["MAKE t (id INT)", "INCLUDE t (1), (2)"]:
+        sql.process_command(statement)
+        wal.wait("db.json")  # A checkpoint is skipped while the previous one is still writing
+    forget(sql)
+
+    with open("db.json") as f:
+        snapshot = json.load(f)
+    assert snapshot["t"]["data"] == [[1], [2]]
+    sql.process_command("USE db")
+    assert rows("SELECT ALL FROM t") == [(1,), (2,)]
+
+
+def test_rolled_back_transaction_is_not_logged(sql_db):
+    sql.process_command("MAKE t (id INT)")
+    sql.process_command("BEGIN")
+    sql.process_command("INCLUDE t (1)")
+    sql.process_command("ROLLBACK")
+    forget(sql)
+
+    sql.process_command("USE db")
+    assert rows("SELECT ALL FROM t") == []
+
+
+def test_nosql_replay_keeps_ids_and_tombstones(nosql_db):
+    nosql.process_command("MAKE t")
+    nosql.process_command("INCLUDE t [{v: 1}, {v: 2}, {v: 3}]")
+    nosql.process_command("DELETE FROM t WHERE v = 3")
+    forget(nosql)
+
+    nosql.process_command("USE db")
+    assert nosql.process_command("COUNT t") == "Table 't' contains 2 record(s)."
+    # The id of the deleted last record is not handed out again
+    assert nosql.process_command("INCLUDE t [{v: 4}]") == "1 records included into 't' with IDs [4]."
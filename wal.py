@@ -0,0 +1,115 @@
+import os
+import json
+import threading
+
+
+# Reserved top-level key in a snapshot file holding engine metadata (e.g. the WAL position).
+META_KEY = "__meta__"
+
+# Fold the log back into the snapshot once it grows past this many bytes.
+CHECKPOINT_BYTES = 4 * 1024 * 1024
+
+# Set to True to fsync the log after every appended change.
+FSYNC = False
+
+_checkpoints = {}  # db_path -> running checkpoint thread
+
+
+def wal_path(db_path):
+    """Return the path of the write-ahead log belonging to a database file."""
+    return os.path.splitext(db_path)[0] + ".wal"
+
+
+def append(db_path, lsn, changes):
+    """Append a batch of changes to the database log and return the new log size in bytes.
+
+    The batch is written as a single line, so replay applies all of it or none.
+    """
+    with open(wal_path(db_path), "a") as f:
+        f.write(json.dumps({"lsn": lsn, "changes": changes}, separators=(",", ":")) + "\n")
+        f.flush()
+        if FSYNC:
+            os.fsync(f.fileno())
+        return f.tell()
+
+
+def replay(db_path, after_lsn=0):
+    """Yield (lsn, change) for every logged change newer than the snapshot position."""
+    log_path = wal_path(db_path)
+    for path in (log_path + ".old", log_path):
+        if not os.path.exists(path):
+            continue
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # Torn write at the tail of the log
+                if entry["lsn"] > after_lsn:
+                    for change in entry["changes"]:
+                        yield entry["lsn"], change
+
+
+def has_pending(db_path):
+    """Return True if a previous run left an unfinished checkpoint behind."""
+    return os.path.exists(wal_path(db_path) + ".old")
+
+
+def checkpoint(db_path, snapshot, meta, background=True, default=None):
+    """Fold the log into a compacted snapshot of the database.
+
+    ``meta`` is stored under META_KEY and must hold the "lsn" of the last
+    change included in the snapshot; ``default`` is passed on to json.dumps.
+    The snapshot is serialized right away, so the caller may keep mutating
+    it; only the file writes happen on the background thread.
+    """
+    running = _checkpoints.get(db_path)
+    if running is not None and running.is_alive():
+        if not background:
+            running.join()
+        else:
+            return
+
+    log_path = wal_path(db_path)
+    text = json.dumps({**snapshot, META_KEY: meta}, separators=(",", ":"), default=default)
+
+    if os.path.exists(log_path) and not os.path.exists(log_path + ".old"):
+        os.replace(log_path, log_path + ".old")
+
+    if background:
+        thread = threading.Thread(target=_write_snapshot, args=(db_path, text), daemon=True)
+        _checkpoints[db_path] = thread
+        thread.start()
+    else:
+        _write_snapshot(db_path, text)
+        if os.path.exists(log_path):
+            os.remove(log_path)
+
+
+def wait(db_path):
+    """Block until a running background checkpoint of the database has finished."""
+    running = _checkpoints.get(db_path)
+    if running is not None:
+        running.join()
+
+
+def remove(db_path):
+    """Delete the log files belonging to a database."""
+    wait(db_path)
+    log_path = wal_path(db_path)
+    for path in (log_path, log_path + ".old"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _write_snapshot(db_path, text):
+    tmp_path = db_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, db_path)
+
+    old_log = wal_path(db_path) + ".old"
+    if os.path.exists(old_log):
+        os.remove(old_log)
@@ -1,19 +1,29 @@
 import threading
 import time
 import os
+import json
+import asyncio
+import importlib
+from concurrent.futures import ThreadPoolExecutor
 import  jwt
+from collections import OrderedDict, namedtuple
 from fastapi import FastAPI, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy import create_engine, Column, Integer, String
+from sqlalchemy import create_engine, event, Column, Integer, String
 from sqlalchemy.orm import declarative_base, sessionmaker, Session
+from sqlalchemy.pool import QueuePool
 import bcrypt
 from pydantic import BaseModel
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
 import requests
 import uvicorn
 import webbrowser
 
+import connection
+import query
+
 # ---------------------- FastAPI Setup ----------------------
 app = FastAPI()
 
@@ -24,14 +34,82 @@ if not os.path.exists("static"):
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# bcrypt is slow on purpose; it and the user-table queries run on their own pool so logins never stall the event loop
+AUTH_WORKERS = 4
+auth_executor = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="xdb-auth")
+
 # Database Setup
 DATABASE_URL = "sqlite:///./users.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+BUSY_TIMEOUT_SECONDS = 30  # How long a connection waits for another one's write lock on users.db
+# One pooled connection per auth worker, plus headroom for the request-scoped sessions. SQLAlchemy
+# before 2.0 gives file SQLite a NullPool, which takes no pool_size, so the pool class is explicit.
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": BUSY_TIMEOUT_SECONDS},  # sqlite3 sets the busy timeout from it
+    poolclass=QueuePool,
+    pool_size=AUTH_WORKERS,
+    max_overflow=AUTH_WORKERS,
+    pool_pre_ping=True,
+)
+
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers proceed while a registration writes; NORMAL sync is safe in WAL mode
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-8000")  # 8 MB
+    cursor.close()
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 Base = declarative_base()
 
 SECRET_KEY = "supersecretkey"
 ALGORITHM = "HS256"
+TOKEN_LIFETIME = timedelta(hours=8)
+
+class TTLCache:
+    """A thread-safe LRU of at most ``size`` entries, each reusable until its own deadline."""
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()  # key -> (value, time.monotonic() deadline)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value, or None if it is missing or past its deadline."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() >= entry[1]:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, seconds):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+# Verified tokens are remembered for a while so hot endpoints skip jwt.decode
+TOKEN_CACHE_SIZE = 1024
+TOKEN_CACHE_SECONDS = 300
+_token_cache = TTLCache(TOKEN_CACHE_SIZE)
+
+# Users looked up at login, so repeated logins skip the query
+USER_CACHE_SIZE = 1024
+USER_CACHE_SECONDS = 60
+_user_cache = TTLCache(USER_CACHE_SIZE)
+UserRecord = namedtuple("UserRecord", "username password role")
 
 class User(Base):
     __tablename__ = "users"
@@ -53,6 +131,15 @@ class UserLogin(BaseModel):
 class TokenResponse(BaseModel):
     token: str
 
+class StatementRequest(BaseModel):
+    statement: str
+    params: list = []
+
+class BatchRequest(BaseModel):
+    statements: list[StatementRequest] = []
+    script: str = ""  # Statements separated by semicolons, run after ``statements``
+    transaction: bool = False
+
 def get_db():
     db = SessionLocal()
     try:
@@ -60,39 +147,192 @@ def get_db():
     finally:
         db.close()
 
+def hash_password(password):
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+
+def check_password(password, hashed_password):
+    return bcrypt.checkpw(password.encode(), hashed_password.encode())
+
+def find_user(db, username):
+    """Return the UserRecord of a username, or None; found users are cached for USER_CACHE_SECONDS."""
+    user = _user_cache.get(username)
+    if user is None:
+        row = db.query(User).filter(User.username == username).first()
+        if row is None:
+            return None
+        user = UserRecord(row.username, row.password, row.role)
+        _user_cache.put(username, user, USER_CACHE_SECONDS)
+    return user
+
+def add_user(db, username, hashed_password):
+    db.add(User(username=username, password=hashed_password))
+    db.commit()
+    _user_cache.discard(username)
+
 @app.post("/register", status_code=201)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(User).filter(User.username == user.username).first()
+async def register(user: UserCreate, db: Session = Depends(get_db)):
+    loop = asyncio.get_running_loop()
+    existing_user = await loop.run_in_executor(auth_executor, find_user, db, user.username)
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already exists")
-    hashed_password = bcrypt.hashpw(user.password.encode(), bcrypt.gensalt()).decode()
-    new_user = User(username=user.username, password=hashed_password)
-    db.add(new_user)
-    db.commit()
+    hashed_password = await loop.run_in_executor(auth_executor, hash_password, user.password)
+    await loop.run_in_executor(auth_executor, add_user, db, user.username, hashed_password)
     return {"message": "User registered successfully!"}
 
 @app.post("/login", response_model=TokenResponse)
-def login(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.username == user.username).first()
-    if db_user and bcrypt.checkpw(user.password.encode(), db_user.password.encode()):
-        token_data = {"username": db_user.username, "role": db_user.role}
+async def login(user: UserLogin, db: Session = Depends(get_db)):
+    loop = asyncio.get_running_loop()
+    db_user = await loop.run_in_executor(auth_executor, find_user, db, user.username)
+    if db_user and await loop.run_in_executor(auth_executor, check_password, user.password, db_user.password):
+        token_data = {"username": db_user.username, "role": db_user.role, "exp": datetime.now(timezone.utc) + TOKEN_LIFETIME}
         token = jwt.encode(token_data, SECRET_KEY, algorithm=ALGORITHM)
         return {"token": token}
     raise HTTPException(status_code=401, detail="Invalid username or password")
 
 auth_scheme = HTTPBearer()
 
-@app.get("/protected")
-def protected(authorization: HTTPAuthorizationCredentials = Depends(auth_scheme)):
-    token = authorization.credentials
+def verify_token(token):
+    """Return the claims of a token, from the cache when it was verified recently; raises jwt.InvalidTokenError.
+
+    A cached token is reused for at most TOKEN_CACHE_SECONDS and never past its own expiry.
+    """
+    claims = _token_cache.get(token)
+    if claims is None:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"require": ["exp"]})
+        _token_cache.put(token, claims, min(TOKEN_CACHE_SECONDS, claims["exp"] - time.time()))
+    return claims
+
+async def current_user(authorization: HTTPAuthorizationCredentials = Depends(auth_scheme)):
+    """Return the claims of the bearer token, or fail the request with 401."""
     try:
-        decoded_token = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return {"message": f"Welcome {decoded_token['username']}, your role is {decoded_token['role']}!"}
+        return verify_token(authorization.credentials)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+@app.get("/protected")
+def protected(user: dict = Depends(current_user)):
+    return {"message": f"Welcome {user['username']}, your role is {user['role']}!"}
+
+# ---------------------- Query API ----------------------
+
+# Engine work blocks, so it runs on these pools and keeps the event loop free; one pool per
+# engine, so requests waiting for one engine's lock never take the threads of the other
+QUERY_WORKERS = 8
+query_executors = {
+    engine_name: ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix=f"xdb-{engine_name}")
+    for engine_name in ("sql", "nosql")
+}
+# A streamed result holds a read lock that writers wait for, so one left unread is cut short after this
+STREAM_LOCK_SECONDS = 30
+
+# IMPORT and EXPORT read and write files on the server, so they are left to the console
+SERVER_FILE_ACTIONS = ["import", "export"]
+# An open transaction holds the engine's write lock; over HTTP it may only span one batch request
+TRANSACTION_ACTIONS = ["begin", "commit", "rollback"]
+# Creating and removing whole databases is reserved to this role
+ADMIN_ROLE = "admin"
+
+_connections = {}  # (username, engine name) -> connection.Connection
+_connections_lock = threading.Lock()
+
+def user_connection(username, engine_name):
+    """Return the connection of a user to an engine, so USE carries over between requests."""
+    with _connections_lock:
+        key = (username, engine_name)
+        if key not in _connections:
+            _connections[key] = connection.Connection(importlib.import_module(engine_name))
+        return _connections[key]
+
+async def stream_result(engine_name, result):
+    """Stream a cursor as JSON lines: a header with its columns and message, then one line per row.
+
+    Rows are fetched batch by batch on the engine's worker pool; the cursor
+    is closed (releasing its read lock) when the response ends or the client
+    goes away, and at the latest after STREAM_LOCK_SECONDS, even while the
+    client is not reading. A stream cut short that way ends with an "error" line.
+    """
+    loop = asyncio.get_running_loop()
+    fetching = asyncio.Lock()  # Keeps the cursor from being closed in the middle of a fetch
+    expired = False
+
+    async def expire():
+        nonlocal expired
+        async with fetching:
+            expired = True
+            result.close()
+
+    timer = loop.call_later(STREAM_LOCK_SECONDS, lambda: asyncio.ensure_future(expire()))
+    try:
+        yield json.dumps({"columns": result.columns, "message": result.message}) + "\n"
+        while True:
+            async with fetching:
+                cut_short = expired
+                if not cut_short:
+                    batch = await loop.run_in_executor(query_executors[engine_name], result.fetchmany)
+            if cut_short:
+                yield json.dumps({"error": f"The result was not read within {STREAM_LOCK_SECONDS} seconds. Fetch it in parts with LIMIT and OFFSET."}) + "\n"
+                break
+            if batch:
+                yield "".join(json.dumps(row, default=str) + "\n" for row in batch)
+            if len(batch) < result.arraysize:
+                break
+    finally:
+        timer.cancel()
+        result.close()
+
+def check_statement(statement, user):
+    """Fail the request with 403 if the user may not run a statement over HTTP."""
+    tokens = statement.strip().lower().split()
+    action = tokens[0].rstrip(";") if tokens else ""
+    if action in SERVER_FILE_ACTIONS:
+        raise HTTPException(status_code=403, detail=f"{action.upper()} works on server files and is only available from the console.")
+    if action in TRANSACTION_ACTIONS:
+        raise HTTPException(status_code=400, detail='Run transactions as one batch request with "transaction": true.')
+    if (action == "remove" or tokens[:2] == ["create", "database"]) and user.get("role") != ADMIN_ROLE:
+        raise HTTPException(status_code=403, detail="Only administrators can create or remove databases.")
+
+async def run_statement(engine_name, request, user):
+    check_statement(request.statement, user)
+    conn = user_connection(user["username"], engine_name)
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(query_executors[engine_name], conn.execute, request.statement, request.params)
+    except Exception as e:
+        # Engine errors come from the statement, not the server
+        raise HTTPException(status_code=400, detail=str(e) or type(e).__name__)
+    return StreamingResponse(stream_result(engine_name, result), media_type="application/x-ndjson")
+
+async def run_batch(engine_name, request, user):
+    statements = [(item.statement, item.params) for item in request.statements]
+    statements += [(statement, ()) for statement in query.split_script(request.script)]
+    for statement, _ in statements:
+        check_statement(statement, user)
+    conn = user_connection(user["username"], engine_name)
+    loop = asyncio.get_running_loop()
+    try:
+        results = await loop.run_in_executor(query_executors[engine_name], conn.execute_batch, statements, request.transaction)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e) or type(e).__name__)
+    return {"results": results}
+
+@app.post("/sql")
+async def sql_statement(request: StatementRequest, user: dict = Depends(current_user)):
+    return await run_statement("sql", request, user)
+
+@app.post("/nosql")
+async def nosql_statement(request: StatementRequest, user: dict = Depends(current_user)):
+    return await run_statement("nosql", request, user)
+
+@app.post("/sql/batch")
+async def sql_batch(request: BatchRequest, user: dict = Depends(current_user)):
+    return await run_batch("sql", request, user)
+
+@app.post("/nosql/batch")
+async def nosql_batch(request: BatchRequest, user: dict = Depends(current_user)):
+    return await run_batch("nosql", request, user)
+
 # ---------------------- Console Auth and Flow ----------------------
 
 AUTH_SERVER = "http://127.0.0.1:8000"
@@ -160,11 +400,11 @@ def run_console_program():
     if choice == "1":
         print("You selected SQL database.")
         import sql
-        process_command = sql.process_command
+        process_command = connection.Connection(sql).process_command
     elif choice == "2":
         print("You selected NoSQL database.")
         import nosql
-        process_command = nosql.process_command
+        process_command = connection.Connection(nosql).process_command
     else:
         print("Invalid choice. Exiting.")
         return